@@ -0,0 +1,431 @@
+import abc
+import copy
+import json
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+# Nearest-neighbour indexes over float32 embedding matrices. Scores are dot products, i.e.
+# cosine similarities for unit-normalized embeddings, as in `utils.get_cosine_scores`.
+
+EMBEDDING_INDEX_KINDS = ("exact", "ivf_flat")
+
+
+def _top_n(scores: np.ndarray, top_n: int) -> np.ndarray:
+    # Positions of the `top_n` highest scores, sorted by descending score
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _top_n_rows(scores: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Per row of a (queries, rows) score matrix: the `top_n` highest positions and scores
+    top_n = min(top_n, scores.shape[1])
+    if top_n <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=scores.dtype)
+    candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+class EmbeddingIndex(abc.ABC):
+    """
+    Base class of the nearest-neighbour indexes.
+
+    Rows are identified by their position in the indexed matrix: the first row added gets
+    id 0 and every `add` continues the numbering, matching an append-only store.
+    """
+
+    kind = ""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def add(self, embeddings: np.ndarray) -> None:
+        """Appends rows to the index."""
+
+    @abc.abstractmethod
+    def search(
+        self, query_vector: Union[list, np.ndarray], top_n: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rows with the highest scores against a query embedding.
+
+        Returns:
+            A tuple of the row ids and their scores, sorted by descending score.
+        """
+
+    def search_batch(
+        self, query_vectors: np.ndarray, top_n: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Runs `search` for every row of a (queries, dimension) matrix.
+
+        Returns:
+            One (row ids, scores) tuple per query.
+        """
+        return [self.search(query_vector, top_n) for query_vector in query_vectors]
+
+    @abc.abstractmethod
+    def copy(self) -> "EmbeddingIndex":
+        """
+        Returns a copy that can be extended with `add` without changing this index, so
+        searches running on it stay consistent. Row data is shared, not copied.
+        """
+
+    @abc.abstractmethod
+    def save(self, path: str) -> None:
+        """Saves the index to a .npz file."""
+
+    @abc.abstractmethod
+    def _arrays(self) -> List[np.ndarray]:
+        ...
+
+    def memory_usage(self) -> Dict[str, Union[str, int]]:
+        """
+        Returns the memory held by the index.
+
+        Returns:
+            A dictionary with the index kind and the total bytes of its arrays.
+        """
+        return {"kind": self.kind, "bytes": int(sum(array.nbytes for array in self._arrays()))}
+
+
+class ExactIndex(EmbeddingIndex):
+    """
+    Brute-force index scoring every row. Exact, and the fallback for small corpora.
+    """
+
+    kind = "exact"
+
+    def __init__(self, embeddings: Optional[np.ndarray] = None):
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        if embeddings is not None:
+            self.add(embeddings)
+
+    def __len__(self) -> int:
+        return len(self._embeddings)
+
+    def add(self, embeddings: np.ndarray) -> None:
+        if len(embeddings) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self._embeddings = (
+            np.concatenate([self._embeddings, embeddings]) if len(self) else embeddings.copy()
+        )
+
+    def search(
+        self, query_vector: Union[list, np.ndarray], top_n: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self._embeddings @ np.asarray(query_vector, dtype=np.float32)
+        top_n_indices = _top_n(scores, top_n)
+        return top_n_indices, scores[top_n_indices]
+
+    def search_batch(
+        self, query_vectors: np.ndarray, top_n: int, query_block_size: int = 64
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Scores blocks of queries with one matrix-matrix product each, which reads the
+        embeddings once per block instead of once per query.
+
+        Args:
+            query_vectors: The (queries, dimension) query embeddings.
+            top_n: The number of rows to return per query.
+            query_block_size: Queries scored together; bounds the (block, rows) score matrix.
+
+        Returns:
+            One (row ids, scores) tuple per query, sorted by descending score.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        results: List[Tuple[np.ndarray, np.ndarray]] = []
+        for start in range(0, len(query_vectors), query_block_size):
+            scores = query_vectors[start : start + query_block_size] @ self._embeddings.T
+            results.extend(zip(*_top_n_rows(scores, top_n)))
+        return results
+
+    def copy(self) -> "ExactIndex":
+        return copy.copy(self)
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, embeddings=self._embeddings)
+
+    def _arrays(self) -> List[np.ndarray]:
+        return [self._embeddings]
+
+    @classmethod
+    def _from_npz(cls, data) -> "ExactIndex":
+        return cls(data["embeddings"])
+
+
+class IVFFlatIndex(EmbeddingIndex):
+    """
+    Inverted-file index: rows are partitioned into `nlist` clusters by spherical k-means and a
+    query only scores the rows of the `nprobe` clusters whose centroids score highest.
+
+    Raising `nprobe` trades latency for recall (nprobe = nlist is exact). Each cluster keeps
+    its rows contiguously, so a probe is a single matrix-vector product. Below
+    `min_train_size` rows the index is not trained and searches every row exactly.
+    """
+
+    kind = "ivf_flat"
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        min_train_size: int = 10_000,
+        train_iterations: int = 10,
+        train_sample_per_list: int = 32,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            nlist: Number of clusters. Defaults to sqrt(rows) when the index is trained.
+            nprobe: Default number of clusters scored per query.
+            min_train_size: Rows needed before clustering; smaller indexes search exactly.
+            train_iterations: k-means iterations.
+            train_sample_per_list: Rows sampled per cluster to train k-means.
+            seed: Seed of the training sample and initial centroids.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_iterations = train_iterations
+        self.train_sample_per_list = train_sample_per_list
+        self.seed = seed
+
+        self._centroids: Optional[np.ndarray] = None
+        self._list_ids: List[np.ndarray] = []
+        self._list_vectors: List[np.ndarray] = []
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def num_lists(self) -> int:
+        return len(self._list_ids)
+
+    def _assign(self, embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # Nearest centroid of every row, in blocks to bound the (rows, nlist) score matrix
+        assignments = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), 8192):
+            block = embeddings[start : start + 8192]
+            assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _train(self, embeddings: np.ndarray) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or max(1, int(np.sqrt(len(embeddings))))
+        nlist = min(nlist, len(embeddings))
+
+        sample_size = min(len(embeddings), nlist * self.train_sample_per_list)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+
+            # Reseed empty clusters with random sample rows
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms > 0, norms, 1.0)
+
+        return centroids.astype(np.float32)
+
+    def _rebuild(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        self._centroids = self._train(embeddings)
+        assignments = self._assign(embeddings, self._centroids)
+
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+        self._list_ids = [ids[order[a:b]] for a, b in zip(offsets[:-1], offsets[1:])]
+        self._list_vectors = [embeddings[order[a:b]] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def build(self, embeddings: np.ndarray) -> "IVFFlatIndex":
+        """
+        (Re)builds the index from scratch over `embeddings`.
+
+        Returns:
+            The index itself.
+        """
+        self._centroids = None
+        self._list_ids, self._list_vectors = [], []
+        self._count = 0
+        self.add(embeddings)
+        return self
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """
+        Appends rows, assigning them to the nearest trained cluster. Trains the index once
+        it holds `min_train_size` rows.
+        """
+        if len(embeddings) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        ids = np.arange(self._count, self._count + len(embeddings), dtype=np.int64)
+        self._count += len(embeddings)
+
+        if not self.is_trained:
+            # Untrained: one list holding every row, searched exactly
+            if self._list_ids:
+                ids = np.concatenate([self._list_ids[0], ids])
+                embeddings = np.concatenate([self._list_vectors[0], embeddings])
+            if self._count >= self.min_train_size:
+                self._rebuild(ids, embeddings)
+            else:
+                self._list_ids, self._list_vectors = [ids], [embeddings]
+            return
+
+        # Replace (rather than modify) the arrays of the affected lists, see `copy`
+        assignments = self._assign(embeddings, self._centroids)
+        for list_no in np.unique(assignments).tolist():
+            members = assignments == list_no
+            self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], ids[members]])
+            self._list_vectors[list_no] = np.concatenate(
+                [self._list_vectors[list_no], embeddings[members]]
+            )
+
+    def search(
+        self,
+        query_vector: Union[list, np.ndarray],
+        top_n: int,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rows with the highest scores among the `nprobe` closest clusters.
+
+        Args:
+            query_vector: The query embedding.
+            top_n: The number of rows to return.
+            nprobe: Clusters to score. Defaults to the index's `nprobe`.
+
+        Returns:
+            A tuple of the row ids and their scores, sorted by descending score.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        if not self._list_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.is_trained:
+            probes = _top_n(self._centroids @ query, nprobe or self.nprobe).tolist()
+        else:
+            probes = [0]
+
+        ids = np.concatenate([self._list_ids[list_no] for list_no in probes])
+        scores = np.concatenate([self._list_vectors[list_no] @ query for list_no in probes])
+
+        top_n_positions = _top_n(scores, top_n)
+        return ids[top_n_positions], scores[top_n_positions]
+
+    def copy(self) -> "IVFFlatIndex":
+        index = copy.copy(self)
+        index._list_ids = list(self._list_ids)
+        index._list_vectors = list(self._list_vectors)
+        return index
+
+    def save(self, path: str) -> None:
+        list_sizes = np.array([len(ids) for ids in self._list_ids], dtype=np.int64)
+        np.savez(
+            path,
+            kind=self.kind,
+            params=json.dumps(
+                {
+                    "nlist": self.nlist,
+                    "nprobe": self.nprobe,
+                    "min_train_size": self.min_train_size,
+                    "train_iterations": self.train_iterations,
+                    "train_sample_per_list": self.train_sample_per_list,
+                    "seed": self.seed,
+                    "count": self._count,
+                }
+            ),
+            centroids=self._centroids if self.is_trained else np.empty((0, 0), dtype=np.float32),
+            list_sizes=list_sizes,
+            ids=np.concatenate(self._list_ids) if self._list_ids else np.empty(0, dtype=np.int64),
+            vectors=np.concatenate(self._list_vectors)
+            if self._list_vectors
+            else np.empty((0, 0), dtype=np.float32),
+        )
+
+    def _arrays(self) -> List[np.ndarray]:
+        centroids = [self._centroids] if self.is_trained else []
+        return centroids + self._list_ids + self._list_vectors
+
+    @classmethod
+    def _from_npz(cls, data) -> "IVFFlatIndex":
+        params = json.loads(str(data["params"]))
+        count = params.pop("count")
+        index = cls(**params)
+        index._count = count
+        if data["centroids"].size:
+            index._centroids = data["centroids"]
+
+        offsets = np.concatenate([[0], np.cumsum(data["list_sizes"])])
+        ids, vectors = data["ids"], data["vectors"]
+        index._list_ids = [ids[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        index._list_vectors = [vectors[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        return index
+
+
+def create_embedding_index(
+    kind: str = "exact", embeddings: Optional[np.ndarray] = None, **params
+) -> EmbeddingIndex:
+    """
+    Creates a nearest-neighbour index.
+
+    Args:
+        kind: One of `EMBEDDING_INDEX_KINDS`.
+        embeddings: Optional rows to add right away.
+        **params: Parameters of the index class (e.g. nlist and nprobe for "ivf_flat").
+
+    Returns:
+        The index.
+
+    Raises:
+        ValueError: If `kind` is not supported.
+    """
+    if kind == "exact":
+        index: EmbeddingIndex = ExactIndex(**params)
+    elif kind == "ivf_flat":
+        index = IVFFlatIndex(**params)
+    else:
+        raise ValueError(f"Unsupported embedding index {kind!r}, expected one of {EMBEDDING_INDEX_KINDS}.")
+
+    if embeddings is not None:
+        index.add(embeddings)
+    return index
+
+
+def load_embedding_index(path: str) -> EmbeddingIndex:
+    """
+    Loads an index saved with `EmbeddingIndex.save`.
+
+    Args:
+        path: The .npz file.
+
+    Returns:
+        The index.
+    """
+    with np.load(path) as data:
+        kind = str(data["kind"])
+        if kind == "exact":
+            return ExactIndex._from_npz(data)
+        if kind == "ivf_flat":
+            return IVFFlatIndex._from_npz(data)
+    raise ValueError(f"Unsupported embedding index {kind!r} in {path}.")
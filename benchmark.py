@@ -0,0 +1,1161 @@
+"""
+Benchmarks for the LangChain servers.
+
+The Ollama LLM is replaced by a canned generator so the numbers measure the server
+itself rather than model inference.
+
+Usage:
+    python benchmark.py route_latency [--app rag|local_llm] [--requests 10000]
+    python benchmark.py concurrency [--app rag|local_llm] [--concurrency 16] [--generation-time 1.0]
+    python benchmark.py extraction [--files 8] [--pages 50] [--workers 1 2 4 8]
+    python benchmark.py pipeline [--files 8] [--pages 50] [--embedding-latency 0.2] [--embedding-workers 4]
+    python benchmark.py ingestion [--files 8] [--pages 50] [--queries 200]
+    python benchmark.py reingestion [--files 5000] [--pages 2] [--changed 50]
+    python benchmark.py uploads [--uploads 4] [--size-mb 200]
+    python benchmark.py lexical [--chunks 200000] [--words-per-chunk 80] [--queries 1000]
+    python benchmark.py chunking [--pages 2000] [--max-tokens 384] [--overlap-tokens 32]
+    python benchmark.py page_breaks [--pages 2000] [--lines-per-page 50] [--max-tokens 384] [--overlap-tokens 32]
+    python benchmark.py metadata_scaling [--documents 10 100 1000 10000] [--max-concat-documents 2000]
+    python benchmark.py metadata_memory [--pages 5000] [--chunks-per-page 4] [--dimension 768]
+    python benchmark.py quantization [--chunks 200000] [--dimension 768] [--queries 200] [--top-k 10]
+    python benchmark.py batch_retrieval [--chunks 200000] [--dimension 768] [--queries 1000] [--top-k 10]
+    python benchmark.py startup [--modules utils rag] [--repeats 5]
+    python benchmark.py ann [--chunks 200000] [--dimension 768] [--queries 200] [--top-k 10] [--nlist 0] [--nprobe 1 4 8 16 32]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import statistics
+import time
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+from unittest import mock
+
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
+from langchain_ollama.llms import OllamaLLM
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+@contextlib.contextmanager
+def fake_ollama(response: str = "A canned answer.", token_delay: float = 0.0) -> Iterator[None]:
+    """
+    Replaces OllamaLLM generation with a canned response, one word per token.
+
+    Args:
+        response: The generated text.
+        token_delay: Seconds slept per generated token, simulating inference time.
+    """
+    tokens = [token + " " for token in response.split()]
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+        time.sleep(token_delay * len(tokens))
+        return LLMResult(generations=[[Generation(text=response)] for _ in prompts])
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(token_delay * len(tokens))
+        return LLMResult(generations=[[Generation(text=response)] for _ in prompts])
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for token in tokens:
+            time.sleep(token_delay)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for token in tokens:
+            await asyncio.sleep(token_delay)
+            yield GenerationChunk(text=token)
+
+    with mock.patch.multiple(
+        OllamaLLM,
+        _generate=_generate,
+        _agenerate=_agenerate,
+        _stream=_stream,
+        _astream=_astream,
+    ):
+        yield
+
+
+def percentile(values: List[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else values[0]
+
+
+def benchmark_route_latency(app_name: str, num_requests: int, window: int = 1000) -> None:
+    """
+    Sends `num_requests` POSTs to /chain and reports latency per window of requests,
+    together with the number of registered routes before and after.
+    """
+    from fastapi.testclient import TestClient
+
+    server = importlib.import_module(app_name)
+    client = TestClient(server.app)
+    routes_before = len(server.app.routes)
+    form = {"question": "What is RAG?", "model": "gemma2", "answer_format": "One sentence"}
+
+    print(f"{'requests':>10} {'p50 ms':>8} {'p95 ms':>8} {'routes':>7}")
+    latencies: List[float] = []
+    with fake_ollama():
+        for i in range(1, num_requests + 1):
+            start = time.perf_counter()
+            response = client.post("/chain", data=form)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+
+            if i % window == 0:
+                print(
+                    f"{i:>10} {percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f} {len(server.app.routes):>7}"
+                )
+                latencies = []
+
+    print(f"routes before: {routes_before}, after: {len(server.app.routes)}")
+
+
+def benchmark_concurrency(app_name: str, concurrency: int, generation_time: float) -> None:
+    """
+    Fires `concurrency` simultaneous POSTs to /chain, each taking `generation_time` seconds
+    of simulated generation, plus a lightweight probe request while they run.
+
+    If handlers overlap, wall time stays close to one generation time; if they block the
+    event loop, it grows with `concurrency`.
+    """
+    import httpx
+
+    server = importlib.import_module(app_name)
+    form = {"question": "What is RAG?", "model": "gemma2", "answer_format": "One sentence"}
+    response_text = "A canned answer with ten tokens in it for the benchmark."
+    token_delay = generation_time / len(response_text.split())
+
+    async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> float:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        assert response.status_code < 400, response.text
+        return time.perf_counter() - start
+
+    async def run() -> None:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            start = time.perf_counter()
+            queries = [
+                asyncio.create_task(timed(client, "POST", "/chain", data=form))
+                for _ in range(concurrency)
+            ]
+            await asyncio.sleep(generation_time / 10)
+            probe = await timed(client, "GET", "/favicon.ico")
+            latencies = await asyncio.gather(*queries)
+            wall_time = time.perf_counter() - start
+
+        print(f"concurrent queries:      {concurrency}")
+        print(f"generation time (each):  {generation_time:.2f} s")
+        print(f"serial time would be:    {sum(latencies):.2f} s")
+        print(f"wall time:               {wall_time:.2f} s")
+        print(f"overlap factor:          {sum(latencies) / wall_time:.1f}x")
+        print(f"probe latency mid-load:  {probe * 1000:.1f} ms")
+
+    with fake_ollama(response_text, token_delay=token_delay):
+        asyncio.run(run())
+
+
+def make_benchmark_pdfs(folder: str, num_files: int, num_pages: int, words_per_page: int = 500) -> List[str]:
+    """
+    Writes synthetic text PDFs for the ingestion benchmarks.
+
+    Returns:
+        The paths of the written files.
+    """
+    import os
+    import random
+
+    import fitz
+
+    vocabulary = ["pump", "valve", "pressure", "assembly", "torque", "seal", "X-1042", "rotor", "the", "of", "and"]
+    rng = random.Random(0)
+    os.makedirs(folder, exist_ok=True)
+
+    pdf_paths = []
+    for file_no in range(num_files):
+        doc = fitz.open()
+        for _ in range(num_pages):
+            page = doc.new_page()
+            text = " ".join(rng.choice(vocabulary) for _ in range(words_per_page))
+            page.insert_textbox(fitz.Rect(36, 36, 560, 806), text, fontsize=8)
+        pdf_path = os.path.join(folder, f"benchmark_{file_no}.pdf")
+        doc.save(pdf_path)
+        pdf_paths.append(pdf_path)
+
+    return pdf_paths
+
+
+def benchmark_extraction(num_files: int, num_pages: int, workers: List[int], pages_per_task: int = 8) -> None:
+    """
+    Measures page extraction throughput with different numbers of worker processes.
+    """
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    from pdf_extraction import _extract_pdf_page_text_task
+
+    with tempfile.TemporaryDirectory() as folder:
+        pdf_paths = make_benchmark_pdfs(folder, num_files, num_pages)
+        tasks = [
+            (pdf_path, start_page, start_page + pages_per_task)
+            for pdf_path in pdf_paths
+            for start_page in range(0, num_pages, pages_per_task)
+        ]
+        total_pages = num_files * num_pages
+
+        print(f"{'workers':>8} {'seconds':>8} {'pages/s':>9} {'speedup':>8}")
+        baseline = None
+        for num_workers in workers:
+            with ProcessPoolExecutor(num_workers, mp_context=get_context("spawn")) as executor:
+                # Warm up the workers so process start-up is not measured
+                list(executor.map(_extract_pdf_page_text_task, tasks[:num_workers]))
+
+                start = time.perf_counter()
+                pages = sum(len(batch) for batch in executor.map(_extract_pdf_page_text_task, tasks))
+                elapsed = time.perf_counter() - start
+
+            assert pages == total_pages
+            baseline = baseline or elapsed
+            print(f"{num_workers:>8} {elapsed:>8.2f} {total_pages / elapsed:>9.1f} {baseline / elapsed:>7.2f}x")
+
+
+def benchmark_pipeline(
+    num_files: int,
+    num_pages: int,
+    embedding_latency: float,
+    embedding_workers: int,
+    pages_per_task: int = 8,
+) -> None:
+    """
+    Compares serial and pipelined ingestion of synthetic PDFs.
+
+    Parsing and chunking are real; every embedding call is replaced by a sleep of
+    `embedding_latency` seconds, standing in for the Vertex AI round trip.
+    """
+    import tempfile
+
+    from ingestion_pipeline import Pipeline, PipelineStage
+    from pdf_extraction import extract_pdf_page_text, get_text_overlapping_chunk
+
+    def parse(task):
+        return extract_pdf_page_text(*task)
+
+    def chunk(pages):
+        for page in pages:
+            page["chunked_text_dict"] = get_text_overlapping_chunk(page["text"])
+        return pages
+
+    def embed(pages):
+        time.sleep(embedding_latency)
+        return pages
+
+    def write(pages):
+        return None
+
+    stages = [parse, chunk, embed, write]
+
+    with tempfile.TemporaryDirectory() as folder:
+        pdf_paths = make_benchmark_pdfs(folder, num_files, num_pages)
+        tasks = [
+            (pdf_path, start_page, start_page + pages_per_task)
+            for pdf_path in pdf_paths
+            for start_page in range(0, num_pages, pages_per_task)
+        ]
+
+        start = time.perf_counter()
+        for task in tasks:
+            item = task
+            for stage in stages:
+                item = stage(item)
+        serial_time = time.perf_counter() - start
+
+        pipeline = Pipeline(
+            [
+                PipelineStage("parse", parse),
+                PipelineStage("chunk", chunk),
+                PipelineStage("embed", embed, workers=embedding_workers),
+                PipelineStage("write", write),
+            ]
+        )
+        stats = pipeline.run(tasks)
+
+    slowest = max(
+        stage_stats["busy_seconds"] / stage_stats["workers"] for stage_stats in stats["stages"].values()
+    )
+    print(f"page batches:            {len(tasks)}")
+    for name, stage_stats in stats["stages"].items():
+        print(f"  {name:<8} workers={stage_stats['workers']:<3} busy={stage_stats['busy_seconds']:.2f} s")
+    print(f"serial time:             {serial_time:.2f} s")
+    print(f"pipelined time:          {stats['wall_seconds']:.2f} s")
+    print(f"slowest stage:           {slowest:.2f} s (busy time per worker)")
+
+
+def benchmark_ingestion(num_files: int, num_pages: int, num_queries: int) -> None:
+    """
+    Ingests synthetic PDFs end to end and queries them with the offline "local" embedding
+    backend, so ingestion and retrieval can be measured without network access.
+    """
+    import os
+    import tempfile
+
+    os.environ["EMBEDDING_BACKEND"] = "local"
+
+    with tempfile.TemporaryDirectory() as folder:
+        # The embedding cache and vector store are created relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(folder)
+        import utils
+        from quantized_embeddings import QuantizedEmbeddings
+        from vector_store import VectorStore
+
+        backend = utils.embedding_backend
+        vector_store = VectorStore(
+            "vector_store", dimension=backend.text_dimension, embedding_model=backend.model_id
+        )
+        make_benchmark_pdfs(os.path.join(folder, "pdfs"), num_files, num_pages)
+
+        start = time.perf_counter()
+        utils.get_document_metadata(
+            generative_multimodal_model=None,
+            pdf_folder_path=os.path.join(folder, "pdfs"),
+            image_save_dir=os.path.join(folder, "images"),
+            image_description_prompt="",
+            vector_store=vector_store,
+        )
+        ingestion_seconds = time.perf_counter() - start
+
+        snapshot = vector_store.snapshot()
+        index = QuantizedEmbeddings(snapshot.embeddings, rows=snapshot.live_rows)
+        queries = [f"benchmark query {i} about page {i % num_pages}" for i in range(num_queries)]
+
+        start = time.perf_counter()
+        for query in queries:
+            utils.get_similar_text_from_query(query, snapshot, embedding_index=index)
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        utils.get_similar_texts_from_queries(queries, snapshot, embedding_index=index)
+        batch_seconds = time.perf_counter() - start
+        os.chdir(cwd)
+
+    print(f"embedding backend: {backend.model_id}")
+    print(f"ingestion: {num_files * num_pages} pages, {len(vector_store)} chunks in {ingestion_seconds:.2f} s "
+          f"({num_files * num_pages / ingestion_seconds:.1f} pages/s)")
+    print(f"queries one by one: {num_queries / single_seconds:.1f} QPS")
+    print(f"queries batched:    {num_queries / batch_seconds:.1f} QPS")
+
+
+def benchmark_reingestion(num_files: int, num_pages: int, num_changed: int) -> None:
+    """
+    Measures incremental re-ingestion of a folder (see `ingestion_manifest.IngestionManifest`)
+    with the offline "local" embedding backend: a full first run, a re-run on the unchanged
+    folder, a re-run after touching every file (same content, new modification time), and a
+    re-run after editing one page in `num_changed` files.
+    """
+    import contextlib
+    import io
+    import os
+    import tempfile
+
+    import fitz
+
+    os.environ["EMBEDDING_BACKEND"] = "local"
+
+    with tempfile.TemporaryDirectory() as folder:
+        # The embedding cache and vector store are created relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(folder)
+        import utils
+        from ingestion_manifest import IngestionManifest
+        from vector_store import VectorStore
+
+        backend = utils.embedding_backend
+        vector_store = VectorStore(
+            "vector_store", dimension=backend.text_dimension, embedding_model=backend.model_id
+        )
+        manifest = IngestionManifest(os.path.join("vector_store", "manifest.sqlite"))
+        pdf_paths = make_benchmark_pdfs(os.path.join(folder, "pdfs"), num_files, num_pages)
+
+        def ingest() -> float:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                utils.get_document_metadata(
+                    generative_multimodal_model=None,
+                    pdf_folder_path=os.path.join(folder, "pdfs"),
+                    image_save_dir=os.path.join(folder, "images"),
+                    image_description_prompt="",
+                    vector_store=vector_store,
+                    manifest=manifest,
+                )
+            return time.perf_counter() - start
+
+        print(f"files: {num_files}, pages per file: {num_pages}")
+        print(f"first run:                 {ingest():>7.2f} s, {vector_store.num_live} chunks")
+        print(f"unchanged re-run:          {ingest():>7.2f} s")
+
+        for pdf_path in pdf_paths:
+            os.utime(pdf_path)
+        print(f"touched re-run (hashing):  {ingest():>7.2f} s")
+
+        for pdf_path in pdf_paths[:num_changed]:
+            doc = fitz.open(pdf_path)
+            doc[0].insert_text((36, 20), "revised page header")
+            doc.saveIncr()
+            doc.close()
+        seconds = ingest()
+        print(f"{num_changed} files with 1 changed page: {seconds:>7.2f} s, "
+              f"{vector_store.num_deleted} chunks tombstoned, {vector_store.num_live} live")
+        os.chdir(cwd)
+
+
+def benchmark_uploads(num_uploads: int, size_mb: int) -> None:
+    """
+    Sends `num_uploads` concurrent `size_mb` MB uploads to /upload_documents of a rag server
+    running in a subprocess, and reports the wall time, throughput and the server's resident
+    memory before and at its peak. Streamed saving keeps the peak flat with respect to the
+    upload size; reading each upload into memory would add about `num_uploads * size_mb` MB.
+    """
+    import os
+    import socket
+    import subprocess
+    import sys
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    import httpx
+
+    def memory_mb(pid: int, field: str) -> float:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+        return float("nan")
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as folder:
+        upload_paths = []
+        for i in range(num_uploads):
+            path = os.path.join(folder, f"upload_{i}.bin")
+            with open(path, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1 << 20))
+            upload_paths.append(path)
+
+        # The server creates its vector store and upload folders relative to its working directory
+        server_dir = os.path.join(folder, "server")
+        os.makedirs(server_dir)
+        env = dict(
+            os.environ,
+            EMBEDDING_BACKEND="local",
+            PYTHONPATH=os.path.dirname(os.path.abspath(__file__)),
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "rag:app", "--port", str(port), "--log-level", "warning"],
+            cwd=server_dir,
+            env=env,
+        )
+        try:
+            for _ in range(600):
+                try:
+                    httpx.get(base_url + "/favicon.ico")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            idle_mb = memory_mb(server.pid, "VmRSS")
+
+            def upload(path: str) -> float:
+                start = time.perf_counter()
+                with open(path, "rb") as f, httpx.Client(timeout=None) as client:
+                    response = client.post(
+                        base_url + "/upload_documents",
+                        files=[("files", (os.path.basename(path), f, "application/octet-stream"))],
+                    )
+                assert response.status_code == 200, response.text
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=num_uploads) as executor:
+                latencies = list(executor.map(upload, upload_paths))
+            wall_time = time.perf_counter() - start
+            peak_mb = memory_mb(server.pid, "VmHWM")
+        finally:
+            server.terminate()
+            server.wait()
+
+        saved = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(os.path.join(server_dir, "uploaded_files"))
+            for name in names
+        ]
+
+    total_mb = num_uploads * size_mb
+    print(f"concurrent uploads:      {num_uploads} x {size_mb} MB")
+    print(f"wall time:               {wall_time:.2f} s ({total_mb / wall_time:.0f} MB/s)")
+    print(f"upload latency:          max {max(latencies):.2f} s, median {statistics.median(latencies):.2f} s")
+    print(f"files saved:             {len(saved)} (no partial .part files: {not any(p.endswith('.part') for p in saved)})")
+    print(f"server RSS idle:         {idle_mb:.0f} MB")
+    print(f"server RSS peak:         {peak_mb:.0f} MB (+{peak_mb - idle_mb:.0f} MB for {total_mb} MB uploaded)")
+
+
+def benchmark_lexical(num_chunks: int, words_per_chunk: int, num_queries: int) -> None:
+    """
+    Builds a BM25 index over synthetic chunks (Zipf-distributed words, one part number per
+    chunk, `words_per_chunk / 2` to `words_per_chunk` words) and reports build time, memory and query latency for part-number queries, rare
+    and common word queries, and the recall@1 of part-number queries.
+    """
+    import numpy as np
+
+    from lexical_index import BM25Index
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"word{i}" for i in range(50_000)])
+    ranks = np.arange(1, len(vocabulary) + 1)
+    word_probabilities = (1 / ranks) / (1 / ranks).sum()
+    words = vocabulary[rng.choice(len(vocabulary), size=(num_chunks, words_per_chunk), p=word_probabilities)]
+    part_numbers = [f"XJ-{i:07d}.{i % 7}b" for i in range(num_chunks)]
+    # Chunks are cut by character count, so their word counts vary
+    lengths = rng.integers(words_per_chunk // 2, words_per_chunk + 1, size=num_chunks)
+    texts = [
+        f"{' '.join(row[:10])} part {part_number} {' '.join(row[10:length])}"
+        for row, part_number, length in zip(words, part_numbers, lengths)
+    ]
+
+    start = time.perf_counter()
+    index = BM25Index()
+    index.add(texts)
+    build_seconds = time.perf_counter() - start
+    usage = index.memory_usage()
+
+    print(f"chunks: {num_chunks}, words per chunk: {words_per_chunk}")
+    print(f"build:    {build_seconds:.1f} s ({num_chunks / build_seconds:,.0f} chunks/s)")
+    print(f"terms: {usage['num_terms']:,}, postings: {usage['num_postings']:,}, "
+          f"postings {usage['postings_bytes'] / 1e6:.1f} MB, total arrays {usage['bytes'] / 1e6:.1f} MB")
+
+    query_rows = rng.integers(num_chunks, size=num_queries)
+    query_sets = {
+        "part number": [part_numbers[row] for row in query_rows],
+        "part number + words": [f"{part_numbers[row]} {' '.join(words[row][:3])}" for row in query_rows],
+        "2 rare words": [f"word{rng.integers(10_000, 50_000)} word{rng.integers(10_000, 50_000)}" for _ in query_rows],
+        "3 common words": [f"word{rng.integers(0, 20)} word{rng.integers(0, 20)} word{rng.integers(0, 20)}" for _ in query_rows],
+    }
+
+    print(f"{'queries':<22} {'p50 ms':>8} {'p95 ms':>8} {'recall@1':>9}")
+    for name, queries in query_sets.items():
+        latencies, hits = [], 0
+        for row, query in zip(query_rows, queries):
+            start = time.perf_counter()
+            top_rows, _ = index.search(query, 10)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(top_rows) > 0 and top_rows[0] == row
+        recall = f"{hits / num_queries:.3f}" if name.startswith("part number") else "-"
+        print(f"{name:<22} {percentile(latencies, 50):>8.3f} {percentile(latencies, 95):>8.3f} {recall:>9}")
+
+
+def make_benchmark_page_texts(num_pages: int, seed: int = 0, lines_per_page: Optional[int] = None) -> List[str]:
+    """
+    Builds page texts shaped like PDF extraction output: paragraphs of sentences of
+    Zipf-distributed words (some non-ASCII), wrapped into ~80-character lines and separated
+    by blank lines. With `lines_per_page`, the text flows into pages of that many lines, so
+    page breaks fall inside paragraphs and sentences as in typeset documents.
+    """
+    import random
+    import textwrap
+
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(2000)] + ["café", "naïve", "Straße", "µm", "±0.5", "X-1042", "e.g."]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    rng.shuffle(weights)
+
+    pages = []
+    for _ in range(num_pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 8)):
+            sentences = [
+                " ".join(rng.choices(vocabulary, weights, k=rng.randint(6, 28))).capitalize() + rng.choice(".....?!")
+                for _ in range(rng.randint(2, 7))
+            ]
+            paragraphs.append(textwrap.fill(" ".join(sentences), 80))
+        pages.append("\n\n".join(paragraphs) + "\n")
+
+    if lines_per_page is not None:
+        lines = "\n".join(pages).splitlines(keepends=True)
+        pages = ["".join(lines[start : start + lines_per_page]) for start in range(0, len(lines), lines_per_page)]
+    return pages
+
+
+def benchmark_chunking(num_pages: int, max_tokens: int, overlap_tokens: int) -> None:
+    """
+    Chunks the same synthetic pages with the fixed 1000-character windows and the structured
+    chunker, and reports the chunks and tokens to embed, the chunks cut inside a word or
+    sentence, non-ASCII characters kept and chunking time.
+    """
+    from chunking import FixedCharacterChunker, StructuredChunker, count_tokens
+
+    pages = make_benchmark_page_texts(num_pages)
+    page_tokens = sum(count_tokens(page) for page in pages)
+    non_ascii = sum(1 for page in pages for character in page if ord(character) > 127)
+    print(f"pages: {num_pages}, characters: {sum(len(page) for page in pages):,}, "
+          f"tokens: {page_tokens:,}, non-ASCII characters: {non_ascii:,}")
+
+    chunkers = {
+        "fixed 1000/100 chars": FixedCharacterChunker(1000, 100),
+        f"structured {max_tokens}/{overlap_tokens} tok": StructuredChunker(max_tokens, overlap_tokens),
+    }
+    print(f"{'chunker':<26} {'chunks':>8} {'tok/chunk':>10} {'max tok':>8} {'embedded tok':>13} "
+          f"{'mid-word':>9} {'mid-sentence':>13} {'ms/page':>8}")
+    for name, chunker in chunkers.items():
+        start = time.perf_counter()
+        page_offsets = [chunker.chunk_offsets(page) for page in pages]
+        ms_per_page = (time.perf_counter() - start) * 1000 / num_pages
+
+        chunk_tokens, mid_word, mid_sentence = [], 0, 0
+        for page, offsets in zip(pages, page_offsets):
+            for chunk_start, chunk_end in offsets.values():
+                chunk_tokens.append(count_tokens(page, chunk_start, chunk_end))
+                before = page[chunk_start - 1] if chunk_start > 0 else " "
+                after = page[chunk_end] if chunk_end < len(page) else " "
+                mid_word += not (before.isspace() and after.isspace())
+                mid_sentence += page[chunk_start:chunk_end].rstrip()[-1:] not in (".", "?", "!", "")
+        num_chunks = len(chunk_tokens)
+        print(f"{name:<26} {num_chunks:>8,} {sum(chunk_tokens) / num_chunks:>10.0f} {max(chunk_tokens):>8} "
+              f"{sum(chunk_tokens):>13,} {mid_word / num_chunks:>9.0%} {mid_sentence / num_chunks:>13.0%} {ms_per_page:>8.3f}")
+
+
+def benchmark_page_breaks(num_pages: int, lines_per_page: int, max_tokens: int, overlap_tokens: int) -> None:
+    """
+    Chunks synthetic pages whose breaks fall inside paragraphs page by page and as one
+    document (see `chunking.DocumentChunker`), and reports the chunks and tokens to embed,
+    the small chunks (under a quarter of the budget), the sentences crossing a page break
+    that some chunk holds whole, and chunking time.
+    """
+    import numpy as np
+
+    from chunking import BOUNDARY_PATTERN, DocumentChunker, StructuredChunker, count_tokens
+
+    pages = make_benchmark_page_texts(num_pages, lines_per_page=lines_per_page)
+    num_pages = len(pages)
+    chunker = StructuredChunker(max_tokens, overlap_tokens)
+
+    # Pages end with a line break, so the document text is their plain concatenation
+    document = "".join(pages)
+    page_starts = np.cumsum([0] + [len(page) for page in pages[:-1]])
+    page_breaks = page_starts[1:]
+
+    def page_of(offsets: np.ndarray) -> np.ndarray:
+        return np.searchsorted(page_breaks, offsets, side="right")
+
+    sentences, position = [], 0
+    for boundary in BOUNDARY_PATTERN.finditer(document):
+        sentences.append((position, boundary.start()))
+        position = boundary.end()
+    sentences = np.array(sentences)
+    crossing = sentences[page_of(sentences[:, 0]) != page_of(sentences[:, 1] - 1)]
+    print(f"pages: {num_pages}, lines per page: {lines_per_page}, tokens: {count_tokens(document):,}, "
+          f"sentences crossing a page break: {len(crossing):,}")
+
+    def per_page() -> List[Tuple[int, int]]:
+        return [
+            (page_start + start, page_start + end)
+            for page_start, page in zip(page_starts.tolist(), pages)
+            for start, end in chunker.chunk_offsets(page).values()
+        ]
+
+    def cross_page() -> List[Tuple[int, int]]:
+        document_chunker = DocumentChunker(chunker)
+        chunks = []
+        for page_num, page in enumerate(pages):
+            chunks.extend(document_chunker.add_page(page_num, page))
+        chunks.extend(document_chunker.finish())
+        return [
+            (page_starts[chunk.page_num] + chunk.start, page_starts[chunk.page_num] + chunk.end) for chunk in chunks
+        ]
+
+    print(f"{'chunking':<12} {'chunks':>8} {'embedded tok':>13} {'small chunks':>13} {'spanning':>9} "
+          f"{'crossing sentences whole':>25} {'ms/page':>8}")
+    for name, chunk_document in (("per page", per_page), ("cross-page", cross_page)):
+        start = time.perf_counter()
+        chunk_offsets = chunk_document()
+        ms_per_page = (time.perf_counter() - start) * 1000 / num_pages
+
+        chunk_tokens = [count_tokens(document, chunk_start, chunk_end) for chunk_start, chunk_end in chunk_offsets]
+        small = sum(tokens < max_tokens / 4 for tokens in chunk_tokens)
+        chunk_starts, chunk_ends = np.array(chunk_offsets).T
+        spanning = int(np.sum(page_of(chunk_starts) != page_of(chunk_ends - 1)))
+        whole = sum(bool(np.any((chunk_starts <= start) & (chunk_ends >= end))) for start, end in crossing)
+        print(f"{name:<12} {len(chunk_offsets):>8,} {sum(chunk_tokens):>13,} {small:>13,} {spanning:>9,} "
+              f"{whole / max(len(crossing), 1):>25.0%} {ms_per_page:>8.3f}")
+
+
+def make_text_metadata(num_pages: int, num_chunks: int, dimension: int) -> dict:
+    """
+    Builds the per-page text metadata of one synthetic document (see `utils.get_text_metadata_df`).
+    """
+    import numpy as np
+
+    text_metadata = {}
+    for page_num in range(num_pages):
+        chunked_text_dict = {chunk_number: f"chunk {chunk_number} " * 50 for chunk_number in range(1, num_chunks + 1)}
+        text_metadata[page_num] = {
+            "text": "".join(chunked_text_dict.values()),
+            "page_text_embeddings": {"text_embedding": np.random.rand(dimension).tolist()},
+            "chunked_text_dict": chunked_text_dict,
+            "chunk_embeddings_dict": {
+                chunk_number: np.random.rand(dimension).tolist() for chunk_number in chunked_text_dict
+            },
+        }
+    return text_metadata
+
+
+def benchmark_metadata_scaling(
+    document_counts: List[int],
+    max_concat_documents: int,
+    num_pages: int = 3,
+    num_chunks: int = 3,
+    dimension: int = 8,
+) -> None:
+    """
+    Times accumulating the text metadata of a growing number of documents: the former
+    DataFrame concatenation per document against the columnar `TextMetadataBuffer`.
+
+    Embeddings are kept short so the numbers measure the accumulation, not list creation.
+    """
+    import pandas as pd
+
+    from text_metadata import TextMetadataBuffer
+
+    document = make_text_metadata(num_pages, num_chunks, dimension)
+
+    print(f"{'documents':>10} {'rows':>8} {'concat s':>9} {'buffer s':>9} {'buffer us/doc':>14}")
+    for num_documents in document_counts:
+        concat_time = None
+        if num_documents <= max_concat_documents:
+            start = time.perf_counter()
+            text_metadata_df_final = pd.DataFrame()
+            for document_no in range(num_documents):
+                buffer = TextMetadataBuffer()
+                buffer.add_text_metadata(f"document_{document_no}.pdf", document)
+                text_metadata_df_final = pd.concat([text_metadata_df_final, buffer.to_df()], axis=0)
+                text_metadata_df_final = text_metadata_df_final.reset_index(drop=True)
+            concat_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = TextMetadataBuffer()
+        for document_no in range(num_documents):
+            file_start = len(buffer)
+            buffer.add_text_metadata(f"document_{document_no}.pdf", document)
+            buffer.chunks_df(file_start)  # Per-file rows, as appended to the vector store
+        rows = len(buffer.to_df())
+        buffer_time = time.perf_counter() - start
+
+        concat_column = f"{concat_time:>9.2f}" if concat_time is not None else f"{'skipped':>9}"
+        print(
+            f"{num_documents:>10} {rows:>8} {concat_column} {buffer_time:>9.2f} {buffer_time / num_documents * 1e6:>14.1f}"
+        )
+
+
+def benchmark_metadata_memory(num_pages: int, chunks_per_page: int, dimension: int) -> None:
+    """
+    Reports the memory retained by the text metadata of a synthetic corpus in the former
+    wide layout (one dict row per chunk, embeddings as Python lists) and in the normalized
+    `TextMetadataBuffer` (pages and chunks tables, float32 embedding matrices).
+
+    Pages are generated one at a time, with fresh embedding lists as returned by the
+    embedding API, and only what each layout keeps is measured.
+    """
+    import gc
+    import tracemalloc
+
+    import numpy as np
+    import pandas as pd
+
+    from text_metadata import TextMetadataBuffer
+
+    page_text = "".join(f"chunk text {i} " * 60 for i in range(chunks_per_page))
+    chunk_length = len(page_text) // chunks_per_page
+    rng = np.random.default_rng(0)
+
+    def make_page(page_num: int) -> dict:
+        chunked_text_dict = {
+            chunk_number: page_text[(chunk_number - 1) * chunk_length : chunk_number * chunk_length]
+            for chunk_number in range(1, chunks_per_page + 1)
+        }
+        return {
+            "text": page_text + str(page_num),
+            "page_text_embeddings": {"text_embedding": rng.random(dimension).tolist()},
+            "chunked_text_dict": chunked_text_dict,
+            "chunk_embeddings_dict": {
+                chunk_number: rng.random(dimension).tolist() for chunk_number in chunked_text_dict
+            },
+        }
+
+    def build_wide() -> pd.DataFrame:
+        rows = []
+        for page_num in range(num_pages):
+            values = make_page(page_num)
+            for chunk_number, chunk_text in values["chunked_text_dict"].items():
+                rows.append(
+                    {
+                        "file_name": "document.pdf",
+                        "page_num": page_num + 1,
+                        "text": values["text"],
+                        "text_embedding_page": values["page_text_embeddings"]["text_embedding"],
+                        "chunk_number": chunk_number,
+                        "chunk_text": chunk_text,
+                        "text_embedding_chunk": values["chunk_embeddings_dict"][chunk_number],
+                    }
+                )
+        return pd.DataFrame(rows)
+
+    def build_normalized() -> TextMetadataBuffer:
+        buffer = TextMetadataBuffer()
+        for page_num in range(num_pages):
+            buffer.add_text_metadata("document.pdf", {page_num: make_page(page_num)})
+        return buffer
+
+    def retained_bytes(build) -> Tuple[int, object]:
+        gc.collect()
+        tracemalloc.start()
+        result = build()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return current, result
+
+    wide_bytes, wide_df = retained_bytes(build_wide)
+    del wide_df
+    normalized_bytes, buffer = retained_bytes(build_normalized)
+
+    num_chunks = num_pages * chunks_per_page
+    print(f"pages: {num_pages}, chunks: {num_chunks}, dimension: {dimension}")
+    print(f"{'layout':<12} {'MB':>9} {'bytes/chunk':>12}")
+    print(f"{'wide':<12} {wide_bytes / 1e6:>9.1f} {wide_bytes / num_chunks:>12.0f}")
+    print(f"{'normalized':<12} {normalized_bytes / 1e6:>9.1f} {normalized_bytes / num_chunks:>12.0f}")
+    print(f"reduction: {wide_bytes / normalized_bytes:.1f}x")
+    print(f"page text in a flat export: {num_chunks * len(page_text) / 1e6:.1f} MB (wide), {buffer.memory_usage()['page_text_bytes'] / 1e6:.1f} MB (normalized)")
+    print(f"normalized buffer breakdown: {buffer.memory_usage()}")
+
+
+def make_benchmark_embeddings(
+    num_vectors: int, dimension: int, num_queries: int, seed: int = 0
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Builds unit-normalized, clustered float32 embeddings and queries near them, a rough
+    stand-in for text embeddings of a document corpus.
+
+    Returns:
+        The (num_vectors, dimension) embeddings and the (num_queries, dimension) queries.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(num_vectors // 1000, 16), dimension), dtype=np.float32)
+
+    embeddings = np.empty((num_vectors, dimension), dtype=np.float32)
+    for start in range(0, num_vectors, 65536):
+        count = min(65536, num_vectors - start)
+        block = centers[rng.integers(len(centers), size=count)]
+        block += 0.8 * rng.standard_normal((count, dimension), dtype=np.float32)
+        embeddings[start : start + count] = block / np.linalg.norm(block, axis=1, keepdims=True)
+
+    queries = embeddings[rng.integers(num_vectors, size=num_queries)]
+    queries = queries + 0.5 * rng.standard_normal(queries.shape, dtype=np.float32) / np.sqrt(dimension)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    return embeddings, queries.astype(np.float32)
+
+
+def exact_top_k(embeddings: "np.ndarray", queries: "np.ndarray", top_k: int) -> List[set]:
+    """Exact top-k row sets per query, by brute-force float32 scoring."""
+    import numpy as np
+
+    ground_truth = []
+    for query in queries:
+        scores = embeddings @ query
+        ground_truth.append(set(np.argpartition(-scores, top_k - 1)[:top_k].tolist()))
+    return ground_truth
+
+
+def benchmark_quantization(num_chunks: int, dimension: int, num_queries: int, top_k: int) -> None:
+    """
+    Reports memory per million chunks, recall@k against exact float32 search and QPS for
+    each embedding storage type, with and without exact rescoring of the candidates.
+    """
+    from quantized_embeddings import EMBEDDING_STORAGE_DTYPES, QuantizedEmbeddings
+
+    embeddings, queries = make_benchmark_embeddings(num_chunks, dimension, num_queries)
+    ground_truth = exact_top_k(embeddings, queries, top_k)
+
+    print(f"chunks: {num_chunks}, dimension: {dimension}, queries: {num_queries}")
+    print(f"{'storage':<8} {'rescore':>8} {'MB/1M':>7} {'recall@' + str(top_k):>10} {'QPS':>8}")
+    for dtype in EMBEDDING_STORAGE_DTYPES:
+        for rescore_factor in ([1] if dtype == "float32" else [1, 4]):
+            index = QuantizedEmbeddings(embeddings, dtype=dtype, rescore_factor=rescore_factor)
+
+            start = time.perf_counter()
+            results = [index.search(query, top_k)[0] for query in queries]
+            elapsed = time.perf_counter() - start
+
+            recall = sum(
+                len(truth.intersection(result.tolist())) for truth, result in zip(ground_truth, results)
+            ) / (top_k * num_queries)
+            rescore = "-" if dtype == "float32" else f"x{rescore_factor}"
+            print(
+                f"{dtype:<8} {rescore:>8} {index.memory_usage()['mb_per_million_vectors']:>7.0f} {recall:>10.4f} {num_queries / elapsed:>8.1f}"
+            )
+
+
+def benchmark_batch_retrieval(num_chunks: int, dimension: int, num_queries: int, top_k: int) -> None:
+    """
+    Compares scoring queries one at a time (one matrix-vector product each) with scoring
+    them in blocks (one matrix-matrix product per block) over the same float32 corpus.
+    """
+    from quantized_embeddings import QuantizedEmbeddings
+
+    embeddings, queries = make_benchmark_embeddings(num_chunks, dimension, num_queries)
+    index = QuantizedEmbeddings(embeddings)
+
+    start = time.perf_counter()
+    single = [index.search(query, top_k)[0] for query in queries]
+    single_seconds = time.perf_counter() - start
+
+    print(f"chunks: {num_chunks}, dimension: {dimension}, queries: {num_queries}")
+    print(f"{'mode':<16} {'seconds':>8} {'QPS':>9}")
+    print(f"{'per query':<16} {single_seconds:>8.2f} {num_queries / single_seconds:>9.1f}")
+    for query_block_size in (16, 64, 256):
+        start = time.perf_counter()
+        batched = index.search_batch(queries, top_k, query_block_size=query_block_size)
+        seconds = time.perf_counter() - start
+        assert all((a == b).all() for a, (b, _) in zip(single, batched))
+        print(f"{'batch of ' + str(query_block_size):<16} {seconds:>8.2f} {num_queries / seconds:>9.1f}")
+
+
+def benchmark_startup(modules: List[str], repeats: int) -> None:
+    """
+    Times importing each module in a fresh interpreter, and checks that importing it does
+    not load vertexai, IPython or PIL (so no Vertex AI initialization or network access).
+    """
+    import json
+    import os
+    import subprocess
+    import sys
+
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import {module}\n"
+        "seconds = time.perf_counter() - start\n"
+        "heavy = [name for name in ('vertexai', 'IPython', 'PIL') if name in sys.modules]\n"
+        "print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))\n"
+    )
+
+    print(f"{'module':<8} {'median s':>9} {'min s':>7}  heavy modules imported")
+    for module in modules:
+        timings, heavy = [], []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, "-c", script.format(module=module)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            timings.append(result["seconds"])
+            heavy = result["heavy"]
+        print(f"{module:<8} {statistics.median(timings):>9.2f} {min(timings):>7.2f}  {heavy or 'none'}")
+
+
+def benchmark_ann(
+    num_chunks: int, dimension: int, num_queries: int, top_k: int, nlist: int, nprobes: List[int]
+) -> None:
+    """
+    Reports build time, QPS and recall@k of the IVF-flat index per nprobe against exact
+    search, then checks that a saved and reloaded index and an incrementally built one
+    return the same results.
+    """
+    import os
+    import tempfile
+
+    import numpy as np
+
+    from ann_index import ExactIndex, IVFFlatIndex, load_embedding_index
+
+    embeddings, queries = make_benchmark_embeddings(num_chunks, dimension, num_queries)
+    ground_truth = exact_top_k(embeddings, queries, top_k)
+
+    def run(search) -> Tuple[float, float, list]:
+        start = time.perf_counter()
+        results = [search(query) for query in queries]
+        elapsed = time.perf_counter() - start
+        recall = sum(
+            len(truth.intersection(result.tolist())) for truth, result in zip(ground_truth, results)
+        ) / (top_k * num_queries)
+        return num_queries / elapsed, recall, results
+
+    start = time.perf_counter()
+    ivf = IVFFlatIndex(nlist=nlist or None, min_train_size=0).build(embeddings)
+    build_seconds = time.perf_counter() - start
+
+    print(f"chunks: {num_chunks}, dimension: {dimension}, queries: {num_queries}")
+    print(f"ivf_flat build: {build_seconds:.2f} s, nlist: {ivf.num_lists}")
+    print(f"{'index':<10} {'nprobe':>7} {'recall@' + str(top_k):>10} {'QPS':>8}")
+
+    exact = ExactIndex(embeddings)
+    qps, recall, _ = run(lambda query: exact.search(query, top_k)[0])
+    print(f"{'exact':<10} {'-':>7} {recall:>10.4f} {qps:>8.1f}")
+    for nprobe in nprobes:
+        qps, recall, _ = run(lambda query: ivf.search(query, top_k, nprobe=nprobe)[0])
+        print(f"{'ivf_flat':<10} {nprobe:>7} {recall:>10.4f} {qps:>8.1f}")
+
+    # Save/load round trip and incremental add over the trained centroids
+    _, _, expected = run(lambda query: ivf.search(query, top_k)[0])
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "index.npz")
+        start = time.perf_counter()
+        ivf.save(path)
+        loaded = load_embedding_index(path)
+        print(f"save + load: {time.perf_counter() - start:.2f} s")
+    _, _, results = run(lambda query: loaded.search(query, top_k)[0])
+    print(f"loaded index matches: {all(np.array_equal(a, b) for a, b in zip(expected, results))}")
+
+    half = num_chunks // 2
+    incremental = IVFFlatIndex(nlist=nlist or None, min_train_size=0).build(embeddings[:half])
+    start = time.perf_counter()
+    incremental.add(embeddings[half:])
+    add_seconds = time.perf_counter() - start
+    qps, recall, _ = run(lambda query: incremental.search(query, top_k)[0])
+    print(
+        f"incremental add of {num_chunks - half} rows: {add_seconds:.2f} s, "
+        f"recall@{top_k} at nprobe {incremental.nprobe}: {recall:.4f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    route_latency = subparsers.add_parser("route_latency", help="/chain latency over many requests")
+    route_latency.add_argument("--app", default="local_llm", choices=["rag", "local_llm"])
+    route_latency.add_argument("--requests", type=int, default=10_000)
+    route_latency.add_argument("--window", type=int, default=1000)
+
+    concurrency = subparsers.add_parser("concurrency", help="overlap of concurrent /chain requests")
+    concurrency.add_argument("--app", default="local_llm", choices=["rag", "local_llm"])
+    concurrency.add_argument("--concurrency", type=int, default=16)
+    concurrency.add_argument("--generation-time", type=float, default=1.0)
+
+    extraction = subparsers.add_parser("extraction", help="PDF page extraction throughput per worker count")
+    extraction.add_argument("--files", type=int, default=8)
+    extraction.add_argument("--pages", type=int, default=50)
+    extraction.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    pipeline = subparsers.add_parser("pipeline", help="serial vs pipelined parse/chunk/embed/write")
+    pipeline.add_argument("--files", type=int, default=8)
+    pipeline.add_argument("--pages", type=int, default=50)
+    pipeline.add_argument("--embedding-latency", type=float, default=0.2)
+    pipeline.add_argument("--embedding-workers", type=int, default=4)
+
+    ingestion = subparsers.add_parser("ingestion", help="end-to-end ingestion and retrieval with the local embedding backend")
+    ingestion.add_argument("--files", type=int, default=8)
+    ingestion.add_argument("--pages", type=int, default=50)
+    ingestion.add_argument("--queries", type=int, default=200)
+
+    reingestion = subparsers.add_parser("reingestion", help="incremental re-ingestion of an unchanged or partly changed folder")
+    reingestion.add_argument("--files", type=int, default=5000)
+    reingestion.add_argument("--pages", type=int, default=2)
+    reingestion.add_argument("--changed", type=int, default=50)
+
+    uploads = subparsers.add_parser("uploads", help="concurrent large uploads: throughput and server peak memory")
+    uploads.add_argument("--uploads", type=int, default=4)
+    uploads.add_argument("--size-mb", type=int, default=200)
+
+    lexical = subparsers.add_parser("lexical", help="BM25 index build time, memory and query latency")
+    lexical.add_argument("--chunks", type=int, default=200_000)
+    lexical.add_argument("--words-per-chunk", type=int, default=80)
+    lexical.add_argument("--queries", type=int, default=1000)
+
+    chunking = subparsers.add_parser("chunking", help="fixed character windows vs structured token-budget chunks")
+    chunking.add_argument("--pages", type=int, default=2000)
+    chunking.add_argument("--max-tokens", type=int, default=384)
+    chunking.add_argument("--overlap-tokens", type=int, default=32)
+
+    page_breaks = subparsers.add_parser("page_breaks", help="per-page vs cross-page chunking of pages broken mid-paragraph")
+    page_breaks.add_argument("--pages", type=int, default=2000)
+    page_breaks.add_argument("--lines-per-page", type=int, default=50)
+    page_breaks.add_argument("--max-tokens", type=int, default=384)
+    page_breaks.add_argument("--overlap-tokens", type=int, default=32)
+
+    metadata_scaling = subparsers.add_parser("metadata_scaling", help="text metadata accumulation vs corpus size")
+    metadata_scaling.add_argument("--documents", type=int, nargs="+", default=[10, 100, 1000, 10_000])
+    metadata_scaling.add_argument("--max-concat-documents", type=int, default=2000)
+
+    metadata_memory = subparsers.add_parser("metadata_memory", help="memory of the wide vs normalized text metadata")
+    metadata_memory.add_argument("--pages", type=int, default=5000)
+    metadata_memory.add_argument("--chunks-per-page", type=int, default=4)
+    metadata_memory.add_argument("--dimension", type=int, default=768)
+
+    quantization = subparsers.add_parser("quantization", help="memory and recall of float32/float16/int8 storage")
+    quantization.add_argument("--chunks", type=int, default=200_000)
+    quantization.add_argument("--dimension", type=int, default=768)
+    quantization.add_argument("--queries", type=int, default=200)
+    quantization.add_argument("--top-k", type=int, default=10)
+
+    batch_retrieval = subparsers.add_parser("batch_retrieval", help="per-query vs batched multi-query scoring")
+    batch_retrieval.add_argument("--chunks", type=int, default=200_000)
+    batch_retrieval.add_argument("--dimension", type=int, default=768)
+    batch_retrieval.add_argument("--queries", type=int, default=1000)
+    batch_retrieval.add_argument("--top-k", type=int, default=10)
+
+    startup = subparsers.add_parser("startup", help="import time of the server modules")
+    startup.add_argument("--modules", nargs="+", default=["utils", "rag"])
+    startup.add_argument("--repeats", type=int, default=5)
+
+    ann = subparsers.add_parser("ann", help="recall and QPS of the IVF-flat index vs exact search")
+    ann.add_argument("--chunks", type=int, default=200_000)
+    ann.add_argument("--dimension", type=int, default=768)
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("--top-k", type=int, default=10)
+    ann.add_argument("--nlist", type=int, default=0, help="0 for sqrt(chunks)")
+    ann.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+
+    args = parser.parse_args()
+
+    if args.benchmark == "route_latency":
+        benchmark_route_latency(args.app, args.requests, args.window)
+    elif args.benchmark == "concurrency":
+        benchmark_concurrency(args.app, args.concurrency, args.generation_time)
+    elif args.benchmark == "extraction":
+        benchmark_extraction(args.files, args.pages, args.workers)
+    elif args.benchmark == "pipeline":
+        benchmark_pipeline(args.files, args.pages, args.embedding_latency, args.embedding_workers)
+    elif args.benchmark == "ingestion":
+        benchmark_ingestion(args.files, args.pages, args.queries)
+    elif args.benchmark == "reingestion":
+        benchmark_reingestion(args.files, args.pages, args.changed)
+    elif args.benchmark == "uploads":
+        benchmark_uploads(args.uploads, args.size_mb)
+    elif args.benchmark == "lexical":
+        benchmark_lexical(args.chunks, args.words_per_chunk, args.queries)
+    elif args.benchmark == "chunking":
+        benchmark_chunking(args.pages, args.max_tokens, args.overlap_tokens)
+    elif args.benchmark == "page_breaks":
+        benchmark_page_breaks(args.pages, args.lines_per_page, args.max_tokens, args.overlap_tokens)
+    elif args.benchmark == "metadata_scaling":
+        benchmark_metadata_scaling(args.documents, args.max_concat_documents)
+    elif args.benchmark == "metadata_memory":
+        benchmark_metadata_memory(args.pages, args.chunks_per_page, args.dimension)
+    elif args.benchmark == "quantization":
+        benchmark_quantization(args.chunks, args.dimension, args.queries, args.top_k)
+    elif args.benchmark == "batch_retrieval":
+        benchmark_batch_retrieval(args.chunks, args.dimension, args.queries, args.top_k)
+    elif args.benchmark == "startup":
+        benchmark_startup(args.modules, args.repeats)
+    elif args.benchmark == "ann":
+        benchmark_ann(args.chunks, args.dimension, args.queries, args.top_k, args.nlist, args.nprobe)
@@ -0,0 +1,514 @@
+import abc
+import bisect
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pdf_extraction import get_text_overlapping_chunk_offsets
+
+
+# Text chunkers: split page text into chunks given as (start, end) character offsets into
+# the text, so chunks are slices of the page text rather than copies. `DocumentChunker`
+# chunks the pages of a document as one text, across page breaks. Kept free of model and
+# cloud imports like pdf_extraction.
+
+CHUNKERS = ("structured", "fixed")
+# Inserted between two pages when the first does not end with whitespace, so words never merge
+PAGE_SEPARATOR = "\n"
+
+# Word-like pieces: runs of word characters, or single punctuation characters
+TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Paragraph breaks (a blank line), and whitespace after a sentence end (. ! ? optionally
+# followed by a closing quote or bracket)
+BOUNDARY_PATTERN = re.compile(r"\n[ \t]*\n\s*|(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+WORD_PATTERN = re.compile(r"\S+")
+CHARACTERS_PER_TOKEN = 4
+
+
+def count_tokens(text: str, start: int = 0, end: int = -1) -> int:
+    """
+    Estimates the number of subword tokens of `text[start:end]` without copying it.
+
+    Every word counts one token per started 4 characters and every punctuation character
+    one token, which tracks subword tokenizers (about 1.3 tokens per English word) more
+    closely than a character count.
+
+    Args:
+        text: The text.
+        start: Offset of the first character.
+        end: Offset after the last character, -1 for the end of the text.
+
+    Returns:
+        The estimated token count.
+    """
+    end = len(text) if end < 0 else end
+    return sum(
+        (piece.end() - piece.start() + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+        for piece in TOKEN_PIECE_PATTERN.finditer(text, start, end)
+    )
+
+
+class TextChunker(abc.ABC):
+    """
+    Base class of the text chunkers.
+    """
+
+    name = ""
+
+    @property
+    @abc.abstractmethod
+    def params(self) -> Dict[str, Any]:
+        """The chunker name and parameters, e.g. recorded by `ingestion_manifest.IngestionManifest`."""
+
+    @abc.abstractmethod
+    def chunk_offsets(self, text: str) -> Dict[int, Tuple[int, int]]:
+        """
+        Splits a text into chunks.
+
+        Args:
+            text: The text to be chunked.
+
+        Returns:
+            A dictionary where keys are chunk numbers (from 1) and values are (start, end)
+            character offsets into `text`.
+        """
+
+    def chunk(self, text: str) -> Dict[int, str]:
+        """Returns the text of every chunk, keyed by chunk number."""
+        return {
+            chunk_number: text[start:end]
+            for chunk_number, (start, end) in self.chunk_offsets(text).items()
+        }
+
+    def stream(self) -> "ChunkStream":
+        """Returns a `ChunkStream` chunking a text that arrives in pieces like `chunk_offsets` would."""
+        return ChunkStream(self)
+
+
+class ChunkStream:
+    """
+    Chunks a text that arrives in pieces (e.g. page by page), returning every chunk once the
+    text still to come can no longer change it. Offsets are into the concatenation of all
+    pieces fed so far, and chunks are the ones `chunk_offsets` returns for that whole text.
+
+    This base stream keeps the whole text and chunks it in `finish`; chunkers override
+    `TextChunker.stream` to return chunks earlier and keep only the unfinished tail.
+    """
+
+    def __init__(self, chunker: TextChunker):
+        self.chunker = chunker
+        self._pieces: List[str] = []
+
+    @property
+    def pending_start(self) -> int:
+        """Offset before which no chunk is returned anymore."""
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Appends text.
+
+        Returns:
+            The (start, end) offsets of the chunks completed by it.
+        """
+        self._pieces.append(text)
+        return []
+
+    def finish(self) -> List[Tuple[int, int]]:
+        """Returns the (start, end) offsets of the remaining chunks, once all text is fed."""
+        chunk_offsets = list(self.chunker.chunk_offsets("".join(self._pieces)).values())
+        self._pieces = []
+        return chunk_offsets
+
+
+class FixedCharacterChunker(TextChunker):
+    """
+    Fixed windows of `character_limit` characters, each overlapping the previous one by
+    `overlap` characters (see `pdf_extraction.get_text_overlapping_chunk_offsets`).
+    Windows cut through words and sentences.
+    """
+
+    name = "fixed"
+
+    def __init__(self, character_limit: int = 1000, overlap: int = 100):
+        """
+        Args:
+            character_limit: Maximum characters per chunk.
+            overlap: Number of overlapping characters between chunks.
+
+        Raises:
+            ValueError: If `overlap` is greater than `character_limit`.
+        """
+        if overlap > character_limit:
+            raise ValueError("Overlap cannot be larger than character limit.")
+        self.character_limit = character_limit
+        self.overlap = overlap
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {"chunker": self.name, "character_limit": self.character_limit, "overlap": self.overlap}
+
+    def chunk_offsets(self, text: str) -> Dict[int, Tuple[int, int]]:
+        return get_text_overlapping_chunk_offsets(text, self.character_limit, self.overlap)
+
+    def stream(self) -> ChunkStream:
+        return _FixedCharacterChunkStream(self)
+
+
+class _FixedCharacterChunkStream(ChunkStream):
+    # Windows only depend on the text length: each one is returned once the text reaches its end
+
+    def __init__(self, chunker: FixedCharacterChunker):
+        super().__init__(chunker)
+        self._length = 0
+        self._next_start = 0  # Offset of the next window
+
+    @property
+    def pending_start(self) -> int:
+        return self._next_start
+
+    def _windows(self, final: bool) -> List[Tuple[int, int]]:
+        limit = self.chunker.character_limit
+        step = limit - self.chunker.overlap
+        last_start = self._length if final else self._length - limit + 1
+        windows = [
+            (start, min(start + limit, self._length)) for start in range(self._next_start, last_start, step)
+        ]
+        if windows:
+            self._next_start = windows[-1][0] + step
+        return windows
+
+    def feed(self, text: str) -> List[Tuple[int, int]]:
+        self._length += len(text)
+        return self._windows(final=False)
+
+    def finish(self) -> List[Tuple[int, int]]:
+        return self._windows(final=True)
+
+
+class StructuredChunker(TextChunker):
+    """
+    Packs whole sentences into chunks of up to `max_tokens` tokens (see `count_tokens`).
+
+    * The text is split into sentences at sentence ends and paragraph breaks. A sentence
+      longer than the budget is split between words, and a word longer than the budget
+      between characters.
+    * Sentences are added to a chunk while they fit. If the next sentence does not fit and
+      the chunk holds a paragraph end that leaves it at least `min_paragraph_fill` full,
+      the chunk ends at that paragraph instead.
+    * The next chunk starts with the last sentences of the previous one, up to
+      `overlap_tokens` tokens, so context carries over without cutting sentences.
+
+    Chunks start and end on non-whitespace characters. Every character of the text is
+    scanned a bounded number of times, so chunking is linear in the text length. A text fed
+    to `stream` in pieces gets the same chunks, each returned once the sentence after it is
+    complete.
+    """
+
+    name = "structured"
+
+    def __init__(self, max_tokens: int = 384, overlap_tokens: int = 32, min_paragraph_fill: float = 0.5):
+        """
+        Args:
+            max_tokens: Token budget per chunk.
+            overlap_tokens: Maximum tokens of whole sentences repeated from the previous chunk.
+            min_paragraph_fill: Minimum fraction of `max_tokens` a chunk must hold to end
+                                early at a paragraph break.
+
+        Raises:
+            ValueError: If `overlap_tokens` is not smaller than `max_tokens`.
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("Overlap tokens must be smaller than max tokens.")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_paragraph_fill = min_paragraph_fill
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {
+            "chunker": self.name,
+            "max_tokens": self.max_tokens,
+            "overlap_tokens": self.overlap_tokens,
+            "min_paragraph_fill": self.min_paragraph_fill,
+        }
+
+    def _split_long_unit(self, text: str, start: int, end: int) -> List[Tuple[int, int, int]]:
+        # Splits text[start:end] between words, and words between characters, into budget-sized pieces
+        pieces: List[Tuple[int, int, int]] = []
+        piece_start, piece_end, piece_tokens = -1, -1, 0
+        for word in WORD_PATTERN.finditer(text, start, end):
+            word_tokens = count_tokens(text, word.start(), word.end())
+            if word_tokens > self.max_tokens:
+                if piece_start >= 0:
+                    pieces.append((piece_start, piece_end, piece_tokens))
+                    piece_start = -1
+                step = self.max_tokens * CHARACTERS_PER_TOKEN
+                for char_start in range(word.start(), word.end(), step):
+                    char_end = min(char_start + step, word.end())
+                    pieces.append((char_start, char_end, count_tokens(text, char_start, char_end)))
+                continue
+            if piece_start >= 0 and piece_tokens + word_tokens > self.max_tokens:
+                pieces.append((piece_start, piece_end, piece_tokens))
+                piece_start = -1
+            if piece_start < 0:
+                piece_start, piece_tokens = word.start(), 0
+            piece_end = word.end()
+            piece_tokens += word_tokens
+        if piece_start >= 0:
+            pieces.append((piece_start, piece_end, piece_tokens))
+        return pieces
+
+    def _units(self, text: str) -> List[Tuple[int, int, int, bool]]:
+        # Sentences as (start, end, tokens, ends a paragraph), without surrounding whitespace
+        units: List[Tuple[int, int, int, bool]] = []
+
+        def add_unit(start: int, end: int, paragraph_end: bool) -> None:
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start == end:
+                # Whitespace only; a paragraph break still ends the previous sentence's paragraph
+                if paragraph_end and units:
+                    units[-1] = units[-1][:3] + (True,)
+                return
+            tokens = count_tokens(text, start, end)
+            if tokens <= self.max_tokens:
+                units.append((start, end, tokens, paragraph_end))
+                return
+            pieces = self._split_long_unit(text, start, end)
+            units.extend((a, b, n, False) for a, b, n in pieces[:-1])
+            a, b, n = pieces[-1]
+            units.append((a, b, n, paragraph_end))
+
+        position = 0
+        for boundary in BOUNDARY_PATTERN.finditer(text):
+            add_unit(position, boundary.start(), boundary.group().count("\n") >= 2)
+            position = boundary.end()
+        add_unit(position, len(text), True)
+        return units
+
+    def _pack(
+        self, units: List[Tuple[int, int, int, bool]], new_first: int = 0, final: bool = True
+    ) -> Tuple[List[Tuple[int, int]], int, int]:
+        # Packs sentences into chunks. Unless `final`, more sentences follow `units`, and packing
+        # stops at the first chunk they could change. Returns the chunk offsets and, for the
+        # unfinished chunk, its first sentence and its first one not in the previous chunk
+        min_paragraph_tokens = self.min_paragraph_fill * self.max_tokens
+
+        chunk_offsets: List[Tuple[int, int]] = []
+        first = 0
+        while first < len(units):
+            # Take sentences while they fit, remembering the last paragraph end after the overlap
+            end, tokens, paragraph_end = first, 0, -1
+            while end < len(units) and (end == first or tokens + units[end][2] <= self.max_tokens):
+                tokens += units[end][2]
+                if units[end][3] and end >= new_first and tokens >= min_paragraph_tokens:
+                    paragraph_end = end
+                end += 1
+            if end == len(units) and not final:
+                break
+            if end < len(units) and paragraph_end >= 0:
+                end = paragraph_end + 1
+
+            chunk_offsets.append((units[first][0], units[end - 1][1]))
+            if end == len(units):
+                first = new_first = end
+                break
+
+            # Repeat the last whole sentences of this chunk, leaving room for the next sentence
+            overlap_budget = min(self.overlap_tokens, self.max_tokens - units[end][2])
+            next_first, overlap = end, 0
+            while next_first - 1 > first and overlap + units[next_first - 1][2] <= overlap_budget:
+                next_first -= 1
+                overlap += units[next_first][2]
+            first, new_first = next_first, end
+
+        return chunk_offsets, first, new_first
+
+    def chunk_offsets(self, text: str) -> Dict[int, Tuple[int, int]]:
+        chunk_offsets, _, _ = self._pack(self._units(text))
+        return dict(enumerate(chunk_offsets, start=1))
+
+    def stream(self) -> ChunkStream:
+        return _StructuredChunkStream(self)
+
+
+class _StructuredChunkStream(ChunkStream):
+    # Keeps the sentences of the unfinished chunk, and the text of the last sentence, which the
+    # next piece may continue. Sentences before it are final: sentence boundaries only depend
+    # on the characters around them.
+
+    def __init__(self, chunker: StructuredChunker):
+        super().__init__(chunker)
+        self._text = ""  # Text from the start of the last sentence on
+        self._text_start = 0  # Offset of self._text
+        self._units: List[Tuple[int, int, int, bool]] = []  # Final sentences from the unfinished chunk's first
+        self._new_first = 0
+
+    @property
+    def pending_start(self) -> int:
+        return self._units[0][0] if self._units else self._text_start
+
+    def _chunks(self, final: bool) -> List[Tuple[int, int]]:
+        units = self.chunker._units(self._text)
+        tail = len(self._text)
+        if units and not final:
+            tail = units.pop()[0]
+        self._units.extend(
+            (start + self._text_start, end + self._text_start, tokens, paragraph_end)
+            for start, end, tokens, paragraph_end in units
+        )
+        self._text = self._text[tail:]
+        self._text_start += tail
+
+        chunk_offsets, first, new_first = self.chunker._pack(self._units, self._new_first, final)
+        self._units = self._units[first:]
+        self._new_first = new_first - first
+        return chunk_offsets
+
+    def feed(self, text: str) -> List[Tuple[int, int]]:
+        self._text += text
+        return self._chunks(final=False)
+
+    def finish(self) -> List[Tuple[int, int]]:
+        return self._chunks(final=True)
+
+
+def join_page_texts(page_texts: Iterable[str]) -> str:
+    """
+    Joins the texts of consecutive pages into the document text `DocumentChunker` chunks:
+    pages follow each other directly, with `PAGE_SEPARATOR` after a page that does not end
+    with whitespace. Empty pages are skipped.
+    """
+    parts: List[str] = []
+    for text in page_texts:
+        if text:
+            if parts and not parts[-1][-1].isspace():
+                parts.append(PAGE_SEPARATOR)
+            parts.append(text)
+    return "".join(parts)
+
+
+class DocumentChunk:
+    """
+    A chunk of a document chunked by `DocumentChunker`.
+    """
+
+    def __init__(self, page_num: int, end_page_num: int, chunk_number: int, start: int, end: int, text: str):
+        self.page_num = page_num  # Page the chunk starts on
+        self.end_page_num = end_page_num  # Page the chunk ends on
+        self.chunk_number = chunk_number  # Number among the chunks starting on page_num, from 1
+        # Offsets into the text of page_num, running on into the following pages as joined
+        # by `join_page_texts` when the chunk crosses a page break
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+class DocumentChunker:
+    """
+    Chunks the pages of a document as one text (see `join_page_texts`), so a passage crossing
+    a page break becomes one chunk instead of the truncated end of one page's chunks and the
+    start of the next's, and pages no longer end in a small leftover chunk.
+
+    Pages are added in order. Every chunk is returned as soon as the following pages can no
+    longer change it, with the pages it spans; the chunks are those the chunker returns for
+    the whole document text. Only the pages of unfinished chunks are kept in memory.
+    """
+
+    def __init__(self, chunker: TextChunker):
+        """
+        Args:
+            chunker: The text chunker, e.g. from `create_chunker`.
+        """
+        self._stream = chunker.stream()
+        self._page_nums: List[int] = []  # Kept pages
+        self._page_starts: List[int] = []  # Offsets of every kept page in the document text
+        self._page_ends: List[int] = []
+        self._text = ""  # Document text from the first kept page on
+        self._text_start = 0
+        self._ends_with_text = False  # Whether the last non-empty page ends without whitespace
+        self._chunk_counts: Dict[int, int] = {}  # Chunks starting on each page so far
+
+    def _page_index(self, offset: int) -> int:
+        # Kept page holding the character at `offset`, or the separator there
+        index = bisect.bisect_right(self._page_starts, offset) - 1
+        while index > 0 and self._page_starts[index] == self._page_ends[index]:
+            index -= 1  # Empty pages hold no characters
+        return index
+
+    def _document_chunks(self, chunk_offsets: List[Tuple[int, int]]) -> List[DocumentChunk]:
+        chunks = []
+        for start, end in chunk_offsets:
+            first_page, last_page = self._page_index(start), self._page_index(end - 1)
+            if end > self._page_ends[last_page]:
+                # Ends in the separator before the next non-empty page
+                last_page = bisect.bisect_left(self._page_starts, end)
+            page_num, page_start = self._page_nums[first_page], self._page_starts[first_page]
+            self._chunk_counts[page_num] = self._chunk_counts.get(page_num, 0) + 1
+            chunks.append(
+                DocumentChunk(
+                    page_num,
+                    self._page_nums[last_page],
+                    self._chunk_counts[page_num],
+                    start - page_start,
+                    end - page_start,
+                    self._text[start - self._text_start : end - self._text_start],
+                )
+            )
+        return chunks
+
+    def add_page(self, page_num: int, text: str) -> List[DocumentChunk]:
+        """
+        Adds the next page of the document.
+
+        Args:
+            page_num: The page number, e.g. 0-based.
+            text: The page text.
+
+        Returns:
+            The chunks this page completes.
+        """
+        separator = PAGE_SEPARATOR if text and self._ends_with_text else ""
+        if text:
+            self._ends_with_text = not text[-1].isspace()
+        self._page_nums.append(page_num)
+        self._page_starts.append(self._text_start + len(self._text) + len(separator))
+        self._page_ends.append(self._page_starts[-1] + len(text))
+        self._text += separator + text
+        chunks = self._document_chunks(self._stream.feed(separator + text))
+
+        # Drop the pages no chunk can start on anymore
+        keep = self._page_index(self._stream.pending_start)
+        if keep > 0:
+            del self._page_nums[:keep], self._page_starts[:keep], self._page_ends[:keep]
+            self._text = self._text[self._page_starts[0] - self._text_start :]
+            self._text_start = self._page_starts[0]
+        return chunks
+
+    def finish(self) -> List[DocumentChunk]:
+        """Returns the remaining chunks, once every page is added."""
+        return self._document_chunks(self._stream.finish())
+
+
+def create_chunker(name: str = "structured", **params) -> TextChunker:
+    """
+    Creates a text chunker.
+
+    Args:
+        name: One of `CHUNKERS`.
+        **params: Parameters of the chunker class (e.g. max_tokens and overlap_tokens for
+                  "structured", character_limit and overlap for "fixed").
+
+    Returns:
+        The chunker.
+
+    Raises:
+        ValueError: If `name` is not supported.
+    """
+    if name == "structured":
+        return StructuredChunker(**params)
+    if name == "fixed":
+        return FixedCharacterChunker(**params)
+    raise ValueError(f"Unsupported chunker {name!r}, expected one of {CHUNKERS}.")
@@ -0,0 +1,286 @@
+import abc
+import hashlib
+import re
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+# Embedding backends. Vertex AI is only imported when the Vertex backend is first used.
+
+EMBEDDING_BACKENDS = ("vertex", "local")
+
+
+class EmbeddingBackend(abc.ABC):
+    """
+    Base class of the embedding backends: text and image embedding calls of one model pair.
+
+    `utils` batches, caches and rate-limits the calls; a backend only embeds what it is given.
+    """
+
+    name = ""
+    # Whether calls consume a remote quota and go through `utils.vertex_rate_limiter`
+    rate_limited = False
+
+    def __init__(self, text_model_name: str, image_model_name: str, text_dimension: int):
+        self.text_model_name = text_model_name
+        self.image_model_name = image_model_name
+        self.text_dimension = text_dimension
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the text embedding space, e.g. in the vector store metadata."""
+        return f"{self.name}:{self.text_model_name}:{self.text_dimension}"
+
+    @abc.abstractmethod
+    def get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts in one call.
+
+        Args:
+            texts: The texts to be embedded.
+
+        Returns:
+            One `text_dimension`-dimensional embedding per text, in the same order.
+        """
+
+    @abc.abstractmethod
+    def get_image_embedding(
+        self,
+        image_uri: str,
+        image_bytes: Optional[bytes],
+        text: Optional[str],
+        dimension: int,
+    ) -> List[float]:
+        """
+        Embeds an image, optionally guided by contextual text.
+
+        Args:
+            image_uri: The image URI (local path, URL or gs:// URI).
+            image_bytes: The image content, None for gs:// URIs.
+            text: Optional contextual text.
+            dimension: The embedding dimension.
+
+        Returns:
+            The image embedding.
+        """
+
+
+class VertexEmbeddingBackend(EmbeddingBackend):
+    """
+    Vertex AI text and multimodal embedding models, loaded once on first use.
+    """
+
+    name = "vertex"
+    rate_limited = True
+
+    def __init__(
+        self,
+        project: str,
+        location: str,
+        text_model_name: str = "text-embedding-004",
+        image_model_name: str = "multimodalembedding",
+        text_dimension: int = 768,
+    ):
+        """
+        Args:
+            project: The Google Cloud project passed to `vertexai.init`.
+            location: The Google Cloud region passed to `vertexai.init`.
+            text_model_name: The text embedding model.
+            image_model_name: The multimodal embedding model.
+            text_dimension: The dimension of the text embeddings.
+        """
+        super().__init__(text_model_name, image_model_name, text_dimension)
+        self.project = project
+        self.location = location
+
+        self._lock = threading.RLock()
+        self._initialized = False
+        self._models: Dict[str, Any] = {}
+
+    def init_vertexai(self) -> None:
+        """
+        Initializes the Vertex AI SDK once, authenticating first on Google Colab.
+        """
+        with self._lock:
+            if self._initialized:
+                return
+
+            import vertexai
+
+            # Additional authentication is required for Google Colab
+            if "google.colab" in sys.modules:
+                # Authenticate user to Google Cloud
+                from google.colab import auth
+                auth.authenticate_user()
+
+            vertexai.init(project=self.project, location=self.location)
+            self._initialized = True
+
+    def _get_model(self, model_name: str, load_model: Callable[[], Any]) -> Any:
+        # Double-checked locking: only the first caller loads, concurrent callers wait for it
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    self.init_vertexai()
+                    model = load_model()
+                    self._models[model_name] = model
+        return model
+
+    def get_text_embedding_model(self):
+        """Returns the text embedding model, loading it on first use. Thread-safe."""
+
+        def load_model():
+            from vertexai.language_models import TextEmbeddingModel
+
+            return TextEmbeddingModel.from_pretrained(self.text_model_name)
+
+        return self._get_model(self.text_model_name, load_model)
+
+    def get_multimodal_embedding_model(self):
+        """
+        Returns the multimodal embedding model, loading it on first use. Thread-safe.
+        Works with image, image with caption (~32 words), video and video with caption (~32 words).
+        """
+
+        def load_model():
+            from vertexai.vision_models import MultiModalEmbeddingModel
+
+            return MultiModalEmbeddingModel.from_pretrained(self.image_model_name)
+
+        return self._get_model(self.image_model_name, load_model)
+
+    def get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.get_text_embedding_model().get_embeddings(texts)
+        return [embedding.values for embedding in embeddings]
+
+    def get_image_embedding(
+        self,
+        image_uri: str,
+        image_bytes: Optional[bytes],
+        text: Optional[str],
+        dimension: int,
+    ) -> List[float]:
+        from vertexai.vision_models import Image as vision_model_Image
+
+        if image_bytes is None:
+            image = vision_model_Image.load_from_file(image_uri)
+        else:
+            image = vision_model_Image(image_bytes=image_bytes)
+
+        embeddings = self.get_multimodal_embedding_model().get_embeddings(
+            image=image,
+            contextual_text=text,
+            dimension=dimension,  # 128, 256, 512, 1408
+        )
+        return embeddings.image_embedding
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Offline, deterministic stand-in for the Vertex AI models, for load tests and benchmarks
+    on machines without network access.
+
+    * Text: signed feature hashing of word unigrams and bigrams into `text_dimension`
+      buckets, L2-normalized. Texts sharing words get similar vectors, so retrieval
+      results stay meaningful for lexical matches.
+    * Image: a byte histogram of the image content mapped to `dimension` by a fixed random
+      projection, plus the hashed contextual text, L2-normalized.
+
+    Vectors only depend on the input and the dimension, across processes and machines.
+    """
+
+    name = "local"
+
+    def __init__(self, text_dimension: int = 768, seed: int = 0):
+        """
+        Args:
+            text_dimension: The dimension of the text embeddings.
+            seed: Seed of the image random projections.
+        """
+        super().__init__("hashed-ngram", "random-projection", text_dimension)
+        self.seed = seed
+        self._projections: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _hash_features(self, text: str, dimension: int) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+        vector = np.zeros(dimension, dtype=np.float32)
+        if not features:
+            return vector
+
+        # Stable 64-bit hashes (Python's hash() is salted per process)
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                for feature in features
+            ),
+            dtype=np.uint64,
+            count=len(features),
+        )
+        buckets = (hashes % np.uint64(dimension)).astype(np.int64)
+        signs = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, buckets, signs)
+        return vector
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [
+            self._normalize(self._hash_features(text, self.text_dimension)).tolist()
+            for text in texts
+        ]
+
+    def _projection(self, dimension: int) -> np.ndarray:
+        with self._lock:
+            if dimension not in self._projections:
+                rng = np.random.default_rng(self.seed + dimension)
+                self._projections[dimension] = rng.standard_normal((256, dimension), dtype=np.float32)
+            return self._projections[dimension]
+
+    def get_image_embedding(
+        self,
+        image_uri: str,
+        image_bytes: Optional[bytes],
+        text: Optional[str],
+        dimension: int,
+    ) -> List[float]:
+        content = image_bytes if image_bytes is not None else image_uri.encode("utf-8")
+        histogram = np.bincount(np.frombuffer(content, dtype=np.uint8), minlength=256)
+        histogram = histogram.astype(np.float32) / max(len(content), 1)
+
+        vector = self._normalize(histogram @ self._projection(dimension))
+        if text:
+            vector = vector + self._normalize(self._hash_features(text, dimension))
+        return self._normalize(vector).tolist()
+
+
+def create_embedding_backend(name: str, **params) -> EmbeddingBackend:
+    """
+    Creates an embedding backend.
+
+    Args:
+        name: One of `EMBEDDING_BACKENDS`.
+        **params: Parameters of the backend class (e.g. project and location for "vertex",
+                  text_dimension for "local").
+
+    Returns:
+        The backend.
+
+    Raises:
+        ValueError: If `name` is not supported.
+    """
+    if name == "vertex":
+        return VertexEmbeddingBackend(**params)
+    if name == "local":
+        return LocalEmbeddingBackend(**params)
+    raise ValueError(f"Unsupported embedding backend {name!r}, expected one of {EMBEDDING_BACKENDS}.")
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+
+def get_embedding_cache_key(
+    content: Union[str, bytes], model_name: str, dimension: Optional[int]
+) -> str:
+    """
+    Builds a cache key from the content hash, the embedding model name and the embedding dimension.
+
+    Args:
+        content: The embedded content (text, or raw image bytes plus contextual text).
+        model_name: The name of the embedding model.
+        dimension: The embedding dimension requested from the model.
+
+    Returns:
+        A hex SHA-256 digest identifying the embedding.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}\0{dimension}\0".encode("utf-8"))
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU tier in front of a persistent SQLite tier.
+
+    Embeddings are stored as float32. Disk hits are promoted into the memory tier.
+    All methods are thread-safe.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, max_memory_items: int = 100_000):
+        """
+        Args:
+            cache_path: Path of the SQLite file backing the disk tier. No disk tier when None.
+            max_memory_items: Maximum number of embeddings held in the memory tier.
+        """
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if cache_path is not None:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Looks up embeddings for many keys.
+
+        Args:
+            keys: The cache keys to look up.
+
+        Returns:
+            A dictionary with an entry for every key found in either tier.
+        """
+        keys = list(keys)
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            missing: List[str] = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+            if self._db is not None and missing:
+                # Stay below SQLite's bound-parameter limit
+                for i in range(0, len(missing), 500):
+                    batch = missing[i : i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        embedding = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = embedding
+                        self._remember(key, embedding)
+                        self._stats["disk_hits"] += 1
+
+            self._stats["misses"] += sum(1 for key in missing if key not in found)
+
+        return found
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Looks up the embedding for one key, returning None on a miss."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Union[list, np.ndarray]]) -> None:
+        """
+        Stores embeddings in both tiers.
+
+        Args:
+            items: A dictionary mapping cache keys to embeddings.
+        """
+        if not items:
+            return
+
+        embeddings = {
+            key: np.asarray(embedding, dtype=np.float32) for key, embedding in items.items()
+        }
+
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._remember(key, embedding)
+
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+                    [(key, embedding.tobytes()) for key, embedding in embeddings.items()],
+                )
+                self._db.commit()
+
+    def put(self, key: str, embedding: Union[list, np.ndarray]) -> None:
+        """Stores the embedding for one key."""
+        self.put_many({key: embedding})
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Returns hit/miss counters.
+
+        Returns:
+            A dictionary with memory_hits, disk_hits, misses, hit_rate and memory_items.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class IngestionJob:
+    """
+    State of one queued ingestion job.
+    """
+
+    def __init__(self, job_id: str, pdf_folder_path: str, file_names: List[str]):
+        self.job_id = job_id
+        self.pdf_folder_path = pdf_folder_path
+        self.file_names = file_names
+        self.status = "queued"  # queued -> running -> completed | failed
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Dict[str, Any] = {}  # Latest progress event
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        """
+        Records a progress event and pushes it to every subscriber. Safe to call from any thread.
+        """
+        event = dict(event, job_id=self.job_id, status=self.status)
+        with self._lock:
+            self.progress = event
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's event loop is closed
+                self.unsubscribe(queue)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Returns a queue receiving this job's progress events on the running event loop.
+        The latest event, if any, is delivered first.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            if self.progress:
+                queue.put_nowait(self.progress)
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers = [
+                (loop, subscriber)
+                for loop, subscriber in self._subscribers
+                if subscriber is not queue
+            ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "file_names": self.file_names,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+        }
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs on a bounded pool of worker threads.
+
+    Jobs are queued on submission and picked up by at most `max_workers` workers, so
+    request handlers return immediately and several uploads can be ingested concurrently.
+
+    Finished jobs are kept for `finished_job_ttl` seconds so clients can read their final
+    status, and at most `max_finished_jobs` of them are kept; older ones are evicted (oldest
+    first) and become unknown to `get`.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[IngestionJob], Any],
+        max_workers: int = 2,
+        finished_job_ttl: float = 3600.0,
+        max_finished_jobs: int = 1000,
+    ):
+        """
+        Args:
+            process_fn: Function running the ingestion of one job. Called on a worker thread.
+            max_workers: Maximum number of jobs processed at the same time.
+            finished_job_ttl: Seconds a completed or failed job is kept after it finished.
+            max_finished_jobs: Maximum number of completed or failed jobs kept.
+        """
+        self.process_fn = process_fn
+        self.finished_job_ttl = finished_job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingestion"
+        )
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._finished_job_ids: Deque[str] = deque()  # In finishing order
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex
+
+    def submit(
+        self, pdf_folder_path: str, file_names: List[str], job_id: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queues a job ingesting the PDFs in `pdf_folder_path`.
+
+        Args:
+            pdf_folder_path: Folder holding the uploaded PDFs of this job.
+            file_names: Names of the uploaded files.
+            job_id: Optional pre-generated job ID (see `new_job_id`).
+
+        Returns:
+            The queued job.
+        """
+        job = IngestionJob(job_id or self.new_job_id(), pdf_folder_path, file_names)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: IngestionJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            self.process_fn(job)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            job.add_event(dict(job.progress, event=job.status, error=job.error))
+            with self._lock:
+                self._finished_job_ids.append(job.job_id)
+                self._evict_finished_jobs()
+
+    def _evict_finished_jobs(self) -> None:
+        # Drops finished jobs past their TTL or beyond the count limit, oldest first; holds _lock
+        expired_before = time.time() - self.finished_job_ttl
+        while self._finished_job_ids and (
+            len(self._finished_job_ids) > self.max_finished_jobs
+            or self._jobs[self._finished_job_ids[0]].finished_at < expired_before
+        ):
+            del self._jobs[self._finished_job_ids.popleft()]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Returns a job, None if it is unknown or was evicted."""
+        with self._lock:
+            self._evict_finished_jobs()
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestionJob]:
+        with self._lock:
+            self._evict_finished_jobs()
+            return list(self._jobs.values())
+
+    @property
+    def in_progress(self) -> bool:
+        return any(not job.done for job in self.list_jobs())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
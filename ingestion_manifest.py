@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+
+def get_file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Hashes a file's content.
+
+    Args:
+        path: The file path.
+        block_size: Bytes read at a time.
+
+    Returns:
+        A hex SHA-256 digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_page_hash(text: str) -> str:
+    """Returns a hex SHA-256 digest of a page text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestionManifest:
+    """
+    Persistent record of what has been ingested, used to skip unchanged content.
+
+    For every file: its size and modification time (checked first, without reading the
+    file), its content hash, its number of pages, the chunking parameters it was ingested
+    with and one hash per page text. A file is re-processed only when its content changed
+    or it was ingested with other chunking parameters, and its rows are only replaced when
+    the text of a page changed.
+
+    The manifest does not store row numbers: the rows of a file or page are looked up in
+    the vector store, so a run interrupted between the store commit and the manifest
+    update is repaired by the next run. Backed by SQLite; all methods are thread-safe.
+    `lock` serializes a store commit with its manifest update across ingestion jobs.
+    """
+
+    def __init__(self, manifest_path: str):
+        """
+        Args:
+            manifest_path: Path of the SQLite file holding the manifest.
+        """
+        self.lock = threading.RLock()
+
+        manifest_dir = os.path.dirname(manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        self._db = sqlite3.connect(manifest_path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_name TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                num_pages INTEGER NOT NULL,
+                chunking TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                file_name TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                page_hash TEXT NOT NULL,
+                PRIMARY KEY (file_name, page_num)
+            );
+            """
+        )
+        self._db.commit()
+
+    def get_file(self, file_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Looks up the record of a file.
+
+        Returns:
+            A dictionary with file_hash, size, mtime_ns, num_pages and chunking (the chunking
+            parameters), or None if the file is not in the manifest.
+        """
+        with self.lock:
+            row = self._db.execute(
+                "SELECT file_hash, size, mtime_ns, num_pages, chunking FROM files WHERE file_name = ?",
+                (file_name,),
+            ).fetchone()
+        if row is None:
+            return None
+        file_hash, size, mtime_ns, num_pages, chunking = row
+        return {
+            "file_hash": file_hash,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "num_pages": num_pages,
+            "chunking": json.loads(chunking),
+        }
+
+    def get_page_hashes(self, file_name: str) -> Dict[int, str]:
+        """Returns the text hash of every page of a file, keyed by 0-based page number."""
+        with self.lock:
+            rows = self._db.execute(
+                "SELECT page_num, page_hash FROM pages WHERE file_name = ?", (file_name,)
+            ).fetchall()
+        return dict(rows)
+
+    def file_names(self) -> List[str]:
+        """Returns the names of all files in the manifest."""
+        with self.lock:
+            return [row[0] for row in self._db.execute("SELECT file_name FROM files")]
+
+    def update_file_stat(self, file_name: str, size: int, mtime_ns: int) -> None:
+        """Records a new size and modification time for a file whose content is unchanged."""
+        with self.lock:
+            self._db.execute(
+                "UPDATE files SET size = ?, mtime_ns = ? WHERE file_name = ?",
+                (size, mtime_ns, file_name),
+            )
+            self._db.commit()
+
+    def record_file(
+        self,
+        file_name: str,
+        file_hash: str,
+        size: int,
+        mtime_ns: int,
+        chunking: Dict[str, Any],
+        page_hashes: Dict[int, str],
+    ) -> None:
+        """
+        Replaces the record of a file and its pages.
+
+        Args:
+            file_name: The file name.
+            file_hash: The content hash (see `get_file_hash`).
+            size: The file size in bytes.
+            mtime_ns: The modification time in nanoseconds.
+            chunking: The chunking parameters the file was ingested with.
+            page_hashes: The text hash of every page (see `get_page_hash`), keyed by 0-based page number.
+        """
+        with self.lock:
+            self._db.execute("DELETE FROM pages WHERE file_name = ?", (file_name,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (file_name, file_hash, size, mtime_ns, num_pages, chunking) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_name, file_hash, size, mtime_ns, len(page_hashes), json.dumps(chunking, sort_keys=True)),
+            )
+            self._db.executemany(
+                "INSERT INTO pages (file_name, page_num, page_hash) VALUES (?, ?, ?)",
+                [(file_name, page_num, page_hash) for page_num, page_hash in page_hashes.items()],
+            )
+            self._db.commit()
+
+    def remove_file(self, file_name: str) -> None:
+        """Removes a file and its pages from the manifest."""
+        with self.lock:
+            self._db.execute("DELETE FROM pages WHERE file_name = ?", (file_name,))
+            self._db.execute("DELETE FROM files WHERE file_name = ?", (file_name,))
+            self._db.commit()
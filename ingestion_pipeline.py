@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class PipelineStage:
+    """
+    One stage of an ingestion pipeline: a function applied to every item by a number of worker threads.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        """
+        Args:
+            name: Name of the stage, used in the stats.
+            fn: Function applied to every item. Its return value is passed to the next stage;
+                returning None drops the item.
+            workers: Number of threads running this stage.
+        """
+        if workers < 1:
+            raise ValueError("A pipeline stage needs at least one worker.")
+
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class _StopPipeline(Exception):
+    # Raised inside worker threads once another stage has failed
+    pass
+
+
+class Pipeline:
+    """
+    Streams items through a chain of stages connected by bounded queues.
+
+    Every stage runs on its own worker threads, so while one stage waits on the network
+    (e.g. embedding calls) the others keep parsing and writing. Queues hold at most
+    `queue_size` items: a slow stage blocks the stages feeding it instead of letting
+    work pile up in memory. End-to-end time then approaches the time of the slowest
+    stage rather than the sum of all stages.
+
+    The first exception raised by a stage stops the pipeline and is re-raised by `run`.
+    """
+
+    def __init__(self, stages: List[PipelineStage], queue_size: int = 16):
+        """
+        Args:
+            stages: The stages, in order. The return values of the last stage are discarded.
+            queue_size: Maximum number of items waiting in front of each stage.
+        """
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self._done = object()  # End-of-stream marker
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def _put(self, item_queue: queue.Queue, item: Any) -> None:
+        while True:
+            if self._stop.is_set():
+                raise _StopPipeline()
+            try:
+                item_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, item_queue: queue.Queue) -> Any:
+        while True:
+            if self._stop.is_set():
+                raise _StopPipeline()
+            try:
+                return item_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _fail(self, error: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _feed(self, items: Iterable[Any], first_queue: queue.Queue, num_workers: int) -> None:
+        try:
+            for item in items:
+                self._put(first_queue, item)
+            for _ in range(num_workers):
+                self._put(first_queue, self._done)
+        except _StopPipeline:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(
+        self,
+        stage_index: int,
+        in_queue: queue.Queue,
+        out_queue: Optional[queue.Queue],
+        finished: List[int],
+        finished_lock: threading.Lock,
+    ) -> None:
+        stage = self.stages[stage_index]
+        stats = self._stats[stage.name]
+
+        try:
+            while True:
+                item = self._get(in_queue)
+                if item is self._done:
+                    break
+
+                start = time.perf_counter()
+                result = stage.fn(item)
+                busy = time.perf_counter() - start
+
+                with finished_lock:
+                    stats["items"] += 1
+                    stats["busy_seconds"] += busy
+
+                if out_queue is not None and result is not None:
+                    self._put(out_queue, result)
+
+            # The last worker of a stage to finish closes the next stage
+            with finished_lock:
+                finished[0] += 1
+                last_worker = finished[0] == stage.workers
+            if last_worker and out_queue is not None:
+                for _ in range(self.stages[stage_index + 1].workers):
+                    self._put(out_queue, self._done)
+        except _StopPipeline:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, items: Iterable[Any]) -> Dict[str, Any]:
+        """
+        Pushes `items` through every stage and waits until all of them are processed.
+
+        Args:
+            items: Input items of the first stage. Consumed lazily, at the pace of the pipeline.
+
+        Returns:
+            A dictionary with the wall time and, per stage, the number of items processed and
+            the time spent processing them (summed over the stage's workers).
+
+        Raises:
+            The first exception raised by a stage or by iterating `items`.
+        """
+        self._stop = threading.Event()
+        self._error = None
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._stats = {
+            stage.name: {"workers": stage.workers, "items": 0, "busy_seconds": 0.0}
+            for stage in self.stages
+        }
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=self._feed,
+                args=(items, queues[0], self.stages[0].workers),
+                name="pipeline-feed",
+                daemon=True,
+            )
+        ]
+        for stage_index, stage in enumerate(self.stages):
+            out_queue = queues[stage_index + 1] if stage_index + 1 < len(self.stages) else None
+            finished = [0]
+            finished_lock = threading.Lock()
+            for worker in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage_index, queues[stage_index], out_queue, finished, finished_lock),
+                        name=f"pipeline-{stage.name}-{worker}",
+                        daemon=True,
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        for stats in self._stats.values():
+            stats["busy_seconds"] = round(stats["busy_seconds"], 4)
+        return {"wall_seconds": round(time.perf_counter() - start, 4), "stages": self._stats}
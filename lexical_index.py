@@ -0,0 +1,304 @@
+import copy
+import json
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+# Lexical (keyword) retrieval: a BM25 inverted index over chunk texts, and reciprocal-rank
+# fusion of its rankings with the dense ones. Rows are numbered like `ann_index` rows.
+
+# Words, and identifiers joined by - . / : (part numbers, versions, paths) as one token
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+WORD_PATTERN = re.compile(r"\w+")
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase index terms.
+
+    An identifier such as "XJ-42.7b" yields the whole identifier and its parts ("xj-42.7b",
+    "xj", "42", "7b"), so exact identifiers rank first while their parts still match.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = WORD_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def _merge_scores(
+    rows: np.ndarray, scores: np.ndarray, other_rows: np.ndarray, other_scores: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Sums the scores of two ascending row lists into one ascending row list, in time linear
+    # in the longer list: the shorter list is located in the longer one by binary search
+    if len(rows) > len(other_rows):
+        rows, scores, other_rows, other_scores = other_rows, other_scores, rows, scores
+    if len(rows) == 0:
+        return other_rows, other_scores
+    positions = np.searchsorted(other_rows, rows)
+    found = positions < len(other_rows)
+    found[found] = other_rows[positions[found]] == rows[found]
+
+    merged_scores = other_scores.copy()
+    merged_scores[positions[found]] += scores[found]
+    return (
+        np.insert(other_rows, positions[~found], rows[~found]),
+        np.insert(merged_scores, positions[~found], scores[~found]),
+    )
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index.
+
+    Postings are kept in compressed sparse row (CSR) layout: for term t, rows
+    `row_ids[indptr[t]:indptr[t + 1]]` (int32, ascending) contain it `term_freqs[...]` times
+    (uint16), i.e. 6 bytes per posting. A query only reads the postings of its own terms,
+    so its cost depends on how common the query terms are, not on the corpus size.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            k1: Term frequency saturation.
+            b: Document length normalization, 0 (none) to 1 (full).
+        """
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._row_ids = np.empty(0, dtype=np.int32)
+        self._term_freqs = np.empty(0, dtype=np.uint16)
+        self._row_lengths = np.empty(0, dtype=np.int32)
+        self._update_weights()
+
+    def __len__(self) -> int:
+        return len(self._row_lengths)
+
+    @property
+    def num_terms(self) -> int:
+        return len(self._terms)
+
+    def _update_weights(self) -> None:
+        # Inverse document frequency per term and the length-normalized k1 per row
+        num_rows = len(self._row_lengths)
+        document_freqs = np.diff(self._indptr).astype(np.float32)
+        self._idf = np.log1p((num_rows - document_freqs + 0.5) / (document_freqs + 0.5)).astype(np.float32)
+
+        average_length = float(self._row_lengths.mean()) if num_rows else 0.0
+        self._row_norms = (
+            self.k1 * (1 - self.b + self.b * self._row_lengths / max(average_length, 1e-9))
+        ).astype(np.float32)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """
+        Appends rows to the index, numbered after the existing ones.
+
+        Args:
+            texts: The row texts, e.g. the chunk_text column.
+        """
+        first_row = len(self)
+        term_ids, row_ids, term_freqs, row_lengths = [], [], [], []
+        for row, text in enumerate(texts, start=first_row):
+            terms = tokenize(text)
+            row_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                term_id = self._terms.setdefault(term, len(self._terms))
+                term_ids.append(term_id)
+                row_ids.append(row)
+                term_freqs.append(min(freq, MAX_TERM_FREQUENCY))
+        if not row_lengths:
+            return
+
+        # Merge with the existing postings: a stable sort by term keeps the row ids of every
+        # term ascending, as the new rows come after the existing ones
+        num_terms = len(self._terms)
+        all_term_ids = np.concatenate(
+            [
+                np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr)),
+                np.asarray(term_ids, dtype=np.int32),
+            ]
+        )
+        order = np.argsort(all_term_ids, kind="stable")
+        self._row_ids = np.concatenate([self._row_ids, np.asarray(row_ids, dtype=np.int32)])[order]
+        self._term_freqs = np.concatenate([self._term_freqs, np.asarray(term_freqs, dtype=np.uint16)])[order]
+        self._indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(all_term_ids, minlength=num_terms))]
+        ).astype(np.int64)
+        self._row_lengths = np.concatenate([self._row_lengths, np.asarray(row_lengths, dtype=np.int32)])
+        self._update_weights()
+
+    def _term_scores(self, term_id: int, rows: np.ndarray, freqs: np.ndarray) -> np.ndarray:
+        freqs = freqs.astype(np.float32)
+        return self._idf[term_id] * freqs * (self.k1 + 1) / (freqs + self._row_norms[rows])
+
+    def search(self, query: str, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rows with the highest BM25 scores for a text query.
+
+        Terms are scored from the rarest to the most common (MaxScore pruning): once the
+        best score the remaining terms could add is below the current top_n-th score, rows
+        they alone match cannot enter the results, so those terms are only looked up for the
+        candidate rows instead of scoring all of their postings.
+
+        Args:
+            query: The text query.
+            top_n: The number of rows to return.
+
+        Returns:
+            A tuple of the row ids and their BM25 scores, sorted by descending score.
+            Only rows containing at least one query term are returned.
+        """
+        indptr, row_ids, term_freqs = self._indptr, self._row_ids, self._term_freqs
+        term_ids = np.array(
+            sorted({self._terms[term] for term in tokenize(query) if term in self._terms}), dtype=np.int64
+        )
+        if top_n <= 0 or len(term_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # A term adds at most idf * (k1 + 1) to a row's score
+        term_ids = term_ids[np.argsort(-self._idf[term_ids], kind="stable")]
+        remaining_bounds = np.cumsum((self._idf[term_ids] * (self.k1 + 1))[::-1])[::-1]
+
+        rows = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float32)
+        dense = None  # Scores of all rows, once matches are too many to merge
+        for i, term_id in enumerate(term_ids):
+            if dense is None and len(rows) >= top_n:
+                threshold = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+                if remaining_bounds[i] < threshold:
+                    # Only candidates that can still reach the threshold need the remaining terms
+                    keep = scores + remaining_bounds[i] > threshold
+                    keep[np.argpartition(-scores, top_n - 1)[:top_n]] = True
+                    rows, scores = rows[keep], scores[keep]
+                    for term_id in term_ids[i:]:
+                        start, end = indptr[term_id], indptr[term_id + 1]
+                        term_rows = row_ids[start:end]
+                        positions = np.minimum(np.searchsorted(term_rows, rows), len(term_rows) - 1)
+                        found = term_rows[positions] == rows
+                        scores[found] += self._term_scores(
+                            term_id, rows[found], term_freqs[start:end][positions[found]]
+                        )
+                    break
+
+            start, end = indptr[term_id], indptr[term_id + 1]
+            term_rows = row_ids[start:end]
+            term_scores = self._term_scores(term_id, term_rows, term_freqs[start:end])
+            if dense is not None:
+                # Row ids are unique within a term's postings
+                dense[term_rows] += term_scores
+            elif min(len(rows), len(term_rows)) * 16 > len(self):
+                # Two long lists: accumulating into a dense array beats merging them
+                dense = np.zeros(len(self), dtype=np.float32)
+                dense[rows] = scores
+                dense[term_rows] += term_scores
+            else:
+                rows, scores = _merge_scores(rows, scores, term_rows, term_scores)
+
+        if dense is not None:
+            rows = np.flatnonzero(dense)
+            scores = dense[rows]
+
+        top_n = min(top_n, len(rows))
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top].astype(np.int64), scores[top]
+
+    def copy(self) -> "BM25Index":
+        """
+        Returns a copy that can be extended with `add` without changing this index, so
+        searches running on it stay consistent. Postings are shared, not copied.
+        """
+        index = copy.copy(self)
+        index._terms = dict(self._terms)
+        return index
+
+    def save(self, path: str) -> None:
+        """Saves the index to a .npz file."""
+        # The vocabulary is stored as one UTF-8 blob with term end offsets
+        encoded_terms = [term.encode("utf-8") for term in self._terms]
+        np.savez(
+            path,
+            params=json.dumps({"k1": self.k1, "b": self.b}),
+            terms=np.frombuffer(b"".join(encoded_terms), dtype=np.uint8),
+            term_ends=np.cumsum([len(term) for term in encoded_terms], dtype=np.int64),
+            indptr=self._indptr,
+            row_ids=self._row_ids,
+            term_freqs=self._term_freqs,
+            row_lengths=self._row_lengths,
+        )
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Returns the memory held by the index.
+
+        Returns:
+            A dictionary with the number of rows, terms and postings and the bytes of the
+            postings and of the per-term and per-row arrays (the vocabulary dict excluded).
+        """
+        arrays = [self._indptr, self._idf, self._row_lengths, self._row_norms]
+        return {
+            "count": len(self),
+            "num_terms": self.num_terms,
+            "num_postings": len(self._row_ids),
+            "postings_bytes": int(self._row_ids.nbytes + self._term_freqs.nbytes),
+            "bytes": int(self._row_ids.nbytes + self._term_freqs.nbytes + sum(array.nbytes for array in arrays)),
+        }
+
+
+def load_bm25_index(path: str) -> BM25Index:
+    """
+    Loads an index saved with `BM25Index.save`.
+
+    Args:
+        path: The .npz file.
+
+    Returns:
+        The index.
+    """
+    with np.load(path) as data:
+        index = BM25Index(**json.loads(str(data["params"])))
+        terms_blob = data["terms"].tobytes()
+        term_ends = data["term_ends"].tolist()
+        index._terms = {
+            terms_blob[start:end].decode("utf-8"): term_id
+            for term_id, (start, end) in enumerate(zip([0] + term_ends[:-1], term_ends))
+        }
+        index._indptr = data["indptr"]
+        index._row_ids = data["row_ids"]
+        index._term_freqs = data["term_freqs"]
+        index._row_lengths = data["row_lengths"]
+    index._update_weights()
+    return index
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[np.ndarray], top_n: int, k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses rankings of the same rows by reciprocal rank: a row scores sum(1 / (k + rank)) over
+    the rankings it appears in (rank starting at 1). Only ranks are used, so rankings with
+    incomparable scores (cosine, BM25) can be combined.
+
+    Args:
+        rankings: Row ids per ranking, best first.
+        top_n: The number of rows to return.
+        k: Damping constant; larger values flatten the difference between top ranks.
+
+    Returns:
+        A tuple of the row ids and their fused scores, sorted by descending score.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist(), start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+
+    # Ties keep the order rows were first ranked in
+    rows = sorted(fused, key=fused.get, reverse=True)[:top_n]
+    return np.asarray(rows, dtype=np.int64), np.asarray([fused[row] for row in rows], dtype=np.float32)
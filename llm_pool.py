@@ -0,0 +1,195 @@
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.runnables import RunnableConfig, RunnableSerializable
+from langchain_ollama.llms import OllamaLLM
+
+
+# (model, temperature, top_k, top_p, num_predict)
+LLMClientKey = Tuple[str, Optional[float], Optional[int], Optional[float], Optional[int]]
+
+
+class LLMClientPool:
+    """
+    Registry of OllamaLLM clients keyed by model and generation parameters.
+
+    All clients share one sync and one async HTTP transport, so keep-alive connections to
+    the Ollama server are reused across clients and requests. Clients unused for
+    `max_idle_seconds` are evicted.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_idle_seconds: float = 600,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+    ):
+        """
+        Args:
+            base_url: Ollama server URL. Defaults to OllamaLLM's default.
+            max_idle_seconds: Clients unused for longer than this are evicted.
+            max_connections: Maximum open connections of the shared transports.
+            max_keepalive_connections: Maximum idle keep-alive connections kept open.
+        """
+        self.base_url = base_url
+        self.max_idle_seconds = max_idle_seconds
+
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._transport = httpx.HTTPTransport(limits=limits)
+        self._async_transport = httpx.AsyncHTTPTransport(limits=limits)
+
+        self._clients: Dict[LLMClientKey, OllamaLLM] = {}
+        self._stats: Dict[LLMClientKey, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+    def get(
+        self,
+        model: str,
+        temperature: Optional[float] = None,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        num_predict: Optional[int] = None,
+    ) -> OllamaLLM:
+        """
+        Returns the pooled client for these parameters, creating it on first use.
+
+        Args:
+            model: The Ollama model name.
+            temperature: Sampling temperature.
+            top_k: Top-k sampling.
+            top_p: Top-p sampling.
+            num_predict: Maximum number of tokens to generate.
+
+        Returns:
+            An OllamaLLM sharing the pool's HTTP transports.
+        """
+        key: LLMClientKey = (model, temperature, top_k, top_p, num_predict)
+        now = time.time()
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                llm_kwargs = {} if self.base_url is None else {"base_url": self.base_url}
+                client = OllamaLLM(
+                    model=model,
+                    temperature=temperature,
+                    top_k=top_k,
+                    top_p=top_p,
+                    num_predict=num_predict,
+                    sync_client_kwargs={"transport": self._transport},
+                    async_client_kwargs={"transport": self._async_transport},
+                    **llm_kwargs,
+                )
+                self._clients[key] = client
+                self._stats[key] = {"created_at": now, "last_used": now, "requests": 0}
+
+            stats = self._stats[key]
+            stats["requests"] += 1
+            stats["last_used"] = now
+
+        # Check for idle clients at most once a minute
+        if now - self._last_eviction > 60:
+            self.evict_idle()
+
+        return client
+
+    def evict_idle(self) -> int:
+        """
+        Drops clients unused for more than `max_idle_seconds`.
+
+        Returns:
+            The number of evicted clients.
+        """
+        now = time.time()
+        with self._lock:
+            self._last_eviction = now
+            idle_keys = [
+                key
+                for key, stats in self._stats.items()
+                if now - stats["last_used"] > self.max_idle_seconds
+            ]
+            for key in idle_keys:
+                del self._clients[key]
+                del self._stats[key]
+        return len(idle_keys)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Returns per-client usage stats.
+
+        Returns:
+            One dictionary per pooled client with its parameters, request count,
+            creation time and idle time.
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "model": key[0],
+                    "temperature": key[1],
+                    "top_k": key[2],
+                    "top_p": key[3],
+                    "num_predict": key[4],
+                    "requests": stats["requests"],
+                    "created_at": stats["created_at"],
+                    "idle_seconds": round(now - stats["last_used"], 1),
+                }
+                for key, stats in self._stats.items()
+            ]
+
+
+# Pool shared by every PooledOllamaLLM
+llm_pool = LLMClientPool()
+
+
+class PooledOllamaLLM(RunnableSerializable[LanguageModelInput, str]):
+    """
+    Lightweight runnable that forwards to the pooled OllamaLLM for its parameters.
+
+    Creating one is cheap (no HTTP client), so it can be used with `configurable_fields`
+    to pick the model per request without building a new client every time.
+    """
+
+    model: str
+    temperature: Optional[float] = None
+    top_k: Optional[int] = None
+    top_p: Optional[float] = None
+    num_predict: Optional[int] = None
+
+    def _get_llm(self) -> OllamaLLM:
+        return llm_pool.get(
+            self.model,
+            temperature=self.temperature,
+            top_k=self.top_k,
+            top_p=self.top_p,
+            num_predict=self.num_predict,
+        )
+
+    def invoke(
+        self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> str:
+        return self._get_llm().invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> str:
+        return await self._get_llm().ainvoke(input, config, **kwargs)
+
+    def stream(
+        self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Iterator[str]:
+        yield from self._get_llm().stream(input, config, **kwargs)
+
+    async def astream(
+        self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[str]:
+        async for token in self._get_llm().astream(input, config, **kwargs):
+            yield token
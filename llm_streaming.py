@@ -0,0 +1,146 @@
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+# Marks where the generated response goes in a rendered HTML page
+RESPONSE_PLACEHOLDER = "\x00response\x00"
+
+# Timing of the most recent generations, newest last
+generation_stats: Deque[Dict[str, Any]] = deque(maxlen=1000)
+
+
+async def astream_generation(
+    chain: Runnable,
+    chain_input: Dict[str, Any],
+    config: Optional[RunnableConfig] = None,
+    label: str = "",
+    start_time: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Streams the tokens generated by a chain and records time-to-first-byte and tokens/sec.
+
+    Args:
+        chain: The prompt | LLM chain to stream from.
+        chain_input: The prompt variables.
+        config: Optional run config (e.g. the configurable model).
+        label: Name recorded with the stats, usually the endpoint.
+        start_time: `time.perf_counter()` at which the request started. Defaults to now.
+
+    Yields:
+        The generated tokens as they are produced.
+    """
+    start_time = time.perf_counter() if start_time is None else start_time
+    generation_start = time.perf_counter()
+    first_token_time: Optional[float] = None
+    tokens = 0
+
+    try:
+        async for token in chain.astream(chain_input, config=config):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            tokens += 1
+            yield token
+    finally:
+        end_time = time.perf_counter()
+        generation_time = end_time - (first_token_time or end_time)
+        stats = {
+            "label": label,
+            "time_to_first_byte": round((first_token_time or end_time) - start_time, 4),
+            "time_to_first_token": round((first_token_time or end_time) - generation_start, 4),
+            "total_time": round(end_time - start_time, 4),
+            "tokens": tokens,
+            "tokens_per_second": round((tokens - 1) / generation_time, 2)
+            if tokens > 1 and generation_time > 0
+            else None,
+        }
+        generation_stats.append(stats)
+        logging.info(f"Generation stats: {stats}")
+
+
+async def generate(
+    chain: Runnable,
+    chain_input: Dict[str, Any],
+    config: Optional[RunnableConfig] = None,
+    label: str = "",
+    start_time: Optional[float] = None,
+) -> str:
+    """
+    Runs a chain to completion through `astream_generation` so its timing is recorded too.
+
+    Returns:
+        The full generated text.
+    """
+    return "".join(
+        [
+            token
+            async for token in astream_generation(
+                chain, chain_input, config=config, label=label, start_time=start_time
+            )
+        ]
+    )
+
+
+async def stream_html_page(
+    chain: Runnable,
+    chain_input: Dict[str, Any],
+    page: str,
+    config: Optional[RunnableConfig] = None,
+    label: str = "",
+    start_time: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Streams an HTML page, pushing generated tokens in place of `RESPONSE_PLACEHOLDER`.
+
+    Args:
+        chain: The prompt | LLM chain to stream from.
+        chain_input: The prompt variables.
+        page: The rendered HTML page containing `RESPONSE_PLACEHOLDER` once.
+        config: Optional run config (e.g. the configurable model).
+        label: Name recorded with the stats, usually the endpoint.
+        start_time: `time.perf_counter()` at which the request started.
+
+    Yields:
+        The page head, the tokens as they are generated, then the page tail.
+    """
+    page_head, page_tail = page.split(RESPONSE_PLACEHOLDER)
+
+    yield page_head
+    try:
+        async for token in astream_generation(
+            chain, chain_input, config=config, label=label, start_time=start_time
+        ):
+            yield token
+    except Exception as e:
+        # The status line is already sent, so report the error inside the page
+        logging.error(f"Error while streaming {label}: {e}")
+        yield f'<span class="error">An error occurred: {e}</span>'
+    yield page_tail
+
+
+def get_generation_stats_summary() -> Dict[str, Any]:
+    """
+    Summarizes the recorded generation stats.
+
+    Returns:
+        A dictionary with the number of recorded generations, mean time-to-first-byte,
+        mean tokens/sec and the most recent entries.
+    """
+    stats = list(generation_stats)
+    tokens_per_second = [s["tokens_per_second"] for s in stats if s["tokens_per_second"]]
+
+    return {
+        "count": len(stats),
+        "mean_time_to_first_byte": round(
+            sum(s["time_to_first_byte"] for s in stats) / len(stats), 4
+        )
+        if stats
+        else None,
+        "mean_tokens_per_second": round(sum(tokens_per_second) / len(tokens_per_second), 2)
+        if tokens_per_second
+        else None,
+        "recent": stats[-20:],
+    }
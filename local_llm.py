@@ -1,13 +1,16 @@
 from typing import List, Optional
 from fastapi import FastAPI, Form
 from fastapi.responses import HTMLResponse
-from langchain_ollama.llms import OllamaLLM
-from langchain.prompts import ChatPromptTemplate
+from llm_pool import PooledOllamaLLM, llm_pool
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import ConfigurableField
 from langserve import add_routes
 import uvicorn
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi import Form
 import logging
+import time
+from llm_streaming import RESPONSE_PLACEHOLDER, generate, get_generation_stats_summary, stream_html_page
 
 # Define a custom template with placeholders for query and answer format
 template = """
@@ -15,9 +18,18 @@ Question: {question}
 Answer: {answer_format}
 """
 
+# Build the chain once; the model is chosen per request via the run config
+model = PooledOllamaLLM(model="gemma2", num_predict=50).configurable_fields(
+    model=ConfigurableField(id="model", name="Model", description="The Ollama model to use")
+)
+llm_chain = ChatPromptTemplate.from_template(template) | model
+
 # Initialize the FastAPI app
 app = FastAPI(title="LangChain", version="1.0", description="The first server ever!")
 
+# Register the LangServe routes once at startup
+add_routes(app, llm_chain, path="/chain")
+
 
 # Root endpoint with a simple welcome page and form
 @app.get("/", response_class=HTMLResponse)
@@ -92,6 +104,8 @@ async def welcome_page():
                     <label for="answer_format">Answer Format:</label>
                     <input type="text" id="answer_format" name="answer_format"  optional>
 
+                    <label for="stream"><input type="checkbox" id="stream" name="stream" value="true" style="width: auto;"> Stream response</label>
+
                     <button type="submit">Submit Query</button>
                 </form>
             </div>
@@ -170,6 +184,8 @@ async def chain_form():
                         <option value="gemma">Gemma</option> <!-- Add other models here -->
                     </select>
                     
+                    <label for="stream"><input type="checkbox" id="stream" name="stream" value="true" style="width: auto;"> Stream response</label>
+
                     <button type="submit">Submit Query</button>
                 </form>
             </div>
@@ -182,32 +198,21 @@ async def chain_form():
 async def chain_endpoint(
     question: str = Form(...),
     model: str = Form(...),
-    answer_format: Optional[str] = Form(...)
+    answer_format: Optional[str] = Form(...),
+    stream: bool = Form(False)
 ):
+    start_time = time.perf_counter()
     try:
-        # Set up the prompt with dynamic question and answer formatting
-        prompt_template = ChatPromptTemplate.from_template(template)
-        
         # Create a dictionary with the placeholders replaced
         prompt_input = {
             "question": question,
             "answer_format": answer_format
         }
 
-        # Configure the selected model
-        selected_model = OllamaLLM(model=model)
-        rag_chain = prompt_template | selected_model
+        config = {"configurable": {"model": model}}
 
-        # Add the chain route
-        add_routes(app, rag_chain, path="/")
-
-        # Invoke the RAG chain with the formatted question and answer
-        response = rag_chain.invoke(prompt_input)
-        
-        print(response)
-        
         # Display the response in an HTML format
-        return f"""
+        page = f"""
         <html>
             <head>
                 <title>RAG Query Response</title>
@@ -247,12 +252,26 @@ async def chain_endpoint(
                 <div class="container">
                     <p><strong>Question:</strong> {question}</p>
                     <p><strong>Answer Format:</strong> {answer_format}</p>
-                    <p class="response"><strong>Response:</strong> {response}</p>
+                    <p class="response"><strong>Response:</strong> {RESPONSE_PLACEHOLDER}</p>
                     <br><a href="/">Ask Another Question</a>
                 </div>
             </body>
         </html>
         """
+
+        if stream:
+            # Push tokens to the browser as they are generated
+            return StreamingResponse(
+                stream_html_page(llm_chain, prompt_input, page, config=config, label="/chain", start_time=start_time),
+                media_type="text/html"
+            )
+
+        # Invoke the chain with the selected model
+        response = await generate(llm_chain, prompt_input, config=config, label="/chain", start_time=start_time)
+        
+        print(response)
+        
+        return page.replace(RESPONSE_PLACEHOLDER, response)
     except KeyError as e:
         # Log the KeyError for missing keys
         logging.error(f"KeyError in chain_endpoint: {e}")
@@ -262,6 +281,18 @@ async def chain_endpoint(
         logging.error(f"Error in chain_endpoint: {e}")
         return PlainTextResponse(f"An error occurred: {str(e)}", status_code=500)
 
+@app.get("/generation_stats")
+async def get_generation_stats():
+    """Endpoint to check time-to-first-byte and tokens/sec of recent generations."""
+    return JSONResponse(content=get_generation_stats_summary())
+
+
+@app.get("/llm_pool_stats")
+async def get_llm_pool_stats():
+    """Endpoint to check usage of the pooled LLM clients."""
+    return JSONResponse(content=llm_pool.stats())
+
+
 # Define a route for the favicon to avoid 404s on favicon.ico requests
 @app.get("/favicon.ico")
 async def favicon():
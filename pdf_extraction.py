@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz
+
+
+# PDF text extraction and chunking. Kept free of model and cloud imports so that
+# extraction worker processes start quickly.
+
+
+def get_pdf_doc_object(pdf_path: str) -> tuple[fitz.Document, int]:
+    """
+    Opens a PDF file using fitz.open() and returns the PDF document object and the number of pages.
+
+    Args:
+        pdf_path: The path to the PDF file.
+
+    Returns:
+        A tuple containing the `fitz.Document` object and the number of pages in the PDF.
+
+    Raises:
+        FileNotFoundError: If the provided PDF path is invalid.
+
+    """
+
+    # Open the PDF file
+    doc: fitz.Document = fitz.open(pdf_path)
+
+    # Get the number of pages in the PDF file
+    num_pages: int = len(doc)
+
+    return doc, num_pages
+
+
+def get_text_overlapping_chunk_offsets(
+    text: str, character_limit: int = 1000, overlap: int = 100
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Computes the character offsets of overlapping chunks of a text.
+
+    Args:
+        text: The text document to be chunked.
+        character_limit: Maximum characters per chunk (defaults to 1000).
+        overlap: Number of overlapping characters between chunks (defaults to 100).
+
+    Returns:
+        A dictionary where keys are chunk numbers and values are (start, end) character offsets into `text`.
+
+    Raises:
+        ValueError: If `overlap` is greater than `character_limit`.
+    """
+
+    if overlap > character_limit:
+        raise ValueError("Overlap cannot be larger than character limit.")
+
+    return {
+        chunk_number: (i, min(i + character_limit, len(text)))
+        for chunk_number, i in enumerate(range(0, len(text), character_limit - overlap), start=1)
+    }
+
+
+def get_text_overlapping_chunk(
+    text: str, character_limit: int = 1000, overlap: int = 100
+) -> dict:
+    """
+    * Breaks a text document into chunks of a specified size, with an overlap between chunks to preserve context.
+    * Takes a text document, character limit per chunk, and overlap between chunks as input.
+    * Returns a dictionary where the keys are chunk numbers and the values are the corresponding text chunks.
+
+    Args:
+        text: The text document to be chunked.
+        character_limit: Maximum characters per chunk (defaults to 1000).
+        overlap: Number of overlapping characters between chunks (defaults to 100).
+
+    Returns:
+        A dictionary where keys are chunk numbers and values are the corresponding text chunks.
+
+    Raises:
+        ValueError: If `overlap` is greater than `character_limit`.
+
+    """
+
+    chunked_text_dict = {}
+
+    for chunk_number, (start, end) in get_text_overlapping_chunk_offsets(
+        text, character_limit, overlap
+    ).items():
+        chunked_text_dict[chunk_number] = text[start:end]
+
+    return chunked_text_dict
+
+
+def extract_pdf_page_text(
+    pdf_path: str, start_page: int = 0, end_page: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Extracts the text of a range of pages of a PDF.
+    Opens the PDF itself, so it can run in a worker process.
+
+    Args:
+        pdf_path: The path to the PDF file.
+        start_page: First page to extract (0-based).
+        end_page: Page after the last one to extract. Defaults to the end of the document.
+
+    Returns:
+        One dictionary per page with the page_num (0-based) and text.
+    """
+
+    doc, num_pages = get_pdf_doc_object(pdf_path)
+    end_page = num_pages if end_page is None else min(end_page, num_pages)
+
+    page_records: List[Dict[str, Any]] = []
+    for page_num in range(start_page, end_page):
+        # Non-ASCII text (accents, symbols, other scripts) is kept
+        text: str = doc[page_num].get_text()
+        page_records.append({"page_num": page_num, "text": text})
+    doc.close()
+
+    return page_records
+
+
+def _extract_pdf_page_text_task(task: Tuple[str, int, int]) -> List[Dict[str, Any]]:
+    # Unpacks a task tuple for Executor.submit and Executor.map
+    return extract_pdf_page_text(*task)
+
+
+_extraction_executor: Optional[ProcessPoolExecutor] = None
+_extraction_executor_lock = threading.Lock()
+
+
+def get_extraction_executor(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for PDF text extraction, creating it on first use.
+
+    Workers are started with the "spawn" method, which is safe to use from the threads of
+    a running server, and are kept alive across ingestion runs.
+
+    Args:
+        max_workers: Number of worker processes. Defaults to the number of CPUs.
+                     Only used when the pool is created.
+
+    Returns:
+        The shared `ProcessPoolExecutor`.
+    """
+    global _extraction_executor
+
+    with _extraction_executor_lock:
+        if _extraction_executor is None:
+            _extraction_executor = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _extraction_executor
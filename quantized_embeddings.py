@@ -0,0 +1,240 @@
+import copy
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+# Storage types of the in-memory copy searched by `QuantizedEmbeddings`
+EMBEDDING_STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+class QuantizedEmbeddings:
+    """
+    Searchable embedding matrix held in memory as float32, float16 or int8 codes.
+
+    * float32 keeps the full-precision matrix and scores it exactly.
+    * float16 halves the memory; scores differ from exact ones by ~1e-3.
+    * int8 quarters the memory with symmetric per-dimension scalar quantization:
+      x[:, d] ~ codes[:, d] * scale[d], so a query is scored as codes @ (query * scale).
+      The scale covers every indexed row: when rows added by `extend` fall outside it, it is
+      widened and the rows already indexed are re-quantized from the full-precision matrix.
+
+    Compressed matrices are scored block by block (converted to float32 one block at a time)
+    to pick `top_n * rescore_factor` candidates, which are then rescored exactly against the
+    full-precision embeddings. Those can stay on disk (e.g. `VectorStore.embeddings`, a
+    memory map): only the candidate rows are read.
+
+    With `rows`, only those rows of the matrix are searched (e.g. the live rows of a store with
+    tombstones) and results are positions in `rows`, so the matrix is never copied to drop the
+    others. float32 storage scores the whole matrix and keeps the scores of `rows`.
+
+    Scores are dot products, i.e. cosine similarities for unit-normalized embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        dtype: str = "float32",
+        rescore_factor: int = 4,
+        block_size: int = 4096,
+        rows: Optional[np.ndarray] = None,
+    ):
+        """
+        Args:
+            embeddings: The (count, dimension) full-precision embedding matrix.
+            dtype: Storage type of the searched copy, one of `EMBEDDING_STORAGE_DTYPES`.
+            rescore_factor: Candidates rescored exactly per requested result.
+            block_size: Rows converted to float32 at a time when scoring compressed codes.
+            rows: Sorted row numbers of `embeddings` to search, e.g. `VectorStoreSnapshot.live_rows`.
+                  Every row when None.
+
+        Raises:
+            ValueError: If `dtype` is not supported.
+        """
+        if dtype not in EMBEDDING_STORAGE_DTYPES:
+            raise ValueError(
+                f"Unsupported embedding storage dtype {dtype!r}, expected one of {EMBEDDING_STORAGE_DTYPES}."
+            )
+
+        self.dtype = dtype
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self._max_abs: Optional[np.ndarray] = None  # Per-dimension range covered by the int8 scale
+        self._scale: Optional[np.ndarray] = None
+        self._embeddings = embeddings
+        self._rows = rows
+        self._codes = self._encode(embeddings, np.empty((0, 0), dtype=dtype))
+
+    def __len__(self) -> int:
+        return len(self._rows) if self._rows is not None else len(self._embeddings)
+
+    def _quantize(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.dtype == "float16":
+            return np.asarray(embeddings, dtype=np.float16)
+
+        return np.clip(np.rint(embeddings / self._scale), -127, 127).astype(np.int8)
+
+    def _encode(self, embeddings: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Codes of the searched rows of `embeddings`, reusing `codes` for the rows they already cover
+        if len(self) == 0:
+            return codes
+        if self.dtype == "float32":
+            # The full-precision matrix is searched directly
+            return np.asarray(embeddings, dtype=np.float32)
+
+        added_rows = slice(len(codes), None) if self._rows is None else self._rows[len(codes) :]
+        added = np.asarray(embeddings[added_rows], dtype=np.float32)
+        if len(added) == 0:
+            return codes
+
+        if self.dtype == "int8":
+            added_max_abs = np.abs(added).max(axis=0)
+            if self._max_abs is None or np.any(added_max_abs > self._max_abs):
+                # Widen the scale to the new rows instead of clipping them; new arrays are
+                # assigned, so an index this one was extended from keeps its own scale
+                self._max_abs = (
+                    added_max_abs if self._max_abs is None else np.maximum(self._max_abs, added_max_abs)
+                )
+                self._scale = np.where(self._max_abs > 0, self._max_abs / 127, 1.0).astype(np.float32)
+                if len(codes):
+                    covered_rows = slice(0, len(codes)) if self._rows is None else self._rows[: len(codes)]
+                    codes = self._quantize(np.asarray(embeddings[covered_rows], dtype=np.float32))
+
+        added = self._quantize(added)
+        return np.concatenate([codes, added]) if len(codes) else added
+
+    def extend(self, embeddings: np.ndarray, rows: Optional[np.ndarray] = None) -> "QuantizedEmbeddings":
+        """
+        Returns an index over a grown embedding matrix, quantizing only the new rows.
+        This index is left unchanged, so searches running on it stay consistent.
+
+        Args:
+            embeddings: The full-precision matrix; its first searched rows must be the
+                        rows already indexed (e.g. a re-opened append-only store).
+            rows: The searched rows of `embeddings`, as in the constructor.
+
+        Returns:
+            The new index.
+        """
+        index = copy.copy(self)
+        index._embeddings = embeddings
+        index._rows = rows
+        index._codes = index._encode(embeddings, self._codes)
+        return index
+
+    def _approximate_scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self.dtype == "float32":
+            return codes @ query
+
+        if self.dtype == "int8":
+            query = query * self._scale
+
+        # Convert into one reused, cache-sized buffer instead of allocating per block
+        scores = np.empty(len(codes), dtype=np.float32)
+        buffer = np.empty((min(self.block_size, len(codes)), codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start : start + self.block_size]
+            np.copyto(buffer[: len(block)], block)
+            np.dot(buffer[: len(block)], query, out=scores[start : start + len(block)])
+        return scores
+
+    def search(
+        self, query_vector: Union[list, np.ndarray], top_n: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rows with the highest scores against a query embedding.
+
+        Args:
+            query_vector: The query embedding.
+            top_n: The number of rows to return.
+
+        Returns:
+            A tuple of the row indices and their exact scores, sorted by descending score.
+        """
+        embeddings, codes, rows = self._embeddings, self._codes, self._rows
+        query = np.asarray(query_vector, dtype=np.float32)
+        top_n = min(top_n, len(self))
+        if top_n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = self._approximate_scores(codes, query)
+        if self.dtype == "float32":
+            if rows is not None:
+                scores = scores[rows]
+            candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+            candidate_scores = scores[candidates]
+        else:
+            num_candidates = min(top_n * self.rescore_factor, len(codes))
+            candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+            # Exact rescoring; sorted row order keeps memory-mapped reads sequential
+            candidates = np.sort(candidates)
+            candidate_rows = candidates if rows is None else rows[candidates]
+            candidate_scores = np.asarray(embeddings[candidate_rows], dtype=np.float32) @ query
+
+        order = np.argsort(-candidate_scores, kind="stable")[:top_n]
+        return candidates[order], candidate_scores[order]
+
+    def search_batch(
+        self, query_vectors: np.ndarray, top_n: int, query_block_size: int = 64
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Finds the rows with the highest scores against each of many query embeddings.
+
+        float32 storage scores blocks of queries with one matrix-matrix product each, which
+        reads the matrix once per block instead of once per query; compressed storage runs
+        `search` per query.
+
+        Args:
+            query_vectors: The (queries, dimension) query embeddings.
+            top_n: The number of rows to return per query.
+            query_block_size: Queries scored together; bounds the (block, rows) score matrix.
+
+        Returns:
+            One (row indices, exact scores) tuple per query, sorted by descending score.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if self.dtype != "float32":
+            return [self.search(query_vector, top_n) for query_vector in query_vectors]
+
+        codes, rows = self._codes, self._rows
+        top_n = min(top_n, len(self))
+        results: List[Tuple[np.ndarray, np.ndarray]] = []
+        for start in range(0, len(query_vectors), query_block_size):
+            block = query_vectors[start : start + query_block_size]
+            if top_n <= 0:
+                results.extend(
+                    (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in block
+                )
+                continue
+
+            scores = block @ codes.T
+            if rows is not None:
+                scores = scores[:, rows]
+            candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind="stable")
+            results.extend(
+                zip(
+                    np.take_along_axis(candidates, order, axis=1),
+                    np.take_along_axis(candidate_scores, order, axis=1),
+                )
+            )
+        return results
+
+    def memory_usage(self) -> Dict[str, Union[str, int, float]]:
+        """
+        Returns the memory held by the searched copy.
+
+        Returns:
+            A dictionary with the storage dtype, total bytes, bytes per vector and the
+            projected megabytes per million vectors.
+        """
+        codes = self._codes
+        bytes_per_vector = codes.shape[1] * codes.itemsize if codes.ndim == 2 else 0
+        return {
+            "dtype": self.dtype,
+            "bytes": int(codes.nbytes),
+            "bytes_per_vector": int(bytes_per_vector),
+            # A million vectors of N bytes take N MB
+            "mb_per_million_vectors": float(bytes_per_vector),
+        }
@@ -1,35 +1,155 @@
-from typing import Optional, List, Tuple, Dict, Union
-from fastapi import FastAPI, BackgroundTasks, Form, UploadFile, File, Request
+from typing import Optional, Tuple, Dict, Union
+from fastapi import FastAPI, Form, Request
 from fastapi.responses import HTMLResponse, PlainTextResponse
-import pandas as pd
-import glob
 import uvicorn
 import logging
-from langchain_ollama.llms import OllamaLLM
+from llm_pool import PooledOllamaLLM, llm_pool
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import ConfigurableField
 from utils import (
     set_global_variable,
     get_text_embedding_from_text_embedding_model,
     get_document_metadata,
     get_similar_text_from_query,
-    print_text_to_text_citation
+    print_text_to_text_citation,
+    embedding_cache,
+    embedding_backend,
+    vertex_rate_limiter
 )
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import os
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import time
 from langserve import add_routes
+from vector_store import VectorStore, VectorStoreSnapshot
+from quantized_embeddings import QuantizedEmbeddings
+from ann_index import create_embedding_index, load_embedding_index
+from lexical_index import BM25Index, load_bm25_index
+from ingestion_manifest import IngestionManifest
+from ingestion_jobs import IngestionJob, IngestionJobManager
+from uploads import MultipartUploadParser, UploadTooLargeError
+from llm_streaming import RESPONSE_PLACEHOLDER, generate, get_generation_stats_summary, stream_html_page
+import threading
+import json
+import shutil
 
 # Initialize global variables
-text_metadata_df = pd.DataFrame()  # Placeholder for document embeddings
-model = OllamaLLM(
+vector_store = VectorStore(
+    "vector_store", dimension=embedding_backend.text_dimension, embedding_model=embedding_backend.model_id
+)  # Persistent chunk embeddings and metadata
+ingestion_manifest = IngestionManifest(os.path.join("vector_store", "manifest.sqlite"))  # Ingested file and page hashes
+EMBEDDING_STORAGE_DTYPE = os.environ.get("EMBEDDING_STORAGE_DTYPE", "float32")  # float32, float16 or int8
+EMBEDDING_INDEX = os.environ.get("EMBEDDING_INDEX", "exact")  # exact, or ivf_flat for approximate search
+EMBEDDING_INDEX_NPROBE = int(os.environ.get("EMBEDDING_INDEX_NPROBE", 8))  # IVF clusters scored per query
+EMBEDDING_INDEX_PATH = os.path.join("vector_store", "ivf_flat_index.npz")
+EMBEDDING_INDEX_STATE_PATH = os.path.join("vector_store", "ivf_flat_index.json")  # Store state the saved index covers
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")  # dense, or hybrid (dense fused with BM25)
+LEXICAL_INDEX_PATH = os.path.join("vector_store", "bm25_index.npz")
+LEXICAL_INDEX_STATE_PATH = os.path.join("vector_store", "bm25_index.json")  # Store state the saved BM25 index covers
+index_save_lock = threading.Lock()  # Serializes writes of the saved ANN and BM25 indexes
+index_update_lock = threading.Lock()  # Serializes index updates after ingestion jobs
+
+
+def get_store_state() -> dict:
+    # Row and tombstone counts identifying the live rows of the store
+    return {"count": len(vector_store), "num_deleted": vector_store.num_deleted}
+
+
+def load_text_embedding_index(snapshot: VectorStoreSnapshot, store_state: dict):
+    """
+    Opens the index searched over the live chunk embeddings of the vector store.
+
+    With EMBEDDING_INDEX=exact every live row is scored (stored as EMBEDDING_STORAGE_DTYPE;
+    float32 scores the memory-mapped embeddings in place). With EMBEDDING_INDEX=ivf_flat the
+    saved IVF index is loaded if it covers the store, and rebuilt otherwise.
+    """
+    if EMBEDDING_INDEX == "exact":
+        return QuantizedEmbeddings(snapshot.embeddings, dtype=EMBEDDING_STORAGE_DTYPE, rows=snapshot.live_rows)
+
+    if os.path.exists(EMBEDDING_INDEX_PATH) and os.path.exists(EMBEDDING_INDEX_STATE_PATH):
+        with open(EMBEDDING_INDEX_STATE_PATH) as f:
+            saved_state = json.load(f)
+        index = load_embedding_index(EMBEDDING_INDEX_PATH)
+        if index.kind == EMBEDDING_INDEX and saved_state == store_state and len(index) == len(snapshot):
+            index.nprobe = EMBEDDING_INDEX_NPROBE
+            return index
+
+    index = create_embedding_index(
+        EMBEDDING_INDEX, embeddings=snapshot.live_embeddings(), nprobe=EMBEDDING_INDEX_NPROBE
+    )
+    save_text_embedding_index(index, store_state)
+    return index
+
+
+def save_search_index(index, index_path: str, state_path: str, store_state: dict) -> None:
+    # Write then rename, so a crash never leaves a truncated index behind
+    with index_save_lock:
+        temp_path = index_path[: -len(".npz")] + ".tmp.npz"
+        index.save(temp_path)
+        os.replace(temp_path, index_path)
+        with open(state_path + ".tmp", "w") as f:
+            json.dump(store_state, f)
+        os.replace(state_path + ".tmp", state_path)
+
+
+def save_text_embedding_index(index, store_state: dict) -> None:
+    save_search_index(index, EMBEDDING_INDEX_PATH, EMBEDDING_INDEX_STATE_PATH, store_state)
+
+
+def load_lexical_index(snapshot: VectorStoreSnapshot, store_state: dict) -> Optional[BM25Index]:
+    """
+    Opens the BM25 index over the live chunk texts of the vector store, None unless
+    RETRIEVAL_MODE=hybrid. The saved index is loaded if it covers the store, and rebuilt otherwise.
+    """
+    if RETRIEVAL_MODE != "hybrid":
+        return None
+
+    if os.path.exists(LEXICAL_INDEX_PATH) and os.path.exists(LEXICAL_INDEX_STATE_PATH):
+        with open(LEXICAL_INDEX_STATE_PATH) as f:
+            saved_state = json.load(f)
+        index = load_bm25_index(LEXICAL_INDEX_PATH)
+        if saved_state == store_state and len(index) == len(snapshot):
+            return index
+
+    index = BM25Index()
+    index.add(snapshot.iter_chunk_texts())
+    save_search_index(index, LEXICAL_INDEX_PATH, LEXICAL_INDEX_STATE_PATH, store_state)
+    return index
+
+
+# Read before the snapshot, so it never covers tombstones the snapshot misses
+text_embedding_index_state = get_store_state()
+text_store_snapshot = vector_store.snapshot()  # Live chunks, read lazily; row-aligned with the indexes
+text_embedding_index = load_text_embedding_index(text_store_snapshot, text_embedding_index_state)  # Searched chunk embeddings
+text_lexical_index = load_lexical_index(text_store_snapshot, text_embedding_index_state)  # Searched chunk texts, None for dense retrieval
+model = PooledOllamaLLM(
+    model="gemma2",
+    temperature=0.2,
+    num_predict=100,
+    top_k=40,
+    top_p=0.95
+  ).configurable_fields(
+    # Selected per request through the "configurable" section of the run config
+    model=ConfigurableField(id="model", name="Model", description="The Ollama model to use")
+  )
+chain_model = PooledOllamaLLM(
     model="gemma2",
     temperature=0.2,
-    max_output_tokens=100,
+    num_predict=50,
     top_k=40,
     top_p=0.95
+  ).configurable_fields(
+    model=ConfigurableField(id="model", name="Model", description="The Ollama model to use")
   )
-processing_status = {"in_progress": False, "progress": 0, "current_file": "", "current_page": ""}
+index_lock = threading.Lock()  # Guards swapping text_store_snapshot, the text indexes and their store state
+
+UPLOAD_FOLDER_PATH = "uploaded_files"
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", 256 * 2**20))  # Per uploaded file
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get("MAX_UPLOAD_REQUEST_BYTES", 1024 * 2**20))  # Per upload request
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", 2))  # Maximum concurrent ingestion jobs
+INGESTION_JOB_TTL_SECONDS = float(os.environ.get("INGESTION_JOB_TTL_SECONDS", 3600))  # Finished jobs kept this long
+MAX_FINISHED_INGESTION_JOBS = int(os.environ.get("MAX_FINISHED_INGESTION_JOBS", 1000))  # Finished jobs kept at most
 
 # Define a custom template with placeholders for query and answer format
 template = """
@@ -37,9 +157,24 @@ Question: {question}
 Answer: {answer_format}
 """
 
+# Template for answering questions from the retrieved document context
+rag_template = """
+Question: {question}
+Context: {context}
+Answer: {answer_format}
+"""
+
+# Build the chains once; the model is chosen per request via the run config
+llm_chain = ChatPromptTemplate.from_template(template) | chain_model
+rag_chain = ChatPromptTemplate.from_template(rag_template) | model
+
 # Initialize the FastAPI app
 app = FastAPI(title="LangChain", version="1.0", description="The first rag server ever!")
 
+# Register the LangServe routes once at startup
+add_routes(app, llm_chain, path="/chain")
+add_routes(app, rag_chain, path="/rag_chain")
+
 @app.get("/", response_class=HTMLResponse)
 async def welcome_page():
     return """
@@ -128,6 +263,8 @@ async def welcome_page():
                     <label for="answer_format">Answer Format:</label>
                     <input type="text" id="answer_format" name="answer_format">
 
+                    <label for="stream"><input type="checkbox" id="stream" name="stream" value="true" style="width: auto;"> Stream response</label>
+
                     <button type="submit">Submit</button>
                 </form>
 
@@ -166,26 +303,49 @@ async def rag_welcome_page():
                     document.getElementById("progressText").innerText = "Processing: 0%";
 
                     // Start document upload
-                    await fetch("/upload_documents", {
+                    const response = await fetch("/upload_documents", {
                         method: "POST",
                         body: formData,
                     });
+                    if (!response.ok) {
+                        document.getElementById("loadingContainer").style.display = "none";
+                        document.getElementById("uploadButton").disabled = false;
+                        alert("Upload failed: " + await response.text());
+                        return;
+                    }
+                    const job = await response.json();
 
-                    // Poll processing status
-                    checkProcessingStatus();
+                    // Follow the job's progress events
+                    followJobProgress(job.job_id);
                 }
 
-                async function checkProcessingStatus() {
-                    const response = await fetch("/processing_status");
-                    const status = await response.json();
-                    
-                    if (status.in_progress) {
+                function followJobProgress(jobId) {
+                    const events = new EventSource("/jobs/" + jobId + "/events");
+
+                    events.onmessage = (message) => {
+                        const status = JSON.parse(message.data);
+
+                        if (status.event === "completed" || status.event === "failed") {
+                            events.close();
+                            finishProcessing(status);
+                            return;
+                        }
+
                         // Update the progress bar
-                        document.getElementById("progressBar").style.width = status.progress + "%";
-                        document.getElementById("progressText").innerText = "Processing: " + status.progress + "%";
+                        const progress = status.progress || 0;
+                        const eta = status.eta === null || status.eta === undefined ? "" : ", ETA " + Math.round(status.eta) + "s";
+                        document.getElementById("progressBar").style.width = progress + "%";
+                        document.getElementById("progressText").innerText =
+                            "Processing: " + progress + "% (" + (status.pages_parsed || 0) + " pages, "
+                            + (status.chunks_embedded || 0) + " chunks" + eta + ")";
+                    };
+                }
 
-                        // Poll every second
-                        setTimeout(checkProcessingStatus, 1000);
+                function finishProcessing(status) {
+                    if (status.event === "failed") {
+                        document.getElementById("loadingContainer").style.display = "none";
+                        document.getElementById("uploadButton").disabled = false;
+                        alert("Document processing failed: " + status.error);
                     } else {
                         // Hide loading bar and enable query button
                         document.getElementById("loadingContainer").style.display = "none";
@@ -280,6 +440,7 @@ async def rag_welcome_page():
                 <input type="text" id="question" name="question" required>
                 <label for="answer_format">Answer Format:</label>
                 <input type="text" id="answer_format" name="answer_format" value="Provide a detailed answer based on the context" required>
+                <label for="stream"><input type="checkbox" id="stream" name="stream" value="true" style="width: auto;"> Stream response</label>
                 <button id="queryButton" type="submit" disabled>Submit Query</button>
             </form>
                 
@@ -364,6 +525,8 @@ async def chain_form():
                         <option value="gemma">Gemma</option> <!-- Add other models here -->
                     </select>
                     
+                    <label for="stream"><input type="checkbox" id="stream" name="stream" value="true" style="width: auto;"> Stream response</label>
+
                     <button type="submit">Submit Query</button>
                 </form>
             </div>
@@ -376,38 +539,21 @@ async def chain_form():
 async def chain_endpoint(
     question: str = Form(...),
     model: str = Form(...),
-    answer_format: Optional[str] = Form(...)
+    answer_format: Optional[str] = Form(...),
+    stream: bool = Form(False)
 ):
+    start_time = time.perf_counter()
     try:
-        # Set up the prompt with dynamic question and answer formatting
-        prompt_template = ChatPromptTemplate.from_template(template)
-        
         # Create a dictionary with the placeholders replaced
         prompt_input = {
             "question": question,
             "answer_format": answer_format
         }
 
-        # Configure the selected model
-        selected_model = OllamaLLM(
-            model=model,
-            temperature=0.2,
-            max_output_tokens=50,
-            top_k=40,
-            top_p=0.95
-        )
-        rag_chain = prompt_template | selected_model
+        config = {"configurable": {"model": model}}
 
-        # Add the chain route
-        add_routes(app, rag_chain, path="/chain")
-
-        # Invoke the RAG chain with the formatted question and answer
-        response = rag_chain.invoke(prompt_input)
-        
-        print(response)
-        
         # Display the response in an HTML format
-        return f"""
+        page = f"""
         <html>
             <head>
                 <title>LLM Query Response</title>
@@ -462,7 +608,7 @@ async def chain_endpoint(
                     <p><strong>Question:</strong> {question}</p>
                     <p><strong>Answer Format:</strong> {answer_format}</p>
                     <p><strong>Model:</strong> {model}</p>
-                    <p class="response"><strong>Response:</strong> {response}</p>
+                    <p class="response"><strong>Response:</strong> {RESPONSE_PLACEHOLDER}</p>
                     <br><a href="/">Ask Another Question</a>
                     <br></br>
                     <br><a href="/rag">Use RAG </a>
@@ -472,6 +618,20 @@ async def chain_endpoint(
             </body>
         </html>
         """
+
+        if stream:
+            # Push tokens to the browser as they are generated
+            return StreamingResponse(
+                stream_html_page(llm_chain, prompt_input, page, config=config, label="/chain", start_time=start_time),
+                media_type="text/html"
+            )
+
+        # Invoke the chain with the selected model
+        response = await generate(llm_chain, prompt_input, config=config, label="/chain", start_time=start_time)
+        
+        print(response)
+        
+        return page.replace(RESPONSE_PLACEHOLDER, response)
     except KeyError as e:
         # Log the KeyError for missing keys
         logging.error(f"KeyError in chain_endpoint: {e}")
@@ -486,128 +646,175 @@ async def chain_endpoint(
 
 
 
-# Modify upload endpoint to handle processing asynchronously and set status
-@app.post("/upload_documents", response_class=PlainTextResponse)
-async def upload_documents(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
-    global processing_status
-    if len(files) > 10:
-        return "You can upload a maximum of 10 files at once."
-    
-    processing_status = {"in_progress": True, "progress": 0}
-    
-    # Directory where files will be temporarily saved for processing
-    pdf_folder_path = "uploaded_files/"
-    
-    # Save files and start background processing
-    for file in files:
-        file_path = f"{pdf_folder_path}/{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-    
+# Reject oversized upload requests from their Content-Length, before the body is read
+@app.middleware("http")
+async def limit_upload_request_size(request: Request, call_next):
+    if request.url.path == "/upload_documents":
+        content_length = request.headers.get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+            return PlainTextResponse(
+                f"The upload exceeds the maximum request size of {MAX_UPLOAD_REQUEST_BYTES} bytes.", status_code=413
+            )
+    return await call_next(request)
+
+# Upload endpoint: streams the files to disk as the request body arrives and queues an ingestion job, returning immediately
+@app.post("/upload_documents")
+async def upload_documents(request: Request):
+    # Each job gets its own folder so it only ingests its own files
+    job_id = ingestion_jobs.new_job_id()
+    pdf_folder_path = os.path.join(UPLOAD_FOLDER_PATH, job_id)
     
-    # Set initial processing status
-    processing_status = {"in_progress": True, "progress": 20, "current_file": "", "current_page": ""}
+    # Parse the multipart body chunk by chunk off the event loop: file parts are written straight to
+    # their destination and the size limits are enforced on the bytes received so far
+    parser = None
+    try:
+        parser = MultipartUploadParser(
+            request.headers.get("content-type", ""),
+            pdf_folder_path,
+            max_files=10,
+            max_file_bytes=MAX_UPLOAD_FILE_BYTES,
+            max_request_bytes=MAX_UPLOAD_REQUEST_BYTES,
+        )
+        async for chunk in request.stream():
+            await run_in_threadpool(parser.write, chunk)
+        saved_uploads = parser.finish()
+    except BaseException as e:
+        # Discard the partial file and everything saved so far
+        if parser is not None:
+            parser.abort()
+        shutil.rmtree(pdf_folder_path, ignore_errors=True)
+        if isinstance(e, UploadTooLargeError):
+            return PlainTextResponse(str(e), status_code=413)
+        if isinstance(e, ValueError):
+            return PlainTextResponse(str(e), status_code=400)
+        raise
     
-    # Launch processing in the background
-    background_tasks.add_task(process_documents, pdf_folder_path)
+    # Skip content that is already uploaded in this request or ingested
+    saved_file_names, duplicate_file_names, saved_hashes = [], [], set()
+    for saved in saved_uploads:
+        ingested = ingestion_manifest.get_file(saved.file_name)
+        if saved.file_hash in saved_hashes or (ingested is not None and ingested["file_hash"] == saved.file_hash):
+            os.remove(saved.path)
+            duplicate_file_names.append(saved.file_name)
+        else:
+            saved_hashes.add(saved.file_hash)
+            saved_file_names.append(saved.file_name)
     
-    return JSONResponse(content={f"message": "Documents are being processed, progress: 100"})   
-
-# Background task to process documents and update progress
-def process_documents(pdf_folder_path: str):
-    global processing_status, text_metadata_df
+    # Queue processing on the ingestion worker pool
+    os.makedirs(pdf_folder_path, exist_ok=True)
+    job = ingestion_jobs.submit(pdf_folder_path, saved_file_names, job_id=job_id)
     
-    # Dummy variable to simulate progress (e.g., 10 stages)
-    stages = 100
-    for i in range(stages):
-        # Simulate each stage processing
-        processing_status["progress"] = int((i + 1) / stages * 55)
+    return JSONResponse(content={
+        "job_id": job.job_id,
+        "file_names": saved_file_names,
+        "duplicate_file_names": duplicate_file_names,
+        "message": "Documents are queued for processing.",
+    })
+
+# Ingestion job: runs on an ingestion worker thread
+def process_documents(job: IngestionJob):
+    global text_store_snapshot, text_embedding_index, text_lexical_index, text_embedding_index_state
     
-    # Actual processing call (adjust as needed)
-    text_metadata_df = get_document_metadata(
+    get_document_metadata(
         generative_multimodal_model=model,
-        pdf_folder_path=pdf_folder_path,
+        pdf_folder_path=job.pdf_folder_path,
         image_save_dir="images",
         image_description_prompt="Provide a concise description of the image content.",
         embedding_size=768,
-        add_sleep_after_document=True,
-        sleep_time_after_document=5
+        vector_store=vector_store,
+        progress_callback=job.add_event,
+        manifest=ingestion_manifest
     )
     
-    for i in range(stages):
-        # Simulate each stage processing
-        processing_status["progress"] = int((i + 1) / stages * 75)
-            
-    # Update processing status on completion
-    processing_status = {"in_progress": False, "progress": 75}
+    # Update the index off the query path, then publish it to the query endpoints
+    with index_update_lock:
+        # The state is read before the snapshot and the tombstones after it: the recorded state
+        # never claims rows the snapshot misses, and every tombstone in the snapshot is seen
+        store_state = get_store_state()
+        snapshot = vector_store.snapshot()
+
+        rebuild = vector_store.num_deleted != text_embedding_index_state["num_deleted"]
+        if rebuild:
+            # Re-ingested files replaced rows: the live rows changed, so rebuild
+            embedding_index = (
+                QuantizedEmbeddings(snapshot.embeddings, dtype=EMBEDDING_STORAGE_DTYPE, rows=snapshot.live_rows)
+                if EMBEDDING_INDEX == "exact"
+                else create_embedding_index(
+                    EMBEDDING_INDEX, embeddings=snapshot.live_embeddings(), nprobe=EMBEDDING_INDEX_NPROBE
+                )
+            )
+        elif isinstance(text_embedding_index, QuantizedEmbeddings):
+            embedding_index = text_embedding_index.extend(snapshot.embeddings, rows=snapshot.live_rows)
+        else:
+            # Extend a copy, queries may still be searching the current index
+            embedding_index = text_embedding_index.copy()
+            embedding_index.add(snapshot.live_embeddings(len(embedding_index)))
+
+        lexical_index = None
+        if RETRIEVAL_MODE == "hybrid":
+            lexical_index = BM25Index() if rebuild else text_lexical_index.copy()
+            lexical_index.add(snapshot.iter_chunk_texts(len(lexical_index)))
+
+        with index_lock:
+            text_store_snapshot, text_embedding_index = snapshot, embedding_index
+            text_lexical_index = lexical_index
+            text_embedding_index_state = store_state
+
+        if EMBEDDING_INDEX != "exact":
+            save_text_embedding_index(embedding_index, store_state)
+        if lexical_index is not None:
+            save_search_index(lexical_index, LEXICAL_INDEX_PATH, LEXICAL_INDEX_STATE_PATH, store_state)
+
+
+ingestion_jobs = IngestionJobManager(
+    process_documents,
+    max_workers=INGESTION_WORKERS,
+    finished_job_ttl=INGESTION_JOB_TTL_SECONDS,
+    max_finished_jobs=MAX_FINISHED_INGESTION_JOBS,
+)
 
 
 # Endpoint for querying the uploaded documents
 @app.post("/query_documents", response_class=HTMLResponse)
 async def query_documents(
     question: str = Form(...),
-    answer_format: Optional[str] = Form("Provide a detailed answer based on the context")
+    answer_format: Optional[str] = Form("Provide a detailed answer based on the context"),
+    stream: bool = Form(False)
 ):
-    global processing_status, text_metadata_df
+    start_time = time.perf_counter()
+
+    # Take a consistent snapshot of the indexes, ingestion jobs may swap them concurrently
+    with index_lock:
+        snapshot, embedding_index, lexical_index = text_store_snapshot, text_embedding_index, text_lexical_index
 
-    stages = 100
-    for i in range(stages):
-            # Simulate each stage processing
-            processing_status["progress"] = int((i + 1) / stages * 40)
-        
     # Validate if there are any embeddings
-    if text_metadata_df.empty:
+    if snapshot.empty:
         return PlainTextResponse("No documents uploaded. Please upload documents first.", status_code=400)
 
-    # Get relevant chunks based on query
-    matching_results_text = get_similar_text_from_query(
+    # Get relevant chunks based on query, off the event loop (embedding call and scoring block)
+    matching_results_text = await run_in_threadpool(
+        get_similar_text_from_query,
         query=question,
-        text_metadata_df=text_metadata_df,
+        text_metadata_df=snapshot,
         column_name="text_embedding_chunk",  # Assuming column for embeddings is set correctly
         top_n=3,
-        chunk_text=True
+        chunk_text=True,
+        embedding_index=embedding_index,
+        lexical_index=lexical_index
     )
 
     # Combine matched text for the context
     context = "\n".join([value["chunk_text"] for key, value in matching_results_text.items()])
 
-    # Generate response using RAG chain
-    template = f"""
-    Question: {{question}}
-    Context: {{context}}
-    Answer: {answer_format}
-    """
-    prompt = ChatPromptTemplate.from_template(template)
-
-     # Dummy variable to simulate progress (e.g., 10 stages)
-    stages = 100
-    for i in range(stages):
-        # Simulate each stage processing
-        processing_status["progress"] = int((i + 1) / stages * 70)
-        
-    # Set up the input data with question and context
+    # Set up the input data with question, context and answer format
     input_data = {
         "question": question,
-        "context": context
+        "context": context,
+        "answer_format": answer_format
     }
 
-    # Invoke the chain
-    rag_chain = prompt | model
-    
-    add_routes(app, rag_chain, path="/rag_chain")
-    
-    output = rag_chain.invoke(input_data)
-    
-
-    for i in range(stages):
-        # Simulate each stage processing
-        processing_status["progress"] = int((i + 1) / stages * 100)
-
-    
-    print(output)
-
     # Display the result in HTML format
-    return f"""
+    page = f"""
           <html>
           <html>
             <head>
@@ -662,7 +869,7 @@ async def query_documents(
                 <div class="container">
                     <p><strong>Question:</strong> {question}</p>
                     <p><strong>Answer Format:</strong> {answer_format}</p>
-                    <p><strong>Response:</strong> {output}</p>
+                    <p><strong>Response:</strong> {RESPONSE_PLACEHOLDER}</p>
                     <br><a href="/rag">Ask Another Question</a>
                     <br></br>
                     <br><a href="/">Use LLM </a>
@@ -673,10 +880,102 @@ async def query_documents(
         </html>
         """
 
+    if stream:
+        # Push tokens to the browser as they are generated
+        return StreamingResponse(
+            stream_html_page(rag_chain, input_data, page, label="/query_documents", start_time=start_time),
+            media_type="text/html"
+        )
+
+    # Generate response using RAG chain
+    output = await generate(rag_chain, input_data, label="/query_documents", start_time=start_time)
+    
+    print(output)
+
+    return page.replace(RESPONSE_PLACEHOLDER, output)
+
+
 @app.get("/processing_status")
 async def get_processing_status():
     """Endpoint to check the current processing status."""
-    return JSONResponse(content=processing_status)
+    active_jobs = [job for job in ingestion_jobs.list_jobs() if not job.done]
+    progress = [job.progress.get("progress", 0) for job in active_jobs]
+    return JSONResponse(content={
+        "in_progress": bool(active_jobs),
+        "progress": round(sum(progress) / len(progress), 1) if progress else 100,
+        "jobs": [job.to_dict() for job in active_jobs]
+    })
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Endpoint to check the status of one ingestion job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        # Never submitted, or finished and evicted
+        return JSONResponse(content={"error": f"Unknown job: {job_id}"}, status_code=404)
+    return JSONResponse(content=job.to_dict())
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events stream of one ingestion job's progress events."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Unknown job: {job_id}"}, status_code=404)
+
+    async def event_stream():
+        queue = job.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["event"] in ("completed", "failed"):
+                    break
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/generation_stats")
+async def get_generation_stats():
+    """Endpoint to check time-to-first-byte and tokens/sec of recent generations."""
+    return JSONResponse(content=get_generation_stats_summary())
+
+
+@app.get("/llm_pool_stats")
+async def get_llm_pool_stats():
+    """Endpoint to check usage of the pooled LLM clients."""
+    return JSONResponse(content=llm_pool.stats())
+
+
+@app.get("/embedding_cache_stats")
+async def get_embedding_cache_stats():
+    """Endpoint to check the embedding cache hit/miss counters."""
+    return JSONResponse(content=embedding_cache.stats())
+
+
+@app.get("/embedding_index_stats")
+async def get_embedding_index_stats():
+    """Endpoint to check the index kind or storage type and the memory of the searched chunk embeddings and BM25 index."""
+    with index_lock:
+        embedding_index, lexical_index = text_embedding_index, text_lexical_index
+    return JSONResponse(
+        content=dict(
+            embedding_index.memory_usage(),
+            count=len(embedding_index),
+            embedding_model=vector_store.embedding_model,
+            retrieval_mode=RETRIEVAL_MODE,
+            lexical_index=lexical_index.memory_usage() if lexical_index is not None else None,
+        )
+    )
+
+
+@app.get("/rate_limiter_stats")
+async def get_rate_limiter_stats():
+    """Endpoint to check throttling, quota errors and retries of the Vertex AI calls."""
+    return JSONResponse(content=vertex_rate_limiter.stats())
 
 
 # Define a route for the favicon to avoid 404s on favicon.ico requests
@@ -0,0 +1,229 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # google-api-core is only needed to recognise Vertex AI quota errors
+    google_exceptions = None
+
+
+T = TypeVar("T")
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """
+    Checks whether an exception is a quota / rate limit error (HTTP 429 or RESOURCE_EXHAUSTED).
+    """
+    if google_exceptions is not None and isinstance(
+        error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+    ):
+        return True
+
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+
+    message = str(error)
+    return message.startswith("429") or "RESOURCE_EXHAUSTED" in message or "Quota exceeded" in message
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute of budget.
+    Not thread-safe on its own; `RateLimiter` guards it with its lock.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self._last_refill = time.monotonic()
+
+    def refill(self, rate_scale: float = 1.0) -> None:
+        now = time.monotonic()
+        refill_rate = self.rate_per_minute * rate_scale / 60
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * refill_rate)
+        self._last_refill = now
+
+    def wait_time(self, amount: float, rate_scale: float = 1.0) -> float:
+        # Seconds until `amount` tokens are available (0 if they are now)
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / (self.rate_per_minute * rate_scale / 60)
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter for quota-bound API calls, with retry on quota errors.
+
+    Calls wait for a request budget (`requests_per_minute`) and a token budget
+    (`tokens_per_minute`), both refilled continuously, so a shared quota is used at its
+    ceiling without bursts above it. Quota errors are retried with jittered exponential
+    backoff; each one also halves the refill rate, which then recovers gradually with
+    successful calls, so the limiter adapts when the real quota is lower than configured
+    or shared with other clients. All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        min_rate_scale: float = 0.1,
+    ):
+        """
+        Args:
+            requests_per_minute: Maximum calls per minute. No request limit when None.
+            tokens_per_minute: Maximum estimated tokens per minute. No token limit when None.
+            max_retries: Number of retries of a call failing with a quota error.
+            base_delay: Backoff ceiling in seconds for the first retry; doubles every retry.
+            max_delay: Maximum backoff ceiling in seconds.
+            min_rate_scale: Lowest fraction of the configured rates the limiter adapts down to.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_rate_scale = min_rate_scale
+
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._rate_scale = 1.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "tokens": 0,
+            "quota_errors": 0,
+            "retries": 0,
+            "throttled_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Blocks until one request and `tokens` tokens fit in the budget, then consumes them.
+
+        Args:
+            tokens: Estimated tokens of the call. Clamped to one minute of budget.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait_time = 0.0
+                token_amount = 0.0
+                if self._request_bucket is not None:
+                    self._request_bucket.refill(self._rate_scale)
+                    wait_time = self._request_bucket.wait_time(1, self._rate_scale)
+                if self._token_bucket is not None:
+                    self._token_bucket.refill(self._rate_scale)
+                    token_amount = min(tokens, self._token_bucket.capacity)
+                    wait_time = max(
+                        wait_time, self._token_bucket.wait_time(token_amount, self._rate_scale)
+                    )
+
+                if wait_time == 0.0:
+                    if self._request_bucket is not None:
+                        self._request_bucket.tokens -= 1
+                    if self._token_bucket is not None:
+                        self._token_bucket.tokens -= token_amount
+                    self._stats["calls"] += 1
+                    self._stats["tokens"] += tokens
+                    self._stats["throttled_seconds"] += waited
+                    return waited
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def record_usage(self, tokens: int) -> None:
+        """
+        Charges tokens a call used beyond those it acquired, e.g. the output tokens of a
+        generation once its response is complete, so later calls wait for them. A negative
+        amount refunds an overestimate. Does not block.
+
+        Args:
+            tokens: The extra tokens used.
+        """
+        with self._lock:
+            self._stats["tokens"] += tokens
+            if self._token_bucket is not None:
+                self._token_bucket.refill(self._rate_scale)
+                self._token_bucket.tokens = min(self._token_bucket.capacity, self._token_bucket.tokens - tokens)
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._rate_scale = min(1.0, self._rate_scale + 0.02)
+
+    def _on_quota_error(self) -> None:
+        with self._lock:
+            self._stats["quota_errors"] += 1
+            self._rate_scale = max(self.min_rate_scale, self._rate_scale / 2)
+            # Drop the remaining budget so concurrent callers slow down too
+            for bucket in (self._request_bucket, self._token_bucket):
+                if bucket is not None:
+                    bucket.tokens = min(bucket.tokens, 0)
+
+    def call(self, fn: Callable[..., T], *args: Any, tokens: int = 0, **kwargs: Any) -> T:
+        """
+        Calls `fn(*args, **kwargs)` within the rate limit, retrying quota errors.
+
+        Args:
+            fn: The API call. A streamed response should be consumed inside `fn`, so errors
+                raised while reading it are retried too.
+            tokens: Estimated tokens sent by the call. Tokens known only afterwards (e.g.
+                    output tokens) are charged with `record_usage`.
+
+        Returns:
+            The return value of `fn`.
+
+        Raises:
+            The quota error once `max_retries` retries failed, or any other error of `fn`.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_quota_error(e) or attempt >= self.max_retries:
+                    raise
+                self._on_quota_error()
+
+                # Full jitter: spreads the retries of concurrent callers
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                with self._lock:
+                    self._stats["retries"] += 1
+                    self._stats["backoff_seconds"] += delay
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns call counters.
+
+        Returns:
+            A dictionary with the configured rates, the current adaptive rate scale, calls,
+            tokens, quota errors, retries and the time spent throttled and backing off.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["requests_per_minute"] = (
+                self._request_bucket.rate_per_minute if self._request_bucket else None
+            )
+            stats["tokens_per_minute"] = (
+                self._token_bucket.rate_per_minute if self._token_bucket else None
+            )
+            stats["rate_scale"] = round(self._rate_scale, 3)
+
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+        return stats
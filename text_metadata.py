@@ -0,0 +1,333 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from chunking import join_page_texts
+
+
+# Text metadata records, kept free of model and cloud imports like pdf_extraction.
+
+TEXT_METADATA_COLUMNS = [
+    "file_name",
+    "page_num",
+    "end_page_num",
+    "text",
+    "text_embedding_page",
+    "chunk_number",
+    "chunk_text",
+    "text_embedding_chunk",
+    "text_start",
+    "text_end",
+]
+
+
+class Float32Rows:
+    """
+    Growable float32 matrix: rows are copied into one contiguous array whose capacity doubles when full.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._array: Optional[np.ndarray] = None
+        self._initial_capacity = initial_capacity
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, row: Any) -> None:
+        row = np.asarray(row, dtype=np.float32)
+        if self._array is None:
+            self._array = np.empty((self._initial_capacity, row.shape[0]), dtype=np.float32)
+        elif self._count == self._array.shape[0]:
+            grown = np.empty((2 * self._array.shape[0], self._array.shape[1]), dtype=np.float32)
+            grown[: self._count] = self._array[: self._count]
+            self._array = grown
+        self._array[self._count] = row
+        self._count += 1
+
+    def array(self, start: int = 0) -> np.ndarray:
+        """Returns rows `start:` as a (rows, dimension) float32 view (no copy)."""
+        if self._array is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._array[start : self._count]
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._array is None else self._array.nbytes
+
+
+class TextMetadataBuffer:
+    """
+    Append-only, normalized store of text metadata.
+
+    * a pages table: file_name, page_num and the page text, with one float32 page embedding per page;
+    * a chunks table: the pages each chunk starts and ends on, its chunk_number and the
+      character offsets of the chunk in the text of its first page (running on into the
+      following pages for chunks crossing a page break), with one float32 chunk embedding
+      per chunk.
+
+    Page text and page embeddings are stored once per page instead of once per chunk, and
+    embeddings live in contiguous float32 matrices instead of Python lists. Rows are
+    appended in amortized O(1) and only turned into DataFrames when materialized, so
+    ingesting a corpus file by file costs time linear in its size.
+    """
+
+    def __init__(self):
+        # Pages table
+        self._page_file_names: List[str] = []
+        self._page_nums: List[int] = []
+        self._page_texts: List[str] = []
+        self._page_embeddings = Float32Rows()
+        self._page_embedding_rows: List[int] = []  # Row in the page embeddings, -1 for none
+        # Chunks table
+        self._chunk_page_ids: List[int] = []
+        self._chunk_end_page_ids: List[int] = []
+        self._chunk_numbers: List[int] = []
+        self._chunk_starts: List[int] = []
+        self._chunk_ends: List[int] = []
+        self._chunk_embeddings = Float32Rows()
+
+    def __len__(self) -> int:
+        return len(self._chunk_numbers)
+
+    @property
+    def num_pages(self) -> int:
+        return len(self._page_nums)
+
+    def add_page(
+        self,
+        file_name: str,
+        page_num: int,
+        text: str,
+        page_text_embeddings: Dict[str, Any],
+        chunked_text_dict: Dict[int, str],
+        chunk_embeddings_dict: Dict[int, Any],
+        chunk_offsets: Optional[Dict[int, Tuple[int, int]]] = None,
+        chunk_end_pages: Optional[Dict[int, int]] = None,
+    ) -> None:
+        """
+        Appends a page and the chunks starting on it.
+
+        Args:
+            file_name: The filename of the document.
+            page_num: The 0-based page number.
+            text: The page text.
+            page_text_embeddings: Dictionary with the page embedding (key="text_embedding"),
+                                  empty for a page without text.
+            chunked_text_dict: Dictionary of chunked text (key=chunk number, value=text chunk).
+            chunk_embeddings_dict: Dictionary of chunk embeddings (key=chunk number).
+            chunk_offsets: Dictionary of (start, end) character offsets of every chunk in `text`.
+                           Located in `text` when not given.
+            chunk_end_pages: Dictionary of the 0-based page every chunk crossing a page break
+                             ends on (see `chunking.DocumentChunker`). Its offsets then run on
+                             into the following pages, joined by `chunking.join_page_texts`,
+                             which must be added next. Other chunks end on this page.
+
+        Raises:
+            ValueError: If a chunk is not part of the page text.
+        """
+        page_id = len(self._page_nums)
+        self._page_file_names.append(file_name)
+        self._page_nums.append(int(page_num) + 1)
+        self._page_texts.append(text)
+        if "text_embedding" in page_text_embeddings:
+            self._page_embedding_rows.append(len(self._page_embeddings))
+            self._page_embeddings.append(page_text_embeddings["text_embedding"])
+        else:
+            self._page_embedding_rows.append(-1)
+
+        search_start = 0
+        for chunk_number, chunk_text in chunked_text_dict.items():
+            if chunk_offsets is not None:
+                start, end = chunk_offsets[chunk_number]
+            else:
+                start = text.find(chunk_text, search_start)
+                if start == -1:
+                    raise ValueError(
+                        f"Chunk {chunk_number} of page {page_num} of {file_name} is not part of the page text."
+                    )
+                end = start + len(chunk_text)
+                search_start = start + 1
+
+            self._chunk_page_ids.append(page_id)
+            self._chunk_end_page_ids.append(
+                page_id + chunk_end_pages.get(chunk_number, int(page_num)) - int(page_num)
+                if chunk_end_pages is not None
+                else page_id
+            )
+            self._chunk_numbers.append(chunk_number)
+            self._chunk_starts.append(start)
+            self._chunk_ends.append(end)
+            self._chunk_embeddings.append(chunk_embeddings_dict[chunk_number])
+
+    def add_text_metadata(
+        self, file_name: str, text_metadata: Dict[Union[int, str], Dict]
+    ) -> None:
+        """
+        Appends every page of a file.
+
+        Args:
+            file_name: The filename of the document.
+            text_metadata: A dictionary containing the text metadata for each page
+                           (see `utils.get_text_metadata_df`), optionally with chunk_offsets
+                           and chunk_end_pages.
+
+        Raises:
+            ValueError: If a chunk ends on a page that does not follow it in `text_metadata`.
+        """
+        # Pages spanned by a chunk are added consecutively, so its end page id follows from the span
+        page_nums = [int(key) for key in text_metadata]
+        for position, (page_num, values) in enumerate(zip(page_nums, text_metadata.values())):
+            for chunk_number, end_page_num in values.get("chunk_end_pages", {}).items():
+                spanned_page_nums = page_nums[position : position + end_page_num - page_num + 1]
+                if end_page_num < page_num or spanned_page_nums != list(range(page_num, end_page_num + 1)):
+                    raise ValueError(
+                        f"Chunk {chunk_number} of page {page_num} of {file_name} ends on page {end_page_num}, "
+                        "which does not follow it."
+                    )
+
+        for key, values in text_metadata.items():
+            self.add_page(
+                file_name,
+                int(key),
+                values["text"],
+                values["page_text_embeddings"],
+                values["chunked_text_dict"],
+                values["chunk_embeddings_dict"],
+                values.get("chunk_offsets"),
+                values.get("chunk_end_pages"),
+            )
+
+    def _chunk_texts(self, page_ids: List[int], start: int) -> List[str]:
+        return [
+            self._page_texts[page_id][chunk_start:chunk_end]
+            if end_page_id == page_id
+            else join_page_texts(self._page_texts[page_id : end_page_id + 1])[chunk_start:chunk_end]
+            for page_id, end_page_id, chunk_start, chunk_end in zip(
+                page_ids, self._chunk_end_page_ids[start:], self._chunk_starts[start:], self._chunk_ends[start:]
+            )
+        ]
+
+    def pages_df(self, start_page: int = 0) -> pd.DataFrame:
+        """
+        Materializes the pages table.
+
+        Args:
+            start_page: Index of the first page to include.
+
+        Returns:
+            A DataFrame with page_id, file_name, page_num and text columns.
+        """
+        return pd.DataFrame(
+            {
+                "page_id": np.arange(start_page, self.num_pages, dtype=np.int64),
+                "file_name": self._page_file_names[start_page:],
+                "page_num": np.asarray(self._page_nums[start_page:], dtype=np.int32),
+                "text": self._page_texts[start_page:],
+            }
+        )
+
+    def page_embeddings(self) -> np.ndarray:
+        """
+        Returns the (pages with text, dimension) float32 page embedding matrix.
+        Pages without text have no embedding; see `page_embedding_rows` for the row of each page.
+        """
+        return self._page_embeddings.array()
+
+    def page_embedding_rows(self) -> np.ndarray:
+        """Returns the row of every page in `page_embeddings`, -1 for pages without text."""
+        return np.asarray(self._page_embedding_rows, dtype=np.int64)
+
+    def chunk_embeddings(self, start: int = 0) -> np.ndarray:
+        """Returns the (chunks, dimension) float32 chunk embedding matrix, from chunk `start` on."""
+        return self._chunk_embeddings.array(start)
+
+    def _chunk_columns(self, start: int) -> Dict[str, Any]:
+        page_ids = self._chunk_page_ids[start:]
+        return {
+            "page_id": np.asarray(page_ids, dtype=np.int64),
+            "file_name": [self._page_file_names[page_id] for page_id in page_ids],
+            "page_num": np.asarray(
+                [self._page_nums[page_id] for page_id in page_ids], dtype=np.int32
+            ),
+            "end_page_num": np.asarray(
+                [self._page_nums[page_id] for page_id in self._chunk_end_page_ids[start:]], dtype=np.int32
+            ),
+            "chunk_number": np.asarray(self._chunk_numbers[start:], dtype=np.int32),
+            "text_start": np.asarray(self._chunk_starts[start:], dtype=np.int64),
+            "text_end": np.asarray(self._chunk_ends[start:], dtype=np.int64),
+            "chunk_text": self._chunk_texts(page_ids, start),
+            "text_embedding_chunk": list(self.chunk_embeddings(start)),
+        }
+
+    def chunks_df(self, start: int = 0) -> pd.DataFrame:
+        """
+        Materializes the chunks table, with the chunk text sliced from the page text.
+
+        Args:
+            start: Index of the first chunk to include, e.g. the buffer length before a file
+                   was added to get that file's chunks only.
+
+        Returns:
+            A DataFrame with page_id, file_name, page_num, end_page_num (the 1-based page the
+            chunk ends on), chunk_number, text_start, text_end, chunk_text and
+            text_embedding_chunk columns. text_embedding_chunk holds float32
+            row views of `chunk_embeddings`. Empty (without columns) when there are no chunks.
+        """
+        if start >= len(self):
+            return pd.DataFrame()
+
+        return pd.DataFrame(self._chunk_columns(start))
+
+    def to_df(self, start: int = 0) -> pd.DataFrame:
+        """
+        Materializes one row per chunk in the wide layout of `utils.get_text_metadata_df`.
+
+        The page text and page embedding of a row reference the page's single copy rather than
+        duplicating it, and embeddings are float32 row views rather than lists.
+
+        Args:
+            start: Index of the first chunk to include.
+
+        Returns:
+            A DataFrame with the `TEXT_METADATA_COLUMNS` and a fresh RangeIndex.
+            Empty (without columns) when there are no rows.
+        """
+        if start >= len(self):
+            return pd.DataFrame()
+
+        columns = self._chunk_columns(start)
+        page_embeddings = self.page_embeddings()
+        page_ids = self._chunk_page_ids[start:]
+        columns["text"] = [self._page_texts[page_id] for page_id in page_ids]
+        columns["text_embedding_page"] = [
+            page_embeddings[self._page_embedding_rows[page_id]]
+            if self._page_embedding_rows[page_id] >= 0
+            else None
+            for page_id in page_ids
+        ]
+
+        return pd.DataFrame({column: columns[column] for column in TEXT_METADATA_COLUMNS})
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Returns the approximate bytes held by the buffer.
+
+        Returns:
+            A dictionary with the bytes of the page texts, the embedding matrices and the
+            remaining table columns, and their total.
+        """
+        page_text_bytes = sum(len(text) for text in self._page_texts)
+        embedding_bytes = self._page_embeddings.nbytes + self._chunk_embeddings.nbytes
+        # 4 bytes per int32 page number, 8 per int64 page id / offset, 4 per chunk number
+        table_bytes = 4 * self.num_pages + 36 * len(self) + sum(
+            len(file_name) for file_name in set(self._page_file_names)
+        )
+
+        return {
+            "page_text_bytes": page_text_bytes,
+            "embedding_bytes": embedding_bytes,
+            "table_bytes": table_bytes,
+            "total_bytes": page_text_bytes + embedding_bytes + table_bytes,
+        }
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import uuid
+from typing import List, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import FormParserError
+
+
+# Streamed saving of uploaded files: bounded memory, size limits and atomic publication.
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the per-file or per-request size limit."""
+
+
+class SavedUpload:
+    """
+    A file saved by `MultipartUploadParser`.
+    """
+
+    def __init__(self, file_name: str, path: str, file_hash: str, size: int):
+        self.file_name = file_name
+        self.path = path
+        self.file_hash = file_hash  # Hex SHA-256, as `ingestion_manifest.get_file_hash`
+        self.size = size
+
+
+def get_upload_file_name(file_name: Optional[str]) -> str:
+    """
+    Returns a safe file name for an uploaded file: its base name, without directories.
+
+    Raises:
+        ValueError: If the name is empty or only a directory.
+    """
+    # Browsers on Windows may send "C:\\path\\name.pdf"
+    base_name = os.path.basename((file_name or "").replace("\\", "/"))
+    if base_name in ("", ".", ".."):
+        raise ValueError(f"Invalid upload file name {file_name!r}.")
+    return base_name
+
+
+class UploadWriter:
+    """
+    Writes one uploaded file to a hidden temporary file in `directory`, hashing it on the fly,
+    and renames it to `file_name` once complete, so readers of `directory` (e.g. a `*.pdf`
+    glob) never see a partial file.
+    """
+
+    def __init__(self, directory: str, file_name: str, max_bytes: Optional[int] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.file_name = file_name
+        self.path = os.path.join(directory, file_name)
+        self.temp_path = os.path.join(directory, f".{file_name}.{uuid.uuid4().hex}.part")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.temp_path, "wb")
+
+    def write(self, data: bytes) -> None:
+        """
+        Appends `data` to the file.
+
+        Raises:
+            UploadTooLargeError: If the file exceeds `max_bytes`. Call `abort` to clean up.
+        """
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLargeError(
+                f"{self.file_name} exceeds the maximum upload size of {self.max_bytes} bytes."
+            )
+        self._digest.update(data)
+        self._file.write(data)
+
+    def close(self) -> SavedUpload:
+        """
+        Publishes the complete file under its name.
+
+        Returns:
+            The saved file, with its SHA-256 hash and size.
+        """
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+        return SavedUpload(self.file_name, self.path, self._digest.hexdigest(), self.size)
+
+    def abort(self) -> None:
+        """Discards the partial file."""
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class MultipartUploadParser:
+    """
+    Saves the files of a `multipart/form-data` request body to disk as its bytes arrive.
+
+    Feed the raw body to `write` chunk by chunk (e.g. from `Request.stream()`), then call
+    `finish`. Each file part goes straight through an `UploadWriter`: nothing is spooled to a
+    temporary file first, and the file count, per-file and per-request limits are enforced on
+    the bytes received so far, so an oversized upload is rejected as soon as it crosses a limit.
+    Blocking; call `write` on a worker thread from async code.
+    """
+
+    def __init__(
+        self,
+        content_type: str,
+        directory: str,
+        field_name: str = "files",
+        max_files: Optional[int] = None,
+        max_file_bytes: Optional[int] = None,
+        max_request_bytes: Optional[int] = None,
+    ):
+        """
+        Args:
+            content_type: The request's Content-Type header, with the multipart boundary.
+            directory: The destination folder, created when the first file arrives.
+            field_name: The form field holding the files. Other fields are ignored.
+            max_files: Maximum number of files, None for no limit.
+            max_file_bytes: Maximum size of each file, None for no limit.
+            max_request_bytes: Maximum size of the request body, None for no limit.
+
+        Raises:
+            ValueError: If the request is not `multipart/form-data` with a boundary.
+        """
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise ValueError("Uploads must be sent as multipart/form-data.")
+
+        self.directory = directory
+        self.field_name = field_name
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.num_bytes = 0
+        self.saved_uploads: List[SavedUpload] = []
+        self._file_names = set()
+        self._writer: Optional[UploadWriter] = None
+        self._header_name = b""
+        self._header_value = b""
+        self._content_disposition = b""
+        self._parser = MultipartParser(
+            options[b"boundary"],
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+
+    def write(self, data: bytes) -> None:
+        """
+        Parses the next chunk of the request body, writing file content to disk.
+
+        Raises:
+            UploadTooLargeError: If a file or the request exceeds its size limit.
+            ValueError: If the body is malformed, has too many files or repeats a file name.
+        """
+        self.num_bytes += len(data)
+        if self.max_request_bytes is not None and self.num_bytes > self.max_request_bytes:
+            raise UploadTooLargeError(
+                f"The upload exceeds the maximum request size of {self.max_request_bytes} bytes."
+            )
+        try:
+            self._parser.write(data)
+        except FormParserError as e:
+            raise ValueError(f"Invalid multipart upload: {e}") from e
+
+    def finish(self) -> List[SavedUpload]:
+        """
+        Checks that the body was complete.
+
+        Returns:
+            The saved files, in request order.
+
+        Raises:
+            ValueError: If the body ended early or held no files.
+        """
+        try:
+            self._parser.finalize()
+        except FormParserError as e:
+            raise ValueError(f"Invalid multipart upload: {e}") from e
+        if self._writer is not None:
+            raise ValueError("Invalid multipart upload: the request body ended inside a file.")
+        if not self.saved_uploads:
+            raise ValueError(f"No files were uploaded in the {self.field_name!r} field.")
+        return self.saved_uploads
+
+    def abort(self) -> None:
+        """Discards the partial file being written, if any. Saved files are left to the caller."""
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+    def _on_part_begin(self) -> None:
+        self._content_disposition = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._content_disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._content_disposition)
+        if b"filename" not in options:
+            return  # A plain form field
+        field_name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if field_name != self.field_name:
+            raise ValueError(f"Unexpected file field {field_name!r}; upload files as {self.field_name!r}.")
+        if self.max_files is not None and len(self._file_names) >= self.max_files:
+            raise ValueError(f"You can upload a maximum of {self.max_files} files at once.")
+
+        # Each file is saved under its name, so a repeated name would overwrite the first copy
+        file_name = get_upload_file_name(options[b"filename"].decode("utf-8", errors="replace"))
+        if file_name in self._file_names:
+            raise ValueError(f"Each file name can be uploaded once per request: {file_name}.")
+        self._file_names.add(file_name)
+        self._writer = UploadWriter(self.directory, file_name, max_bytes=self.max_file_bytes)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writer is not None:
+            self._writer.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._writer is not None:
+            self.saved_uploads.append(self._writer.close())
+            self._writer = None
@@ -1,58 +1,140 @@
 
 import glob
+import logging
 import os
 import time
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-from IPython.display import display
-import PIL
 import fitz
 import numpy as np
 import pandas as pd
-import requests
-from vertexai.generative_models import (
-    GenerationConfig,
-    HarmBlockThreshold,
-    HarmCategory,
-    Image,
+from embedding_cache import EmbeddingCache, get_embedding_cache_key
+from ingestion_pipeline import Pipeline, PipelineStage
+from text_metadata import TextMetadataBuffer
+from ann_index import EmbeddingIndex, create_embedding_index
+from quantized_embeddings import QuantizedEmbeddings
+from vector_store import VectorStoreSnapshot
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from chunking import DocumentChunk, DocumentChunker, TextChunker, create_chunker
+from rate_limiter import RateLimiter
+from embedding_backends import create_embedding_backend
+from ingestion_manifest import IngestionManifest, get_file_hash, get_page_hash
+from pdf_extraction import (
+    extract_pdf_page_text,
+    get_extraction_executor,
+    get_pdf_doc_object,
+    get_text_overlapping_chunk,
+    _extract_pdf_page_text_task,
 )
-from vertexai.vision_models import Image as vision_model_Image
-from langchain_core.output_parsers import BaseTransformOutputParser
-from IPython.display import display
-from rich import print as rich_print
-from rich.markdown import Markdown as rich_Markdown
-from vertexai.generative_models import (
-    GenerationConfig,
-    GenerativeModel,
-    HarmBlockThreshold,
-    HarmCategory,
-    Image,
-)
-from vertexai.language_models import TextEmbeddingModel
-from vertexai.vision_models import MultiModalEmbeddingModel
-from langchain_google_vertexai import VertexAIEmbeddings
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+
+# vertexai, PIL and IPython are imported where they are used: importing vertexai alone
+# takes seconds, and the embedding models are only loaded (and Vertex AI initialized) by
+# the embedding backend on first use, so the servers start quickly and offline.
+if TYPE_CHECKING:
+    import PIL.Image
+    from vertexai.generative_models import GenerationConfig, Image
 
 
 PROJECT_ID = "rag-apps-440510"
 LOCATION = "us-central1"
 
-import sys
-import vertexai
-# Additional authentication is required for Google Colab
-if "google.colab" in sys.modules:
-    # Authenticate user to Google Cloud
-    from google.colab import auth
-    auth.authenticate_user()
-    
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+TEXT_EMBEDDING_MODEL_NAME = "text-embedding-004"
+TEXT_EMBEDDING_SIZE = 768
+MULTIMODAL_EMBEDDING_MODEL_NAME = "multimodalembedding"
+
+# Embedding backend of this deployment: "vertex" (Vertex AI models) or "local" (offline
+# hashed vectors for load tests, see `embedding_backends.LocalEmbeddingBackend`)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "vertex")
+if EMBEDDING_BACKEND == "vertex":
+    embedding_backend = create_embedding_backend(
+        "vertex",
+        project=PROJECT_ID,
+        location=LOCATION,
+        text_model_name=TEXT_EMBEDDING_MODEL_NAME,
+        image_model_name=MULTIMODAL_EMBEDDING_MODEL_NAME,
+        text_dimension=TEXT_EMBEDDING_SIZE,
+    )
+else:
+    embedding_backend = create_embedding_backend(EMBEDDING_BACKEND, text_dimension=TEXT_EMBEDDING_SIZE)
+
+# Chunking of page text: "structured" (whole sentences and paragraphs within a token budget)
+# or "fixed" (1000-character windows, see `chunking.FixedCharacterChunker`)
+CHUNKER = os.environ.get("CHUNKER", "structured")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", 384))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 32))
+
+
+def get_default_chunker() -> TextChunker:
+    """Returns the chunker configured by CHUNKER, CHUNK_MAX_TOKENS and CHUNK_OVERLAP_TOKENS."""
+    if CHUNKER == "structured":
+        return create_chunker(CHUNKER, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+    return create_chunker(CHUNKER)
+
+
+# Cache of text and image embeddings keyed by content hash, model name and dimension
+embedding_cache = EmbeddingCache(cache_path="embedding_cache/embeddings.sqlite")
+
+# Per-request limits of the text embedding API, used to size embedding batches
+TEXT_EMBEDDING_BATCH_SIZE = 250
+TEXT_EMBEDDING_BATCH_TOKEN_LIMIT = 20000
+
+# Shared quota of the Vertex AI embedding and generation calls (unset = no limit)
+VERTEX_REQUESTS_PER_MINUTE = float(os.environ.get("VERTEX_REQUESTS_PER_MINUTE", 600)) or None
+VERTEX_TOKENS_PER_MINUTE = float(os.environ.get("VERTEX_TOKENS_PER_MINUTE", 0)) or None
+
+# Rate limiter every Vertex AI call goes through; retries quota errors with backoff
+vertex_rate_limiter = RateLimiter(
+    requests_per_minute=VERTEX_REQUESTS_PER_MINUTE,
+    tokens_per_minute=VERTEX_TOKENS_PER_MINUTE,
+)
+
+
+def call_embedding_backend(fn: Callable[..., Any], *args: Any, tokens: int = 0, **kwargs: Any) -> Any:
+    """
+    Calls an `embedding_backend` method, through `vertex_rate_limiter` if the backend uses a remote quota.
+
+    Args:
+        fn: The backend method.
+        tokens: Estimated tokens sent by the call.
+
+    Returns:
+        The return value of `fn`.
+    """
+    if embedding_backend.rate_limited:
+        return vertex_rate_limiter.call(fn, *args, tokens=tokens, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def get_generation_config(
+    temperature: float = 0.2, max_output_tokens: int = 2048
+) -> "GenerationConfig":
+    """
+    Builds a Gemini generation config.
+
+    Args:
+        temperature: The sampling temperature.
+        max_output_tokens: The maximum number of generated tokens.
+
+    Returns:
+        The generation config.
+    """
+    from vertexai.generative_models import GenerationConfig
+
+    return GenerationConfig(temperature=temperature, max_output_tokens=max_output_tokens)
 
 
-# Load text embedding model from pre-trained source
-text_embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-# Load multimodal embedding model from pre-trained source
-multimodal_embedding_model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding")  # works with image, image with caption(~32 words), video, video with caption(~32 words)
+def get_default_safety_settings() -> dict:
+    """
+    Returns the Gemini safety settings used by default: no blocking in any harm category.
+    """
+    from vertexai.generative_models import HarmBlockThreshold, HarmCategory
+
+    return {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
 
 
 
@@ -72,6 +154,122 @@ def set_global_variable(variable_name: str, value: any) -> None:
 
 # Functions for getting text and image embeddings
 
+def estimate_token_count(text: str) -> int:
+    """
+    Roughly estimates the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text: The input text string.
+
+    Returns:
+        The estimated token count.
+    """
+    return len(text) // 4 + 1
+
+
+def get_text_embedding_batches(
+    texts: List[str],
+    batch_size: int = TEXT_EMBEDDING_BATCH_SIZE,
+    batch_token_limit: int = TEXT_EMBEDDING_BATCH_TOKEN_LIMIT,
+) -> List[List[int]]:
+    """
+    Groups texts into batches bounded by item count and estimated token budget.
+
+    Args:
+        texts: The texts to be embedded.
+        batch_size: Maximum number of texts per batch.
+        batch_token_limit: Maximum estimated tokens per batch. A single text above
+                           the limit is sent on its own.
+
+    Returns:
+        A list of batches, each batch being a list of indices into `texts`.
+    """
+    batches: List[List[int]] = []
+    current_batch: List[int] = []
+    current_tokens = 0
+
+    for index, text in enumerate(texts):
+        tokens = estimate_token_count(text)
+        if current_batch and (
+            len(current_batch) >= batch_size
+            or current_tokens + tokens > batch_token_limit
+        ):
+            batches.append(current_batch)
+            current_batch, current_tokens = [], 0
+
+        current_batch.append(index)
+        current_tokens += tokens
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def get_text_embeddings_from_text_embedding_model(
+    texts: List[str],
+    return_array: Optional[bool] = False,
+    batch_size: int = TEXT_EMBEDDING_BATCH_SIZE,
+    batch_token_limit: int = TEXT_EMBEDDING_BATCH_TOKEN_LIMIT,
+) -> list:
+    """
+    Generates text embeddings for many texts, sending them to the text embedding model in batches.
+
+    Args:
+        texts: The input text strings to be embedded.
+        return_array: If True, returns each embedding as a NumPy array.
+                      If False, returns each embedding as a list. (Default: False)
+        batch_size: Maximum number of texts sent in one call.
+        batch_token_limit: Maximum estimated tokens sent in one call.
+
+    Returns:
+        list: One 768-dimensional embedding per input text, in the same order as `texts`.
+    """
+    cache_keys = [
+        get_embedding_cache_key(
+            text, embedding_backend.text_model_name, embedding_backend.text_dimension
+        )
+        for text in texts
+    ]
+    cached_embeddings = embedding_cache.get_many(cache_keys)
+
+    text_embeddings: List[Any] = [
+        cached_embeddings[key].tolist() if key in cached_embeddings else None
+        for key in cache_keys
+    ]
+
+    # Only distinct texts missing from the cache are sent to the model
+    missing_indices: Dict[str, List[int]] = {}
+    for index, key in enumerate(cache_keys):
+        if key not in cached_embeddings:
+            missing_indices.setdefault(key, []).append(index)
+    missing_keys = list(missing_indices.keys())
+    missing_texts = [texts[missing_indices[key][0]] for key in missing_keys]
+
+    for batch in get_text_embedding_batches(missing_texts, batch_size, batch_token_limit):
+        batch_texts = [missing_texts[i] for i in batch]
+        embeddings = call_embedding_backend(
+            embedding_backend.get_text_embeddings,
+            batch_texts,
+            tokens=sum(estimate_token_count(text) for text in batch_texts),
+        )
+
+        # Scatter the vectors back to the position of their text
+        new_embeddings = {}
+        for i, embedding in zip(batch, embeddings):
+            new_embeddings[missing_keys[i]] = embedding
+            for index in missing_indices[missing_keys[i]]:
+                text_embeddings[index] = embedding
+        embedding_cache.put_many(new_embeddings)
+
+    if return_array:
+        text_embeddings = [
+            np.fromiter(text_embedding, dtype=np.float32) for text_embedding in text_embeddings
+        ]
+
+    return text_embeddings
+
+
 def get_text_embedding_from_text_embedding_model(
     text: str,
     return_array: Optional[bool] = False,
@@ -89,14 +287,10 @@ def get_text_embedding_from_text_embedding_model(
                                The format (list or NumPy array) depends on the
                                value of the 'return_array' parameter.
     """
-    embeddings = text_embedding_model.get_embeddings([text])
-    text_embedding = [embedding.values for embedding in embeddings][0]
-
-    if return_array:
-        text_embedding = np.fromiter(text_embedding, dtype=float)
-
     # returns 768 dimensional array
-    return text_embedding
+    return get_text_embeddings_from_text_embedding_model(
+        [text], return_array=return_array
+    )[0]
 
 
 def get_image_embedding_from_multimodal_embedding_model(
@@ -118,15 +312,36 @@ def get_image_embedding_from_multimodal_embedding_model(
     Returns:
         list: A list containing the image embedding values. If `return_array` is True, returns a NumPy array instead.
     """
-    # image = Image.load_from_file(image_uri)
-    image = vision_model_Image.load_from_file(image_uri)
-    embeddings = multimodal_embedding_model.get_embeddings(
-        image=image, contextual_text=text, dimension=embedding_size
-    )  # 128, 256, 512, 1408
-    image_embedding = embeddings.image_embedding
+    if image_uri.startswith("gs://"):
+        # Cloud Storage objects are keyed by their URI
+        image_bytes = None
+        image_content = image_uri.encode("utf-8")
+    else:
+        image_bytes = load_image_bytes(image_uri)
+        image_content = image_bytes
+
+    cache_key = get_embedding_cache_key(
+        image_content + b"\0" + (text or "").encode("utf-8"),
+        embedding_backend.image_model_name,
+        embedding_size,
+    )
+    cached_embedding = embedding_cache.get(cache_key)
+
+    if cached_embedding is not None:
+        image_embedding = cached_embedding.tolist()
+    else:
+        image_embedding = call_embedding_backend(
+            embedding_backend.get_image_embedding,
+            image_uri,
+            image_bytes,
+            text,
+            embedding_size,
+            tokens=estimate_token_count(text or ""),
+        )
+        embedding_cache.put(cache_key, image_embedding)
 
     if return_array:
-        image_embedding = np.fromiter(image_embedding, dtype=float)
+        image_embedding = np.fromiter(image_embedding, dtype=np.float32)
 
     return image_embedding
 
@@ -149,6 +364,8 @@ def load_image_bytes(image_path):
 
     # Load the image from a weblink
     if image_path.startswith("http://") or image_path.startswith("https://"):
+        import requests
+
         response = requests.get(image_path, stream=True)
         if response.status_code == 200:
             return response.content
@@ -158,30 +375,6 @@ def load_image_bytes(image_path):
         return open(image_path, "rb").read()
 
 
-def get_pdf_doc_object(pdf_path: str) -> tuple[fitz.Document, int]:
-    """
-    Opens a PDF file using fitz.open() and returns the PDF document object and the number of pages.
-
-    Args:
-        pdf_path: The path to the PDF file.
-
-    Returns:
-        A tuple containing the `fitz.Document` object and the number of pages in the PDF.
-
-    Raises:
-        FileNotFoundError: If the provided PDF path is invalid.
-
-    """
-
-    # Open the PDF file
-    doc: fitz.Document = fitz.open(pdf_path)
-
-    # Get the number of pages in the PDF file
-    num_pages: int = len(doc)
-
-    return doc, num_pages
-
-
 # Add colors to the print
 class Color:
     """
@@ -201,50 +394,6 @@ class Color:
     END: str = "\033[0m"
 
 
-def get_text_overlapping_chunk(
-    text: str, character_limit: int = 1000, overlap: int = 100
-) -> dict:
-    """
-    * Breaks a text document into chunks of a specified size, with an overlap between chunks to preserve context.
-    * Takes a text document, character limit per chunk, and overlap between chunks as input.
-    * Returns a dictionary where the keys are chunk numbers and the values are the corresponding text chunks.
-
-    Args:
-        text: The text document to be chunked.
-        character_limit: Maximum characters per chunk (defaults to 1000).
-        overlap: Number of overlapping characters between chunks (defaults to 100).
-
-    Returns:
-        A dictionary where keys are chunk numbers and values are the corresponding text chunks.
-
-    Raises:
-        ValueError: If `overlap` is greater than `character_limit`.
-
-    """
-
-    if overlap > character_limit:
-        raise ValueError("Overlap cannot be larger than character limit.")
-
-    # Initialize variables
-    chunk_number = 1
-    chunked_text_dict = {}
-
-    # Iterate over text with the given limit and overlap
-    for i in range(0, len(text), character_limit - overlap):
-        end_index = min(i + character_limit, len(text))
-        chunk = text[i:end_index]
-
-        # Encode and decode for consistent encoding
-        chunked_text_dict[chunk_number] = chunk.encode("ascii", "ignore").decode(
-            "utf-8", "ignore"
-        )
-
-        # Increment chunk number
-        chunk_number += 1
-
-    return chunked_text_dict
-
-
 def get_page_text_embedding(text_data: Union[dict, str]) -> dict:
     """
     * Generates embeddings for each text chunk using a specified embedding model.
@@ -266,11 +415,12 @@ def get_page_text_embedding(text_data: Union[dict, str]) -> dict:
         return embeddings_dict
 
     if isinstance(text_data, dict):
-        # Process each chunk
-        # print(text_data)
-        for chunk_number, chunk_value in text_data.items():
-            text_embd = get_text_embedding_from_text_embedding_model(text=chunk_value)
-            embeddings_dict[chunk_number] = text_embd
+        # Embed all chunks in as few calls as possible
+        chunk_numbers = list(text_data.keys())
+        text_embds = get_text_embeddings_from_text_embedding_model(
+            [text_data[chunk_number] for chunk_number in chunk_numbers]
+        )
+        embeddings_dict = dict(zip(chunk_numbers, text_embds))
     else:
         # Process the first 1000 characters of the page text
         text_embd = get_text_embedding_from_text_embedding_model(text=text_data)
@@ -312,23 +462,82 @@ def get_chunk_text_metadata(
         raise ValueError("Overlap cannot be larger than character limit.")
 
     # Extract text from the page
-    text: str = page.get_text().encode("ascii", "ignore").decode("utf-8", "ignore")
-
-    # Get whole-page text embeddings
-    page_text_embeddings_dict: dict = get_page_text_embedding(text)
+    text: str = page.get_text()
 
     # Chunk the text with the given limit and overlap
     chunked_text_dict: dict = get_text_overlapping_chunk(text, character_limit, overlap)
     # print(chunked_text_dict)
 
-    # Get embeddings for the chunks
-    chunk_embeddings_dict: dict = get_page_text_embedding(chunked_text_dict)
+    # Get embeddings for the whole page and the chunks
+    page_text_embeddings_dict, chunk_embeddings_dict = get_page_and_chunk_text_embeddings(
+        text, chunked_text_dict
+    )
     # print(chunk_embeddings_dict)
 
     # Return all extracted data
     return text, page_text_embeddings_dict, chunked_text_dict, chunk_embeddings_dict
 
 
+def get_page_and_chunk_text_embeddings(
+    text: str, chunked_text_dict: dict
+) -> tuple[dict, dict]:
+    """
+    Embeds a page text and its chunks together in batched calls.
+
+    Args:
+        text: The page text.
+        chunked_text_dict: Dictionary of chunked text (key=chunk number, value=text chunk).
+
+    Returns:
+        A tuple containing:
+            - Dictionary of embeddings for the entire page text (key="text_embedding"), empty for an empty page.
+            - Dictionary of embeddings for each chunk (key=chunk number, value=embedding).
+    """
+
+    page_text_embeddings_dict: dict = {}
+    chunk_embeddings_dict: dict = {}
+
+    if text:
+        chunk_numbers = list(chunked_text_dict.keys())
+        text_embds = get_text_embeddings_from_text_embedding_model(
+            [text] + [chunked_text_dict[chunk_number] for chunk_number in chunk_numbers]
+        )
+        page_text_embeddings_dict["text_embedding"] = text_embds[0]
+        chunk_embeddings_dict = dict(zip(chunk_numbers, text_embds[1:]))
+
+    return page_text_embeddings_dict, chunk_embeddings_dict
+
+
+def get_page_records_text_embeddings(
+    page_records: List[Dict[str, Any]], chunk_texts: List[str]
+) -> List[List[float]]:
+    """
+    Embeds the text of several pages and their chunks together in batched calls.
+
+    Args:
+        page_records: Page dictionaries with the page_num and text (see
+                      `pdf_extraction.extract_pdf_page_text`). Each one gets its
+                      page_text_embeddings set in place.
+        chunk_texts: Texts of the chunks of these pages (see `chunking.DocumentChunker`),
+                     embedded in the same calls.
+
+    Returns:
+        The embeddings of `chunk_texts`, in the same order.
+    """
+
+    texts = [page_record["text"] for page_record in page_records if page_record["text"]]
+    texts.extend(chunk_texts)
+
+    text_embds = iter(get_text_embeddings_from_text_embedding_model(texts) if texts else [])
+
+    for page_record in page_records:
+        page_record["page_text_embeddings"] = {}
+        if page_record["text"]:
+            page_record["page_text_embeddings"]["text_embedding"] = next(text_embds)
+
+    return list(text_embds)
+
+
 def get_image_for_gemini(
     doc: fitz.Document,
     image: tuple,
@@ -336,7 +545,7 @@ def get_image_for_gemini(
     image_save_dir: str,
     file_name: str,
     page_num: int,
-) -> Tuple[Image, str]:
+) -> Tuple["Image", str]:
     """
     Extracts an image from a PDF document, converts it to JPEG format (handling color conversions), saves it, and loads it as a PIL Image Object.
     """
@@ -353,6 +562,8 @@ def get_image_for_gemini(
     os.makedirs(image_save_dir, exist_ok=True)
     pix.save(image_name)
 
+    from vertexai.generative_models import Image
+
     image_for_gemini = Image.load_from_file(image_name)
     return image_for_gemini, image_name
 
@@ -361,15 +572,8 @@ def get_model_response(
     generative_multimodal_model,
     model_input: List[str],
     stream: bool = True,
-    generation_config: Optional[GenerationConfig] = GenerationConfig(
-        temperature=0.2, max_output_tokens=2048
-    ),
-    safety_settings: Optional[dict] = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    },
+    generation_config: Optional["GenerationConfig"] = None,
+    safety_settings: Optional[dict] = None,
     print_exception: bool = False,
 ) -> str:
     """
@@ -378,32 +582,54 @@ def get_model_response(
     Args:
         model_input: A list of strings representing the inputs to the model.
         stream: Whether to generate the response in a streaming fashion (returning chunks of text at a time) or all at once. Defaults to False.
+        generation_config: Generation configuration. Defaults to `get_generation_config()`.
+        safety_settings: Safety settings. Defaults to `get_default_safety_settings()`.
 
     Returns:
         The generated text as a string.
     """
-    response = generative_multimodal_model.invoke(
-        model_input,
-        generation_config=generation_config,
-        stream=stream,
-        safety_settings=safety_settings,
-    )
-    response_list = []
-
-    for chunk in response:
-        print(chunk)
-        try:
-            response_list.append(chunk.text)
-        except Exception as e:
-            if print_exception:
-              print(
-                  "Exception occurred while calling gemini. Something is blocked. Lower the safety thresholds [safety_settings: BLOCK_NONE ] if not already done. -----",
-                  e,
-              )
-            else:
-              print("Exception occurred while calling g")
-            response_list.append("**Something blocked.**")
-            continue
+    if generation_config is None:
+        generation_config = get_generation_config()
+    if safety_settings is None:
+        safety_settings = get_default_safety_settings()
+
+    def generate() -> Tuple[List[str], Any]:
+        # Reads the whole stream, so quota errors raised mid-stream are retried with the call
+        response_list = []
+        usage_metadata = None
+        response = generative_multimodal_model.invoke(
+            model_input,
+            generation_config=generation_config,
+            stream=stream,
+            safety_settings=safety_settings,
+        )
+        for chunk in response:
+            print(chunk)
+            # The last chunk carries the token counts of the whole response
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+            try:
+                response_list.append(chunk.text)
+            except Exception as e:
+                if print_exception:
+                  print(
+                      "Exception occurred while calling gemini. Something is blocked. Lower the safety thresholds [safety_settings: BLOCK_NONE ] if not already done. -----",
+                      e,
+                  )
+                else:
+                  print("Exception occurred while calling g")
+                response_list.append("**Something blocked.**")
+                continue
+        return response_list, usage_metadata
+
+    input_tokens = sum(estimate_token_count(part) for part in model_input if isinstance(part, str))
+    response_list, usage_metadata = vertex_rate_limiter.call(generate, tokens=input_tokens)
+
+    # Charge the tokens actually used: the reported total, or the estimated output tokens
+    total_tokens = getattr(usage_metadata, "total_token_count", 0)
+    if total_tokens:
+        vertex_rate_limiter.record_usage(total_tokens - input_tokens)
+    else:
+        vertex_rate_limiter.record_usage(sum(estimate_token_count(text) for text in response_list))
     response = "".join(response_list)
 
     return response
@@ -426,26 +652,9 @@ def get_text_metadata_df(
         A Pandas DataFrame with the extracted text, chunk text, and chunk embeddings for each page.
     """
 
-    final_data_text: List[Dict] = []
-
-    for key, values in text_metadata.items():
-        for chunk_number, chunk_text in values["chunked_text_dict"].items():
-            data: Dict = {}
-            data["file_name"] = filename
-            data["page_num"] = int(key) + 1
-            data["text"] = values["text"]
-            data["text_embedding_page"] = values["page_text_embeddings"][
-                "text_embedding"
-            ]
-            data["chunk_number"] = chunk_number
-            data["chunk_text"] = chunk_text
-            data["text_embedding_chunk"] = values["chunk_embeddings_dict"][chunk_number]
-
-            final_data_text.append(data)
-
-    return_df = pd.DataFrame(final_data_text)
-    return_df = return_df.reset_index(drop=True)
-    return return_df
+    text_metadata_buffer = TextMetadataBuffer()
+    text_metadata_buffer.add_text_metadata(filename, text_metadata)
+    return text_metadata_buffer.to_df()
 
 
 def get_image_metadata_df(
@@ -490,89 +699,401 @@ def get_image_metadata_df(
     return return_df
 
 
+class IngestionProgress:
+    """
+    Tracks ingestion counters and turns them into progress events for a callback.
+
+    Every event is a dictionary with the event name, the current file and page, pages
+    parsed, chunks embedded, bytes processed, throughput and an ETA extrapolated from
+    the bytes processed so far. Pages of several files may be reported interleaved.
+    """
+
+    def __init__(
+        self,
+        pdf_paths: List[str],
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.progress_callback = progress_callback
+        self.total_files = len(pdf_paths)
+        self.total_bytes = sum(os.path.getsize(pdf_path) for pdf_path in pdf_paths)
+        self.files_processed = 0
+        self.pages_parsed = 0
+        self.chunks_embedded = 0
+        self.bytes_processed = 0
+        self.current_file = ""
+        self.current_page = 0
+        self.current_num_pages = 0
+        # pdf_path -> [file size, number of pages, bytes reported so far]
+        self._files: Dict[str, List[int]] = {}
+        self._start_time = time.time()
+
+    def emit(self, event: str, **extra_fields: Any) -> Dict[str, Any]:
+        elapsed = time.time() - self._start_time
+        bytes_per_second = self.bytes_processed / elapsed if elapsed > 0 else 0.0
+        remaining_bytes = self.total_bytes - self.bytes_processed
+
+        progress_event = {
+            "event": event,
+            "current_file": self.current_file,
+            "current_page": self.current_page,
+            "num_pages": self.current_num_pages,
+            "files_processed": self.files_processed,
+            "total_files": self.total_files,
+            "pages_parsed": self.pages_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "bytes_processed": self.bytes_processed,
+            "total_bytes": self.total_bytes,
+            "progress": round(100 * self.bytes_processed / self.total_bytes, 1)
+            if self.total_bytes
+            else 100.0,
+            "elapsed": round(elapsed, 2),
+            "bytes_per_second": round(bytes_per_second, 1),
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2)
+            if elapsed > 0
+            else 0.0,
+            "eta": round(remaining_bytes / bytes_per_second, 1)
+            if bytes_per_second > 0
+            else None,
+            **extra_fields,
+        }
+
+        if self.progress_callback is not None:
+            self.progress_callback(progress_event)
+        return progress_event
+
+    def _set_current(self, pdf_path: str, page: int) -> None:
+        self.current_file = pdf_path.split("/")[-1]
+        self.current_page = page
+        self.current_num_pages = self._files[pdf_path][1]
+
+    def start_file(self, pdf_path: str, num_pages: int) -> None:
+        self._files[pdf_path] = [os.path.getsize(pdf_path), num_pages, 0]
+        self._set_current(pdf_path, 0)
+        self.emit("file_started")
+
+    def page_done(self, pdf_path: str, page_num: int, num_chunks: int) -> None:
+        file_bytes, num_pages, _ = self._files[pdf_path]
+        self._set_current(pdf_path, page_num + 1)
+        self.pages_parsed += 1
+        self.chunks_embedded += num_chunks
+        # Attribute the file size evenly over its pages
+        page_bytes = file_bytes // max(num_pages, 1)
+        self._files[pdf_path][2] += page_bytes
+        self.bytes_processed += page_bytes
+        self.emit("page_processed")
+
+    def file_done(self, pdf_path: str) -> None:
+        file_bytes, _, reported_bytes = self._files.pop(pdf_path)
+        self.files_processed += 1
+        self.bytes_processed += file_bytes - reported_bytes
+        self.emit("file_processed")
+
+    def skip_file(self, pdf_path: str) -> None:
+        self.total_files -= 1
+        self.total_bytes -= os.path.getsize(pdf_path)
+
+
 def get_document_metadata(
     generative_multimodal_model,
     pdf_folder_path: str,
     image_save_dir: str,
     image_description_prompt: str,
     embedding_size: int = 128,
-    generation_config: Optional[GenerationConfig] = GenerationConfig(
-        temperature=0.2, max_output_tokens=2048
-    ),
-    safety_settings: Optional[dict] = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    },
-    add_sleep_after_page: bool = False,
-    sleep_time_after_page: int = 2,
-    add_sleep_after_document: bool = False,
-    sleep_time_after_document: int = 2,
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    generation_config: Optional["GenerationConfig"] = None,
+    safety_settings: Optional[dict] = None,
+    vector_store=None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    chunker: Optional[TextChunker] = None,
+    extraction_workers: Optional[int] = None,
+    pages_per_task: int = 8,
+    embedding_workers: int = 4,
+    queue_size: int = 16,
+    manifest: Optional[IngestionManifest] = None,
+    delete_missing: bool = False,
+) -> Optional[pd.DataFrame]:
     """
     This function takes a PDF path, an image save directory, an image description prompt, an embedding size, and a text embedding text limit as input.
 
+    Batches of pages stream through a parse -> chunk -> embed -> write pipeline (see
+    `ingestion_pipeline.Pipeline`), so PDF parsing, embedding calls and store writes overlap.
+
     Args:
         pdf_path: The path to the PDF document.
         image_save_dir: The directory where extracted images should be saved.
         image_description_prompt: A prompt to guide Gemini for generating image descriptions.
         embedding_size: The dimensionality of the embedding vectors.
         text_emb_text_limit: The maximum number of tokens for text embedding.
+        vector_store: Optional `VectorStore` the text metadata of each processed file is appended to. Files already in the store are skipped.
+        progress_callback: Optional function called with a progress event dictionary (see `IngestionProgress`) when ingestion starts, after every page and file, and when it finishes (with the stage statistics of `ingestion_pipeline.Pipeline.run` as pipeline_stats).
+        chunker: Splits text into chunks (see `chunking`). Defaults to the CHUNKER chunker: sentences and paragraphs packed into CHUNK_MAX_TOKENS tokens with CHUNK_OVERLAP_TOKENS tokens of overlap.
+                 The pages of a file are chunked as one text (see `chunking.DocumentChunker`), so chunks can span page breaks; a chunk is recorded under the page it starts on, with the page it ends on as end_page_num.
+        extraction_workers: Number of processes extracting page text in parallel. Defaults to the number of CPUs; 1 extracts in the calling process.
+        pages_per_task: Number of pages extracted, chunked and embedded together.
+        embedding_workers: Number of embedding calls in flight at the same time.
+        queue_size: Maximum number of page batches waiting in front of each pipeline stage.
+        manifest: Optional `IngestionManifest` for incremental ingestion into `vector_store`. Unchanged files are
+                  skipped (by size and modification time, then content hash). As chunks run across pages, a file
+                  whose page text changed is re-chunked as a whole and its previous rows are tombstoned; chunks
+                  whose text did not change are served by the embedding cache instead of the model.
+                  Without a manifest, files already in the store are skipped.
+        delete_missing: With a manifest, tombstone the rows of files in the manifest that are no longer in `pdf_folder_path`.
 
     Returns:
-        A tuple containing two DataFrames:
-            * One DataFrame containing the extracted text metadata for each page of the PDF, including the page text, chunked text dictionaries, and chunk embedding dictionaries.
-            * Another DataFrame containing the extracted image metadata for each image in the PDF, including the image path, image description, image embeddings (with and without context), and image description text embedding.
+        Without a `vector_store`, a DataFrame containing the extracted text metadata for each chunk, in file order, including the page text, chunk text and embeddings.
+        None with a `vector_store`: every file is appended to the store as soon as it is written, and no DataFrame of the whole corpus is built.
     """
 
     text_metadata_df_final, image_metadata_df_final = pd.DataFrame(), pd.DataFrame()
 
-    for pdf_path in glob.glob(pdf_folder_path + "/*.pdf"):
-        print(
-            "\n\n",
-            "Processing the file: ---------------------------------",
-            pdf_path,
-            "\n\n",
-        )
+    pdf_paths = sorted(glob.glob(pdf_folder_path + "/*.pdf"))
+    progress = IngestionProgress(pdf_paths, progress_callback)
+    progress.emit("started")
 
-        doc, num_pages = get_pdf_doc_object(pdf_path)
+    incremental = manifest is not None and vector_store is not None
+    chunker = chunker or get_default_chunker()
+    # Files chunked page by page, or with other parameters, are re-ingested
+    chunking = dict(
+        chunker.params, across_pages=True, embedding_model=getattr(vector_store, "embedding_model", None)
+    )
 
+    if incremental and delete_missing:
+        folder_file_names = {pdf_path.split("/")[-1] for pdf_path in pdf_paths}
+        for file_name in manifest.file_names():
+            if file_name not in folder_file_names:
+                print("Removing deleted file: ", file_name)
+                with manifest.lock:
+                    vector_store.delete(vector_store.get_rows(file_name))
+                    manifest.remove_file(file_name)
+
+    # Split every file into page ranges that flow through the pipeline as one batch each
+    files_to_process: List[str] = []
+    file_records: Dict[str, Dict[str, Any]] = {}
+    page_batches: List[Dict[str, Any]] = []
+    for pdf_path in pdf_paths:
         file_name = pdf_path.split("/")[-1]
 
-        text_metadata: Dict[Union[int, str], Dict] = {}
-
-        for page_num in range(num_pages):
-            print(f"Processing page: {page_num + 1}")
+        if incremental:
+            stat = os.stat(pdf_path)
+            record = manifest.get_file(file_name)
+            if record is not None and record["chunking"] != chunking:
+                record = None  # Ingested with other chunking parameters: redo every page
+
+            if record is not None and (record["size"], record["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                print("Skipping unchanged file: ", pdf_path)
+                progress.skip_file(pdf_path)
+                continue
+
+            file_hash = get_file_hash(pdf_path)
+            if record is not None and record["file_hash"] == file_hash:
+                print("Skipping unchanged file: ", pdf_path)
+                manifest.update_file_stat(file_name, stat.st_size, stat.st_mtime_ns)
+                progress.skip_file(pdf_path)
+                continue
+
+            file_records[file_name] = {
+                "file_hash": file_hash,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                # If every page text hash matches, the file's rows are kept
+                "previous_page_hashes": manifest.get_page_hashes(file_name) if record is not None else {},
+            }
+        elif vector_store is not None and file_name in vector_store.file_names:
+            print("Skipping already indexed file: ", pdf_path)
+            progress.skip_file(pdf_path)
+            continue
 
-            page = doc[page_num]
+        doc, num_pages = get_pdf_doc_object(pdf_path)
+        doc.close()
+
+        files_to_process.append(file_name)
+        # An empty document still gets one (empty) batch, so it is written like the others
+        for start_page in range(0, max(num_pages, 1), pages_per_task):
+            page_batches.append(
+                {
+                    "pdf_path": pdf_path,
+                    "file_name": file_name,
+                    "num_pages": num_pages,
+                    "start_page": start_page,
+                    "end_page": min(start_page + pages_per_task, num_pages),
+                }
+            )
+
+    if extraction_workers is not None and extraction_workers <= 1:
+        extraction_executor = None
+        parse_workers = 1
+    else:
+        extraction_executor = get_extraction_executor(extraction_workers)
+        # One parse thread per worker process keeps every process busy
+        parse_workers = extraction_workers or os.cpu_count()
+
+    def parse(page_batch: Dict[str, Any]) -> Dict[str, Any]:
+        task = (page_batch["pdf_path"], page_batch["start_page"], page_batch["end_page"])
+        if extraction_executor is None:
+            page_batch["pages"] = extract_pdf_page_text(*task)
+        else:
+            page_batch["pages"] = extraction_executor.submit(
+                _extract_pdf_page_text_task, task
+            ).result()
+        return page_batch
+
+    # Written by the single "chunk" worker only: per file being chunked, its document chunker,
+    # the first page it has not been given yet and the batches parsed ahead of that page
+    document_chunkers: Dict[str, DocumentChunker] = {}
+    next_page_nums: Dict[str, int] = {}
+    parsed_batches: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+    def chunk(page_batch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        file_name = page_batch["file_name"]
+        if file_name not in document_chunkers:
+            document_chunkers[file_name] = DocumentChunker(chunker)
+            next_page_nums[file_name] = 0
+            parsed_batches[file_name] = {}
+
+        # Pages go through the document chunker in order: batches parsed ahead of an earlier
+        # one wait for it, then move on together with it
+        parsed_batches[file_name][page_batch["start_page"]] = page_batch
+        ready_batches = []
+        while next_page_nums[file_name] in parsed_batches[file_name]:
+            ready_batches.append(parsed_batches[file_name].pop(next_page_nums[file_name]))
+            next_page_nums[file_name] = ready_batches[-1]["end_page"]
+        if not ready_batches:
+            return None
+
+        page_batch = dict(
+            ready_batches[0],
+            end_page=ready_batches[-1]["end_page"],
+            pages=[page_record for ready_batch in ready_batches for page_record in ready_batch["pages"]],
+            chunks=[],
+        )
+        document_chunker = document_chunkers[file_name]
+        for page_record in page_batch["pages"]:
+            page_batch["chunks"].extend(document_chunker.add_page(page_record["page_num"], page_record["text"]))
+        if page_batch["end_page"] >= page_batch["num_pages"]:
+            page_batch["chunks"].extend(document_chunker.finish())
+            del document_chunkers[file_name], next_page_nums[file_name], parsed_batches[file_name]
+
+        if incremental:
+            page_batch["page_hashes"] = {
+                page_record["page_num"]: get_page_hash(page_record["text"]) for page_record in page_batch["pages"]
+            }
+        return page_batch
 
-            text = page.get_text()
-            (
-                text,
-                page_text_embeddings_dict,
-                chunked_text_dict,
-                chunk_embeddings_dict,
-            ) = get_chunk_text_metadata(page, embedding_size=embedding_size)
+    def embed(page_batch: Dict[str, Any]) -> Dict[str, Any]:
+        page_batch["chunk_embeddings"] = get_page_records_text_embeddings(
+            page_batch["pages"], [document_chunk.text for document_chunk in page_batch["chunks"]]
+        )
+        return page_batch
+
+    # Written by the single "write" worker only
+    file_text_metadata: Dict[str, Dict[Union[int, str], Dict]] = {}
+    file_chunks: Dict[str, List[Tuple[DocumentChunk, List[float]]]] = {}
+    file_page_hashes: Dict[str, Dict[int, str]] = {}
+    # Only used without a vector store, to build the returned DataFrame
+    text_metadata_buffer = TextMetadataBuffer()
+
+    def write(page_batch: Dict[str, Any]) -> None:
+        pdf_path, file_name = page_batch["pdf_path"], page_batch["file_name"]
+
+        if file_name not in file_text_metadata:
+            print(
+                "\n\n",
+                "Processing the file: ---------------------------------",
+                pdf_path,
+                "\n\n",
+            )
+            progress.start_file(pdf_path, page_batch["num_pages"])
+            file_text_metadata[file_name] = {}
+            file_chunks[file_name] = []
+            file_page_hashes[file_name] = {}
+
+        text_metadata = file_text_metadata[file_name]
+        file_page_hashes[file_name].update(page_batch.get("page_hashes", {}))
+        file_chunks[file_name].extend(zip(page_batch["chunks"], page_batch["chunk_embeddings"]))
+        for position, page_record in enumerate(page_batch["pages"]):
+            page_num = page_record["page_num"]
+            print(f"Processing page: {page_num + 1}")
 
             text_metadata[page_num] = {
-                "text": text,
-                "page_text_embeddings": page_text_embeddings_dict,
-                "chunked_text_dict": chunked_text_dict,
-                "chunk_embeddings_dict": chunk_embeddings_dict,
+                "text": page_record["text"],
+                "page_text_embeddings": page_record["page_text_embeddings"],
+                "chunked_text_dict": {},
+                "chunk_embeddings_dict": {},
+                "chunk_offsets": {},
+                "chunk_end_pages": {},
             }
+            # The chunks completed by a batch are counted with its last page
+            last_page = position == len(page_batch["pages"]) - 1
+            progress.page_done(pdf_path, page_num, len(page_batch["chunks"]) if last_page else 0)
+
+        # Batches of a file can arrive out of order; write the file once all pages are in
+        if len(text_metadata) < page_batch["num_pages"]:
+            return
+
+        text_metadata = dict(sorted(file_text_metadata.pop(file_name).items()))
+        chunks = sorted(file_chunks.pop(file_name), key=lambda item: (item[0].page_num, item[0].chunk_number))
+        for document_chunk, chunk_embedding in chunks:
+            # Chunks are recorded under the page they start on
+            page_text_metadata = text_metadata[document_chunk.page_num]
+            chunk_number = document_chunk.chunk_number
+            page_text_metadata["chunked_text_dict"][chunk_number] = document_chunk.text
+            page_text_metadata["chunk_embeddings_dict"][chunk_number] = chunk_embedding
+            page_text_metadata["chunk_offsets"][chunk_number] = (document_chunk.start, document_chunk.end)
+            if document_chunk.end_page_num != document_chunk.page_num:
+                page_text_metadata["chunk_end_pages"][chunk_number] = document_chunk.end_page_num
+        page_hashes = file_page_hashes.pop(file_name)
+
+        if incremental:
+            file_record = file_records[file_name]
+            with manifest.lock:
+                # Chunks run across pages, so a file whose page text changed has all of its rows
+                # replaced; if none did (e.g. only the PDF metadata changed), its rows stay
+                if page_hashes != file_record["previous_page_hashes"]:
+                    file_buffer = TextMetadataBuffer()
+                    file_buffer.add_text_metadata(file_name, text_metadata)
+                    vector_store.append(file_buffer.chunks_df(), deleted_rows=vector_store.get_rows(file_name))
+                manifest.record_file(
+                    file_name,
+                    file_record["file_hash"],
+                    file_record["size"],
+                    file_record["mtime_ns"],
+                    chunking,
+                    page_hashes,
+                )
+        elif vector_store is not None:
+            # Each file goes straight to the store; nothing is kept for a final DataFrame
+            file_buffer = TextMetadataBuffer()
+            file_buffer.add_text_metadata(file_name, text_metadata)
+            vector_store.append(file_buffer.chunks_df())
+        else:
+            text_metadata_buffer.add_text_metadata(file_name, text_metadata)
+
+        progress.file_done(pdf_path)
+
+    pipeline = Pipeline(
+        [
+            PipelineStage("parse", parse, workers=parse_workers),
+            PipelineStage("chunk", chunk),
+            PipelineStage("embed", embed, workers=embedding_workers),
+            PipelineStage("write", write),
+        ],
+        queue_size=queue_size,
+    )
+    pipeline_stats = pipeline.run(page_batches)
+    logging.debug(f"Ingestion pipeline stats: {pipeline_stats}")
 
-           
-        text_metadata_df = get_text_metadata_df(file_name, text_metadata)
-        
+    if vector_store is not None:
+        text_metadata_df_final = None
+    else:
+        # Materialize all rows once, in file order (files can finish out of order)
+        text_metadata_df_final = text_metadata_buffer.to_df()
+        if not text_metadata_df_final.empty:
+            file_order = {file_name: i for i, file_name in enumerate(files_to_process)}
+            row_order = np.argsort(
+                text_metadata_df_final["file_name"].map(file_order).to_numpy(), kind="stable"
+            )
+            text_metadata_df_final = text_metadata_df_final.iloc[row_order].reset_index(drop=True)
 
-        text_metadata_df_final = pd.concat(
-            [text_metadata_df_final, text_metadata_df], axis=0
-        )
-        
-        text_metadata_df_final = text_metadata_df_final.reset_index(drop=True)
-        
-        text_metadata_df_final.to_csv("text_metadata_df_final.csv", index=False)
+    progress.emit("finished", pipeline_stats=pipeline_stats)
 
     return text_metadata_df_final
 
@@ -633,6 +1154,102 @@ def get_cosine_score(
     return text_cosine_score
 
 
+def get_embedding_matrix(dataframe: pd.DataFrame, column_name: str) -> np.ndarray:
+    """
+    Stacks the embeddings stored in a dataframe column into one contiguous float32 matrix.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+
+    Returns:
+        A 2D NumPy array with one row per dataframe row.
+    """
+
+    if dataframe.empty:
+        return np.empty((0, 0), dtype=np.float32)
+
+    return np.ascontiguousarray(
+        np.vstack(dataframe[column_name].to_numpy()), dtype=np.float32
+    )
+
+
+def build_embedding_index(
+    dataframe: pd.DataFrame, column_name: str, kind: str = "ivf_flat", **params
+) -> EmbeddingIndex:
+    """
+    Builds a nearest-neighbour index over an embedding column, e.g. text_embedding_chunk,
+    mm_embedding_from_img_only or text_embedding_from_image_description.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+        kind: "ivf_flat" (approximate) or "exact" (see `ann_index.create_embedding_index`).
+        **params: Index parameters, e.g. nlist and nprobe for "ivf_flat".
+
+    Returns:
+        The index; row ids are the positional row numbers of `dataframe`.
+    """
+
+    return create_embedding_index(
+        kind, embeddings=get_embedding_matrix(dataframe, column_name), **params
+    )
+
+
+def build_lexical_index(dataframe: pd.DataFrame, column_name: str = "chunk_text") -> BM25Index:
+    """
+    Builds a BM25 inverted index over a text column, row-aligned with the DataFrame.
+
+    Args:
+        dataframe: The DataFrame containing the texts.
+        column_name: The column containing the texts.
+
+    Returns:
+        The index, searched with `get_similar_text_from_query(..., lexical_index=...)`.
+    """
+    index = BM25Index()
+    index.add(dataframe[column_name])
+    return index
+
+
+def get_cosine_scores(
+    embedding_matrix: np.ndarray, input_embd: Union[list, np.ndarray]
+) -> np.ndarray:
+    """
+    Scores every row of an embedding matrix against a query embedding with a single matrix product.
+
+    Args:
+        embedding_matrix: A 2D NumPy array with one embedding per row.
+        input_embd: The query embedding.
+
+    Returns:
+        A 1D NumPy array of cosine similarity scores (embeddings are unit-normalized).
+    """
+
+    return embedding_matrix @ np.asarray(input_embd, dtype=embedding_matrix.dtype)
+
+
+def get_top_n_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Returns the indices of the `top_n` highest scores, sorted by descending score.
+
+    Args:
+        scores: A 1D NumPy array of scores.
+        top_n: The number of indices to return.
+
+    Returns:
+        A 1D NumPy array of indices into `scores`.
+    """
+
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Partial selection is O(n); only the selected candidates get sorted
+    candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
 def print_text_to_image_citation(
     final_images: Dict[int, Dict[str, Any]], print_top: bool = True
 ) -> None:
@@ -720,8 +1337,11 @@ def print_text_to_text_citation(
         # Print the file_name
         print(color.BLUE + "file_name: " + color.END, text_dict["file_name"])
 
-        # Print the page number
-        print(color.BLUE + "page_number: " + color.END, text_dict["page_num"])
+        # Print the page number, or the page span of a chunk running across pages
+        page_span = text_dict["page_num"]
+        if text_dict.get("end_page_num", page_span) != page_span:
+            page_span = f"{text_dict['page_num']}-{text_dict['end_page_num']}"
+        print(color.BLUE + "page_number: " + color.END, page_span)
 
         # Print the matched text based on the chunk_text argument
         if chunk_text:
@@ -746,6 +1366,7 @@ def get_similar_image_from_query(
     image_emb: bool = True,
     top_n: int = 3,
     embedding_size: int = 128,
+    embedding_index: Optional[Union[EmbeddingIndex, QuantizedEmbeddings]] = None,
 ) -> Dict[int, Dict[str, Any]]:
     """
     Finds the top N most similar images from a metadata DataFrame based on a text query or an image query.
@@ -759,6 +1380,7 @@ def get_similar_image_from_query(
         image_emb: Whether to use image embeddings (True) or text captions (False) for comparisons.
         top_n: The number of most similar images to return.
         embedding_size: The dimensionality of the image embeddings (only used if image_emb is True).
+        embedding_index: Optional index of the `column_name` embeddings (see `build_embedding_index`, or a float16 / int8 `QuantizedEmbeddings`), searched instead of scoring every row.
 
     Returns:
         A dictionary containing information about the top N most similar images, including cosine scores, image objects, paths, page numbers, text excerpts, and descriptions.
@@ -766,27 +1388,34 @@ def get_similar_image_from_query(
     # Check if image embedding is used
     if image_emb:
         # Calculate cosine similarity between query image and metadata images
-        user_query_image_embedding = get_user_query_image_embeddings(
+        query_embedding = get_user_query_image_embeddings(
             image_query_path, embedding_size
         )
-        cosine_scores = image_metadata_df.apply(
-            lambda x: get_cosine_score(x, column_name, user_query_image_embedding),
-            axis=1,
-        )
     else:
         # Calculate cosine similarity between query text and metadata image captions
-        user_query_text_embedding = get_user_query_text_embeddings(query)
-        cosine_scores = image_metadata_df.apply(
-            lambda x: get_cosine_score(x, column_name, user_query_text_embedding),
-            axis=1,
+        query_embedding = get_user_query_text_embeddings(query)
+
+    if embedding_index is not None:
+        # One extra candidate makes up for an exact match of the query image
+        candidate_indices, cosine_scores = embedding_index.search(query_embedding, top_n + 1)
+    else:
+        cosine_scores = get_cosine_scores(
+            get_embedding_matrix(image_metadata_df, column_name), query_embedding
         )
+        candidate_indices = np.arange(len(cosine_scores))
 
     # Remove same image comparison score when user image is matched exactly with metadata image
-    cosine_scores = cosine_scores[cosine_scores < 1.0]
+    keep = np.round(cosine_scores, 2) < 1.0
+    candidate_indices, cosine_scores = candidate_indices[keep], cosine_scores[keep]
 
     # Get top N cosine scores and their indices
-    top_n_cosine_scores = cosine_scores.nlargest(top_n).index.tolist()
-    top_n_cosine_values = cosine_scores.nlargest(top_n).values.tolist()
+    top_n_positions = get_top_n_indices(cosine_scores, top_n)
+    top_n_cosine_scores = candidate_indices[top_n_positions].tolist()
+    top_n_cosine_values = [
+        round(float(cosine_scores[position]), 2) for position in top_n_positions
+    ]
+
+    from vertexai.generative_models import Image
 
     # Create a dictionary to store matched images and their information
     final_images: Dict[int, Dict[str, Any]] = {}
@@ -843,95 +1472,259 @@ def get_similar_image_from_query(
     return final_images
 
 
+def get_text_matches(
+    text_metadata_df: Union[pd.DataFrame, VectorStoreSnapshot],
+    top_n_indices: np.ndarray,
+    top_n_scores: np.ndarray,
+    chunk_text: bool = True,
+    fused_scores: Optional[np.ndarray] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Collects the metadata of matched text rows.
+
+    Args:
+        text_metadata_df: A Pandas DataFrame containing the text metadata, or a `VectorStoreSnapshot`
+                          read only for the matched rows.
+        top_n_indices: Positional row numbers of the matches, best first.
+        top_n_scores: The cosine scores of the matches, NaN where unknown (rows only matched lexically).
+        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
+        fused_scores: Optional reciprocal-rank fusion scores of the matches (see `fuse_text_matches`).
+
+    Returns:
+        A dictionary keyed by match rank with the file name, page number, end page number (if
+        the metadata has it), cosine score (None where unknown), fused score (if given) and
+        chunk number and chunk text, or page text.
+    """
+
+    # Read only the matched rows, a snapshot loads their text from the store on demand
+    if isinstance(text_metadata_df, VectorStoreSnapshot):
+        matched_df = text_metadata_df.get_chunks(top_n_indices)
+    else:
+        matched_df = text_metadata_df.iloc[np.asarray(top_n_indices, dtype=np.int64)]
+
+    # Create a dictionary to store matched text and their information
+    final_text: Dict[int, Dict[str, Any]] = {}
+
+    for matched_textno, score in enumerate(top_n_scores):
+        # Create a sub-dictionary for each matched text
+        final_text[matched_textno] = {}
+
+        # Store file name
+        final_text[matched_textno]["file_name"] = matched_df["file_name"].iat[matched_textno]
+
+        # Store page number, and the last page of chunks running across a page break
+        final_text[matched_textno]["page_num"] = matched_df["page_num"].iat[matched_textno]
+        if "end_page_num" in matched_df:
+            final_text[matched_textno]["end_page_num"] = matched_df["end_page_num"].iat[matched_textno]
+
+        # Store cosine score
+        final_text[matched_textno]["cosine_score"] = None if np.isnan(score) else round(float(score), 2)
+
+        if fused_scores is not None:
+            final_text[matched_textno]["fused_score"] = round(float(fused_scores[matched_textno]), 4)
+
+        if chunk_text:
+            # Store chunk number
+            final_text[matched_textno]["chunk_number"] = matched_df[
+                "chunk_number"
+            ].iat[matched_textno]
+
+            # Store chunk text
+            final_text[matched_textno]["chunk_text"] = matched_df[
+                "chunk_text"
+            ].iat[matched_textno]
+        else:
+            # Store page text
+            final_text[matched_textno]["text"] = matched_df["text"].iat[matched_textno]
+
+    return final_text
+
+
+def fuse_text_matches(
+    query: str,
+    dense_indices: np.ndarray,
+    dense_scores: np.ndarray,
+    lexical_index: BM25Index,
+    top_n: int,
+    fusion_candidates: int = 50,
+    rrf_k: int = 60,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fuses a dense ranking with the BM25 ranking of the same query by reciprocal rank
+    (see `lexical_index.reciprocal_rank_fusion`), so exact terms such as part numbers and
+    identifiers that embeddings miss still rank high.
+
+    Args:
+        query: The text query.
+        dense_indices: Row numbers of the dense matches, best first.
+        dense_scores: The cosine scores of the dense matches.
+        lexical_index: BM25 index over the same rows.
+        top_n: The number of rows to return.
+        fusion_candidates: Rows taken from each ranking before fusing.
+        rrf_k: The reciprocal-rank fusion constant.
+
+    Returns:
+        A tuple of the fused row numbers, their cosine scores (NaN for rows only matched
+        lexically) and their fused scores, sorted by descending fused score.
+    """
+    lexical_indices, _ = lexical_index.search(query, max(top_n, fusion_candidates))
+    top_n_indices, fused_scores = reciprocal_rank_fusion(
+        [dense_indices[:fusion_candidates], lexical_indices], top_n, k=rrf_k
+    )
+
+    dense_score_of = dict(zip(dense_indices.tolist(), dense_scores.tolist()))
+    top_n_scores = np.array(
+        [dense_score_of.get(index, np.nan) for index in top_n_indices.tolist()], dtype=np.float32
+    )
+    return top_n_indices, top_n_scores, fused_scores
+
+
 def get_similar_text_from_query(
     query: str,
-    text_metadata_df: pd.DataFrame,
+    text_metadata_df: Union[pd.DataFrame, VectorStoreSnapshot],
     column_name: str = "",
     top_n: int = 3,
     chunk_text: bool = True,
     print_citation: bool = False,
+    embedding_matrix: Optional[np.ndarray] = None,
+    embedding_index: Optional[Union[EmbeddingIndex, QuantizedEmbeddings]] = None,
+    lexical_index: Optional[BM25Index] = None,
+    fusion_candidates: int = 50,
+    rrf_k: int = 60,
 ) -> Dict[int, Dict[str, Any]]:
     """
     Finds the top N most similar text passages from a metadata DataFrame based on a text query.
 
     Args:
         query: The text query used for finding similar passages.
-        text_metadata_df: A Pandas DataFrame containing the text metadata to search.
+        text_metadata_df: A Pandas DataFrame containing the text metadata to search, or a `VectorStoreSnapshot` searched through `embedding_index`.
         column_name: The column name in the text_metadata_df containing the text embeddings or text itself.
         top_n: The number of most similar text passages to return.
         embedding_size: The dimensionality of the text embeddings (only used if text embeddings are stored in the column specified by `column_name`).
         chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
         print_citation: Whether to immediately print formatted citations for the matched text passages (True) or just return the dictionary (False).
+        embedding_matrix: Optional precomputed float32 matrix of the `column_name` embeddings (see `get_embedding_matrix`). Built on the fly when not given.
+        embedding_index: Optional index of the `column_name` embeddings (see `build_embedding_index`, or a float16 / int8 `QuantizedEmbeddings`), searched instead of scoring every row.
+        lexical_index: Optional BM25 index over the chunk_text of the same rows (see `build_lexical_index`). When given, the dense and BM25 rankings are fused (see `fuse_text_matches`).
+        fusion_candidates: Rows taken from each ranking before fusing.
+        rrf_k: The reciprocal-rank fusion constant.
 
     Returns:
-        A dictionary containing information about the top N most similar text passages, including cosine scores, page numbers, chunk numbers (optional), and chunk text or page text (depending on `chunk_text`).
+        A dictionary containing information about the top N most similar text passages, including cosine scores, fused scores (with `lexical_index`), page numbers, chunk numbers (optional), and chunk text or page text (depending on `chunk_text`).
 
     Raises:
         KeyError: If the specified `column_name` is not present in the `text_metadata_df`.
     """
 
-    if column_name not in text_metadata_df.columns:
-        raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+    if embedding_index is None and embedding_matrix is None:
+        if column_name not in text_metadata_df.columns:
+            raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+        embedding_matrix = get_embedding_matrix(text_metadata_df, column_name)
 
     query_vector = get_user_query_text_embeddings(query)
+    # Fusion re-ranks a wider dense candidate list
+    num_candidates = top_n if lexical_index is None else max(top_n, fusion_candidates)
 
-    # Calculate cosine similarity between query text and metadata text
-    cosine_scores = text_metadata_df.apply(
-        lambda row: get_cosine_score(
-            row,
-            column_name,
-            query_vector,
-        ),
-        axis=1,
-    )
+    if embedding_index is not None:
+        # Get top N indices and their cosine scores from the index
+        top_n_indices, top_n_scores = embedding_index.search(query_vector, num_candidates)
+    else:
+        # Calculate cosine similarity between query text and metadata text
+        cosine_scores = get_cosine_scores(embedding_matrix, query_vector)
 
-    # Get top N cosine scores and their indices
-    top_n_indices = cosine_scores.nlargest(top_n).index.tolist()
-    top_n_scores = cosine_scores.nlargest(top_n).values.tolist()
+        # Get top N cosine scores and their indices
+        top_n_indices = get_top_n_indices(cosine_scores, num_candidates)
+        top_n_scores = cosine_scores[top_n_indices]
 
-    # Create a dictionary to store matched text and their information
-    final_text: Dict[int, Dict[str, Any]] = {}
+    fused_scores = None
+    if lexical_index is not None:
+        top_n_indices, top_n_scores, fused_scores = fuse_text_matches(
+            query, top_n_indices, top_n_scores, lexical_index, top_n, fusion_candidates, rrf_k
+        )
 
-    for matched_textno, index in enumerate(top_n_indices):
-        # Create a sub-dictionary for each matched text
-        final_text[matched_textno] = {}
+    final_text = get_text_matches(text_metadata_df, top_n_indices, top_n_scores, chunk_text, fused_scores)
 
-        # Store page number
-        final_text[matched_textno]["file_name"] = text_metadata_df.iloc[index][
-            "file_name"
-        ]
+    # Optionally print citations immediately
+    if print_citation:
+        print_text_to_text_citation(final_text, chunk_text=chunk_text)
 
-        # Store page number
-        final_text[matched_textno]["page_num"] = text_metadata_df.iloc[index][
-            "page_num"
-        ]
+    return final_text
 
-        # Store cosine score
-        final_text[matched_textno]["cosine_score"] = top_n_scores[matched_textno]
 
-        if chunk_text:
-            # Store chunk number
-            final_text[matched_textno]["chunk_number"] = text_metadata_df.iloc[index][
-                "chunk_number"
-            ]
+def get_similar_texts_from_queries(
+    queries: List[str],
+    text_metadata_df: Union[pd.DataFrame, VectorStoreSnapshot],
+    column_name: str = "",
+    top_n: int = 3,
+    chunk_text: bool = True,
+    embedding_matrix: Optional[np.ndarray] = None,
+    embedding_index: Optional[Union[EmbeddingIndex, QuantizedEmbeddings]] = None,
+    lexical_index: Optional[BM25Index] = None,
+    fusion_candidates: int = 50,
+    rrf_k: int = 60,
+) -> List[Dict[int, Dict[str, Any]]]:
+    """
+    Finds the top N most similar text passages for each of many text queries, e.g. for
+    offline evaluation or bulk question answering over the same corpus.
 
-            # Store chunk text
-            final_text[matched_textno]["chunk_text"] = text_metadata_df["chunk_text"][
-                index
-            ]
-        else:
-            # Store page text
-            final_text[matched_textno]["text"] = text_metadata_df["text"][index]
+    The queries are embedded in batched calls (see `get_text_embeddings_from_text_embedding_model`)
+    and scored against the corpus with matrix-matrix products over blocks of queries,
+    instead of one embedding call and one corpus scan per query.
 
-    # Optionally print citations immediately
-    if print_citation:
-        print_text_to_text_citation(final_text, chunk_text=chunk_text)
+    Args:
+        queries: The text queries.
+        text_metadata_df: A Pandas DataFrame containing the text metadata to search, or a `VectorStoreSnapshot` searched through `embedding_index`.
+        column_name: The column name in the text_metadata_df containing the text embeddings.
+        top_n: The number of most similar text passages to return per query.
+        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
+        embedding_matrix: Optional precomputed float32 matrix of the `column_name` embeddings (see `get_embedding_matrix`). Built on the fly when not given.
+        embedding_index: Optional index of the `column_name` embeddings (see `build_embedding_index`, or a `QuantizedEmbeddings`), searched instead of scoring every row.
+        lexical_index: Optional BM25 index over the chunk_text of the same rows, fused with the dense rankings (see `fuse_text_matches`).
+        fusion_candidates: Rows taken from each ranking before fusing.
+        rrf_k: The reciprocal-rank fusion constant.
 
-    return final_text
+    Returns:
+        One dictionary per query, in the order of `queries`, as returned by `get_similar_text_from_query`.
+
+    Raises:
+        KeyError: If the specified `column_name` is not present in the `text_metadata_df`.
+    """
+
+    if embedding_index is None:
+        if embedding_matrix is None:
+            if column_name not in text_metadata_df.columns:
+                raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+            embedding_matrix = get_embedding_matrix(text_metadata_df, column_name)
+        # float32 storage scores the matrix as is, without copying it
+        embedding_index = QuantizedEmbeddings(embedding_matrix)
+
+    if not queries:
+        return []
+
+    query_vectors = np.vstack(
+        get_text_embeddings_from_text_embedding_model(queries, return_array=True)
+    )
+
+    if lexical_index is None:
+        return [
+            get_text_matches(text_metadata_df, top_n_indices, top_n_scores, chunk_text)
+            for top_n_indices, top_n_scores in embedding_index.search_batch(query_vectors, top_n)
+        ]
+
+    final_texts = []
+    dense_matches = embedding_index.search_batch(query_vectors, max(top_n, fusion_candidates))
+    for query, (dense_indices, dense_scores) in zip(queries, dense_matches):
+        top_n_indices, top_n_scores, fused_scores = fuse_text_matches(
+            query, dense_indices, dense_scores, lexical_index, top_n, fusion_candidates, rrf_k
+        )
+        final_texts.append(
+            get_text_matches(text_metadata_df, top_n_indices, top_n_scores, chunk_text, fused_scores)
+        )
+    return final_texts
 
 
 def display_images(
-    images: Iterable[Union[str, PIL.Image.Image]], resize_ratio: float = 0.5
+    images: Iterable[Union[str, "PIL.Image.Image"]], resize_ratio: float = 0.5
 ) -> None:
     """
     Displays a series of images provided as paths or PIL Image objects.
@@ -944,6 +1737,9 @@ def display_images(
         None (displays images using IPython or Jupyter notebook).
     """
 
+    import PIL.Image
+    from IPython.display import display
+
     # Convert paths to PIL images if necessary
     pil_images = []
     for image in images:
@@ -969,15 +1765,8 @@ def get_answer_from_qa_system(
     top_n_image: int = 5,
     instruction: Optional[str] = None,
     model=None,
-    generation_config: Optional[GenerationConfig] = GenerationConfig(
-        temperature=1, max_output_tokens=8192
-    ),
-    safety_settings: Optional[dict] = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    },
+    generation_config: Optional["GenerationConfig"] = None,
+    safety_settings: Optional[dict] = None,
 ) -> Union[str, None]:
     """Fetches answers from a combined text and image-based QA system.
 
@@ -989,12 +1778,16 @@ def get_answer_from_qa_system(
         top_n_image (int, optional): Number of top images to consider. Defaults to 5.
         instruction (str, optional): Customized instruction for the model. Defaults to a generic one.
         model: Model to use for QA.
-        safety_settings: Safety settings for the model.
-        generation_config: Generation configuration for the model.
+        safety_settings: Safety settings for the model. Defaults to `get_default_safety_settings()`.
+        generation_config: Generation configuration for the model. Defaults to temperature 1
+                           and up to 8192 output tokens.
 
     Returns:
         Union[str, None]: The generated answer or None if an error occurs.
     """
+    if generation_config is None:
+        generation_config = get_generation_config(temperature=1, max_output_tokens=8192)
+
     # Build Gemini content
     if instruction is None:  # Use default instruction if not provided
         instruction = """Task: Answer the following questions in detail, providing clear reasoning and evidence from the images and text in bullet points.
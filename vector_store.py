@@ -0,0 +1,534 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+# On-disk layout of a vector store directory:
+#   index.json        row count, embedding dimension, embedding model, the file name table (file
+#                     ids, append-only), the live row ranges of every file with live rows and the
+#                     tombstoned (deleted) row ranges
+#   embeddings.f32    float32 embedding matrix, one row per chunk
+#   <column>.bin      one fixed-width binary file per metadata column; page_num and
+#                     end_page_num are the first and last page a chunk spans
+#   chunk_text.bin    UTF-8 chunk text, addressed by the text_start/text_end columns
+INDEX_FILE_NAME = "index.json"
+EMBEDDINGS_FILE_NAME = "embeddings.f32"
+CHUNK_TEXT_FILE_NAME = "chunk_text.bin"
+
+METADATA_COLUMNS: Dict[str, np.dtype] = {
+    "file_id": np.dtype(np.int32),
+    "page_num": np.dtype(np.int32),
+    "end_page_num": np.dtype(np.int32),
+    "chunk_number": np.dtype(np.int32),
+    "text_start": np.dtype(np.int64),
+    "text_end": np.dtype(np.int64),
+}
+
+
+class VectorStore:
+    """
+    Persistent, append-only store for chunk embeddings and their metadata.
+
+    Embeddings and metadata columns are kept in flat binary files that are memory-mapped
+    when the store is opened, so opening does not depend on the number of stored chunks.
+    Rows are appended by writing to the end of every file first and then atomically
+    replacing `index.json` with the new row count; bytes past the committed count
+    (e.g. from an interrupted append) are ignored and overwritten by the next append.
+
+    Rows are deleted by tombstoning them in `index.json`, in the same commit as an append
+    so replacing content is atomic. Tombstoned rows stay in the files but are left out of
+    `get_text_metadata_df`, `live_embeddings` and `snapshot`.
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        dimension: Optional[int] = None,
+        embedding_model: Optional[str] = None,
+    ):
+        """
+        Opens the vector store in `store_dir`, creating an empty one if it does not exist.
+
+        Args:
+            store_dir: Directory holding the store files.
+            dimension: Embedding dimension. Inferred from the first append when not given.
+            embedding_model: Identifier of the model producing the embeddings (e.g.
+                             `EmbeddingBackend.model_id`), recorded in the store.
+
+        Raises:
+            ValueError: If `dimension` or `embedding_model` does not match the one of an existing store.
+        """
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+
+        os.makedirs(store_dir, exist_ok=True)
+        index_path = os.path.join(store_dir, INDEX_FILE_NAME)
+
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self._index = json.load(f)
+        else:
+            self._index = {"count": 0, "dimension": dimension, "file_names": [], "file_rows": {}, "deleted": []}
+        self._index.setdefault("deleted", [])
+
+        if dimension is not None and self._index["dimension"] not in (None, dimension):
+            raise ValueError(
+                f"Store dimension {self._index['dimension']} does not match requested dimension {dimension}."
+            )
+        if self._index["dimension"] is None:
+            self._index["dimension"] = dimension
+
+        # Vectors of different models are not comparable, so a store keeps one model
+        stored_model = self._index.get("embedding_model")
+        if embedding_model is not None and stored_model not in (None, embedding_model):
+            raise ValueError(
+                f"Store embedding model {stored_model!r} does not match requested embedding model {embedding_model!r}."
+            )
+        if stored_model is None:
+            self._index["embedding_model"] = embedding_model
+
+        self._add_missing_columns()
+        self._map_files()
+        self._add_missing_file_rows()
+
+    def __len__(self) -> int:
+        return self._index["count"]
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._index["dimension"]
+
+    @property
+    def num_deleted(self) -> int:
+        """Number of tombstoned rows."""
+        return sum(end - start for start, end in self._index["deleted"])
+
+    @property
+    def num_live(self) -> int:
+        """Number of rows that are not tombstoned."""
+        return len(self) - self.num_deleted
+
+    @property
+    def embedding_model(self) -> Optional[str]:
+        return self._index.get("embedding_model")
+
+    @property
+    def file_names(self) -> List[str]:
+        """Names of the files with live rows."""
+        return list(self._index["file_rows"])
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        The (count, dimension) float32 embedding matrix, memory-mapped from disk.
+        Includes tombstoned rows; see `live_embeddings`.
+        """
+        return self._embeddings
+
+    def live_embeddings(self) -> np.ndarray:
+        """
+        The embeddings of the rows that are not tombstoned, row-aligned with `get_text_metadata_df`.
+        The memory-mapped matrix itself when no row is tombstoned, an in-memory copy otherwise.
+        """
+        return self.snapshot().live_embeddings()
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.store_dir, file_name)
+
+    def _memmap(self, file_name: str, dtype: np.dtype, shape: tuple) -> np.ndarray:
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._path(file_name), dtype=dtype, mode="r", shape=shape)
+
+    def _add_missing_columns(self) -> None:
+        # Stores written before the end_page_num column only have chunks within one page
+        end_page_num_path = self._path("end_page_num.bin")
+        if self._index["count"] and not os.path.exists(end_page_num_path):
+            page_nums = self._memmap("page_num.bin", METADATA_COLUMNS["page_num"], (self._index["count"],))
+            self._append_bytes("end_page_num.bin", 0, np.asarray(page_nums).tobytes())
+
+    @staticmethod
+    def _group_rows(rows: np.ndarray, file_ids: np.ndarray) -> Dict[int, np.ndarray]:
+        # Sorted `rows` grouped by their file ids, in ascending file id order
+        order = np.argsort(file_ids, kind="stable")
+        sorted_file_ids = file_ids[order]
+        bounds = np.flatnonzero(np.diff(sorted_file_ids)) + 1
+        return {
+            int(sorted_file_ids[group[0]]): rows[order[group]]
+            for group in np.split(np.arange(len(order)), bounds)
+            if len(group)
+        }
+
+    def _add_missing_file_rows(self) -> None:
+        # Stores written before the file_rows table: derive it from the file_id column once
+        if "file_rows" in self._index:
+            return
+        rows = self._live_rows if self._live_rows is not None else np.arange(self._index["count"])
+        groups = self._group_rows(rows, np.asarray(self._columns["file_id"])[rows])
+        index = dict(
+            self._index,
+            file_rows={
+                self._index["file_names"][file_id]: self._row_ranges(file_rows)
+                for file_id, file_rows in groups.items()
+            },
+        )
+        if index["count"]:
+            self._write_index(index)
+        self._index = index
+
+    def _update_file_rows(
+        self,
+        index: dict,
+        deleted_rows: np.ndarray,
+        first_row: int = 0,
+        file_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        # Updates the live row ranges of `index` for tombstoned `deleted_rows` and for rows
+        # appended from `first_row` with `file_ids`, touching only the files concerned
+        file_rows = dict(index["file_rows"])
+        if len(deleted_rows):
+            for file_id in np.unique(self._columns["file_id"][deleted_rows]).tolist():
+                file_name = index["file_names"][file_id]
+                if file_name not in file_rows:
+                    continue
+                rows = np.setdiff1d(self._expand_ranges(file_rows[file_name]), deleted_rows, assume_unique=True)
+                if len(rows):
+                    file_rows[file_name] = self._row_ranges(rows)
+                else:
+                    del file_rows[file_name]
+
+        if file_ids is not None:
+            rows = np.arange(first_row, first_row + len(file_ids))
+            for file_id, appended_rows in self._group_rows(rows, file_ids).items():
+                file_name = index["file_names"][file_id]
+                file_rows[file_name] = self._row_ranges(
+                    np.concatenate([self._expand_ranges(file_rows.get(file_name, [])), appended_rows])
+                )
+        index["file_rows"] = file_rows
+
+    def _map_files(self) -> None:
+        count = self._index["count"]
+        dimension = self._index["dimension"] or 0
+
+        self._embeddings = self._memmap(
+            EMBEDDINGS_FILE_NAME, np.dtype(np.float32), (count, dimension)
+        )
+        self._columns = {
+            column: self._memmap(f"{column}.bin", dtype, (count,))
+            for column, dtype in METADATA_COLUMNS.items()
+        }
+        text_size = int(self._columns["text_end"][-1]) if count else 0
+        self._chunk_text = self._memmap(CHUNK_TEXT_FILE_NAME, np.dtype(np.uint8), (text_size,))
+
+        # Rows that are not tombstoned, None when every row is live
+        self._live_rows: Optional[np.ndarray] = None
+        if self._index["deleted"]:
+            live = np.ones(count, dtype=bool)
+            for start, end in self._index["deleted"]:
+                live[start:end] = False
+            self._live_rows = np.flatnonzero(live)
+
+    def _append_bytes(self, file_name: str, committed_size: int, data: bytes) -> None:
+        # Drop any uncommitted tail left over from an interrupted append
+        with open(self._path(file_name), "ab") as f:
+            f.truncate(committed_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_index(self, index: dict) -> None:
+        tmp_path = self._path(INDEX_FILE_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(INDEX_FILE_NAME))
+
+    def get_rows(
+        self, file_name: str, page_nums: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        """
+        Finds the live rows of a file.
+
+        Args:
+            file_name: The file name.
+            page_nums: Only return rows of chunks spanning any of these pages (1-based, as in
+                       the page_num and end_page_num columns).
+
+        Returns:
+            The sorted row numbers.
+        """
+        with self._lock:
+            ranges, columns = self._index["file_rows"].get(file_name, []), self._columns
+
+        # Only the file's own rows are read, from its live row ranges
+        rows = self._expand_ranges(ranges)
+        if page_nums is not None:
+            # The first page at or after each chunk's first page must not be past its last page
+            page_nums = np.unique(np.asarray(list(page_nums), dtype=np.int32))
+            if len(page_nums) == 0:
+                return np.empty(0, dtype=np.int64)
+            positions = np.searchsorted(page_nums, columns["page_num"][rows])
+            spanned = page_nums[np.minimum(positions, len(page_nums) - 1)]
+            rows = rows[(positions < len(page_nums)) & (spanned <= columns["end_page_num"][rows])]
+        return rows
+
+    @staticmethod
+    def _expand_ranges(ranges: List[List[int]]) -> np.ndarray:
+        # [start, end) ranges as sorted row numbers
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in ranges])
+
+    @staticmethod
+    def _row_ranges(rows: np.ndarray) -> List[List[int]]:
+        # Sorted row numbers as [start, end) ranges of consecutive rows
+        if len(rows) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        starts = np.concatenate([[0], breaks])
+        ends = np.concatenate([breaks, [len(rows)]])
+        return [[int(rows[a]), int(rows[b - 1]) + 1] for a, b in zip(starts, ends)]
+
+    def delete(self, rows: Iterable[int]) -> None:
+        """
+        Tombstones rows.
+
+        Args:
+            rows: The row numbers, e.g. from `get_rows`.
+        """
+        self.append(pd.DataFrame(), deleted_rows=rows)
+
+    def append(
+        self,
+        text_metadata_df: pd.DataFrame,
+        embedding_column: str = "text_embedding_chunk",
+        deleted_rows: Optional[Iterable[int]] = None,
+    ) -> Tuple[int, int]:
+        """
+        Appends chunk rows and their embeddings to the store, and tombstones `deleted_rows`
+        in the same commit (e.g. the previous rows of re-ingested pages).
+
+        Args:
+            text_metadata_df: A DataFrame as returned by `get_text_metadata_df`, with
+                              file_name, page_num, chunk_number and chunk_text columns, and
+                              optionally end_page_num (page_num when missing).
+            embedding_column: The column containing the chunk embeddings.
+            deleted_rows: Row numbers to tombstone.
+
+        Returns:
+            The [start, end) range of the appended rows.
+
+        Raises:
+            ValueError: If the embedding dimension does not match the store dimension.
+        """
+
+        deleted_rows = np.unique(
+            np.asarray(list(deleted_rows if deleted_rows is not None else []), dtype=np.int64)
+        )
+        deleted_ranges = self._row_ranges(deleted_rows)
+
+        if text_metadata_df.empty:
+            with self._lock:
+                count = self._index["count"]
+                if deleted_ranges:
+                    index = dict(self._index, deleted=self._index["deleted"] + deleted_ranges)
+                    self._update_file_rows(index, deleted_rows)
+                    self._write_index(index)
+                    self._index = index
+                    self._map_files()
+            return count, count
+
+        embeddings = np.ascontiguousarray(
+            np.vstack(text_metadata_df[embedding_column].to_numpy()), dtype=np.float32
+        )
+
+        with self._lock:
+            index = dict(
+                self._index,
+                file_names=list(self._index["file_names"]),
+                deleted=self._index["deleted"] + deleted_ranges,
+            )
+            count = index["count"]
+
+            if index["dimension"] is None:
+                index["dimension"] = embeddings.shape[1]
+            if embeddings.shape[1] != index["dimension"]:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match store dimension {index['dimension']}."
+                )
+
+            # Register new file names and map rows to file ids
+            file_ids = {file_name: i for i, file_name in enumerate(index["file_names"])}
+            for file_name in text_metadata_df["file_name"].unique():
+                if file_name not in file_ids:
+                    file_ids[file_name] = len(index["file_names"])
+                    index["file_names"].append(file_name)
+
+            # Encode chunk text into one blob with start/end byte offsets
+            encoded_texts = [
+                chunk_text.encode("utf-8") for chunk_text in text_metadata_df["chunk_text"]
+            ]
+            text_size = int(self._columns["text_end"][-1]) if count else 0
+            text_end = text_size + np.cumsum(
+                [len(encoded_text) for encoded_text in encoded_texts], dtype=np.int64
+            )
+            text_start = text_end - [len(encoded_text) for encoded_text in encoded_texts]
+
+            columns = {
+                "file_id": text_metadata_df["file_name"].map(file_ids).to_numpy(),
+                "page_num": text_metadata_df["page_num"].to_numpy(),
+                "end_page_num": text_metadata_df.get("end_page_num", text_metadata_df["page_num"]).to_numpy(),
+                "chunk_number": text_metadata_df["chunk_number"].to_numpy(),
+                "text_start": text_start,
+                "text_end": text_end,
+            }
+            self._update_file_rows(index, deleted_rows, count, np.asarray(columns["file_id"], dtype=np.int64))
+
+            self._append_bytes(
+                EMBEDDINGS_FILE_NAME,
+                count * index["dimension"] * embeddings.itemsize,
+                embeddings.tobytes(),
+            )
+            for column, dtype in METADATA_COLUMNS.items():
+                self._append_bytes(
+                    f"{column}.bin",
+                    count * dtype.itemsize,
+                    np.asarray(columns[column], dtype=dtype).tobytes(),
+                )
+            self._append_bytes(CHUNK_TEXT_FILE_NAME, text_size, b"".join(encoded_texts))
+
+            # Commit the new rows and the tombstones
+            index["count"] = count + len(text_metadata_df)
+            self._write_index(index)
+            self._index = index
+            self._map_files()
+
+        return count, count + len(text_metadata_df)
+
+    def snapshot(self) -> "VectorStoreSnapshot":
+        """
+        Takes a view of the live rows of one committed state, so metadata and embeddings stay
+        row-aligned while other threads append. Nothing is read until the view is used.
+
+        Returns:
+            The snapshot.
+        """
+        with self._lock:
+            return VectorStoreSnapshot(
+                list(self._index["file_names"]),
+                self._columns,
+                self._embeddings,
+                self._chunk_text,
+                self._live_rows,
+            )
+
+    def get_text_metadata_df(self) -> pd.DataFrame:
+        """
+        Materializes the stored chunk metadata as a DataFrame, reading every chunk text.
+
+        Returns:
+            A DataFrame with file_name, page_num, end_page_num, chunk_number and chunk_text
+            columns, row-aligned with `live_embeddings` (tombstoned rows are left out).
+        """
+
+        return self.snapshot().to_df()
+
+
+class VectorStoreSnapshot:
+    """
+    The live rows of one committed state of a `VectorStore`, read lazily from its memory maps.
+
+    Rows are addressed by their position among the live rows, the numbering of the search
+    indexes built over them; `rows` maps positions to store row numbers. Chunk text and
+    metadata are only read for the positions asked for, so taking a snapshot does not depend
+    on the number of stored chunks.
+    """
+
+    def __init__(
+        self,
+        file_names: List[str],
+        columns: Dict[str, np.ndarray],
+        embeddings: np.ndarray,
+        chunk_text: np.ndarray,
+        live_rows: Optional[np.ndarray],
+    ):
+        self.file_names = file_names
+        self.embeddings = embeddings  # Every row, tombstoned ones included
+        self.live_rows = live_rows  # Store rows of the live positions, None when every row is live
+        self._columns = columns
+        self._chunk_text = chunk_text
+
+    def __len__(self) -> int:
+        return len(self.live_rows) if self.live_rows is not None else len(self.embeddings)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def rows(self, positions: Union[np.ndarray, Iterable[int]]) -> np.ndarray:
+        """Maps live positions to store row numbers."""
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.live_rows[positions] if self.live_rows is not None else positions
+
+    def live_embeddings(self, start: int = 0) -> np.ndarray:
+        """
+        The embeddings of the live positions from `start` on. A slice of the memory map when
+        no row is tombstoned, an in-memory copy otherwise.
+        """
+        if self.live_rows is None:
+            return self.embeddings[start:]
+        return self.embeddings[self.live_rows[start:]]
+
+    def _chunk_texts(self, rows: np.ndarray) -> List[str]:
+        chunk_text = self._chunk_text
+        return [
+            chunk_text[start:end].tobytes().decode("utf-8")
+            for start, end in zip(
+                self._columns["text_start"][rows].tolist(),
+                self._columns["text_end"][rows].tolist(),
+            )
+        ]
+
+    def iter_chunk_texts(self, start: int = 0, batch_size: int = 4096) -> Iterator[str]:
+        """
+        Yields the chunk texts of the live positions from `start` on, reading `batch_size`
+        rows at a time (e.g. to build a `BM25Index`).
+        """
+        for batch_start in range(start, len(self), batch_size):
+            yield from self._chunk_texts(
+                self.rows(np.arange(batch_start, min(batch_start + batch_size, len(self))))
+            )
+
+    def get_chunks(self, positions: Union[np.ndarray, Iterable[int]]) -> pd.DataFrame:
+        """
+        Reads the metadata and text of some live positions, e.g. the top matches of a search.
+
+        Args:
+            positions: The live positions.
+
+        Returns:
+            A DataFrame with file_name, page_num, end_page_num, chunk_number and chunk_text
+            columns, one row per position in the given order.
+        """
+        rows = self.rows(positions)
+        columns = self._columns
+        return pd.DataFrame(
+            {
+                "file_name": [self.file_names[file_id] for file_id in columns["file_id"][rows].tolist()],
+                "page_num": np.asarray(columns["page_num"][rows]),
+                "end_page_num": np.asarray(columns["end_page_num"][rows]),
+                "chunk_number": np.asarray(columns["chunk_number"][rows]),
+                "chunk_text": self._chunk_texts(rows),
+            }
+        )
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        Reads every live row; see `VectorStore.get_text_metadata_df`.
+        """
+        return self.get_chunks(np.arange(len(self)))